@@ -0,0 +1,286 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import app.logger
+from app.config import batch_workers, stream_audio_encode, watch_stable_seconds, watch_poll_interval, \
+    job_server_host, job_server_port, job_server_url, job_database_path, job_heartbeat_timeout, job_poll_interval, \
+    job_heartbeat_interval
+from app.tracks import VARIANT_PRESETS
+
+
+def run_batch_command(args):
+    from app.batch import collect_episodes, run_batch, write_report, format_summary, DEFAULT_OUTPUT_DIR, REPORT_NAME
+
+    output_dir = args.output_dir or os.path.join(args.season_dir, DEFAULT_OUTPUT_DIR)
+    jobs = collect_episodes(args.season_dir, args.fonts, output_dir)
+    if not jobs:
+        print("В каталоге не найдено ни одной серии")
+        return 1
+    if args.dry_run:
+        for job in jobs:
+            print(f"[{job['episode']:02d}] {job['input_file']} + {job['additional_audio']} + "
+                  f"{job['subtitle_signs']} + {job['subtitle_full']} -> {job['output_file']}"
+                  + (f" ({'; '.join(job['errors'])})" if job['errors'] else ''))
+        return 0
+
+    start = time.monotonic()
+    results = run_batch(jobs, workers=args.workers, is_remove_delay=not args.keep_delay,
+                        is_convert_audio=not args.no_convert_audio, skip_existing=args.skip_existing,
+                        is_stream_audio=args.stream_audio, variants=args.variant)
+    report = write_report(results, os.path.join(output_dir, REPORT_NAME), time.monotonic() - start)
+    print(format_summary(report))
+    return 1 if report['failed'] else 0
+
+
+def run_watch_command(args):
+    from app.watch import watch
+
+    try:
+        watch(args.incoming_dir, args.fonts, args.output_dir, workers=args.workers,
+              is_remove_delay=not args.keep_delay, is_convert_audio=not args.no_convert_audio,
+              is_stream_audio=args.stream_audio, stable_seconds=args.stable_seconds, poll_interval=args.poll_interval,
+              variants=args.variant)
+    except KeyboardInterrupt:
+        print("Наблюдение остановлено")
+    return 0
+
+
+def run_variants_command(args):
+    from app.batch import get_console_log
+    from app.media_processor import create_variant_mkvs
+    from app.tracks import get_variants
+
+    variants = get_variants(args.output, args.variant or ['full'], args.extra_audio)
+    try:
+        outputs = create_variant_mkvs(args.video, args.audio, args.signs, args.full, args.fonts, variants,
+                                      not args.keep_delay, not args.no_convert_audio, lambda progress: None,
+                                      get_console_log(), args.extra_audio)
+    except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+        print(f"Не удалось собрать варианты: {e}")
+        return 1
+    if not outputs:
+        return 1
+    for output in outputs:
+        print(output)
+    return 0
+
+
+def parse_track_setting(value):
+    stream, separator, assignment = value.rpartition(':')
+    key, _, setting = assignment.partition('=')
+    if not separator or key not in ('title', 'language', 'default'):
+        raise argparse.ArgumentTypeError(f"ожидается ТИП:НОМЕР:title|language|default=ЗНАЧЕНИЕ, получено {value}")
+    if key == 'default':
+        setting = setting.lower() in ('1', 'yes', 'true', 'да')
+    return stream, key, setting
+
+
+def run_edit_command(args):
+    from app.batch import get_console_log
+    from app.header_edit import edit_mkv
+    from app.tracks import TRACK_LAYOUT
+    from app import incremental
+
+    tracks = {}
+    if args.layout:
+        tracks = {track['stream']: dict(track) for track in TRACK_LAYOUT}
+    for stream, key, value in args.set:
+        tracks.setdefault(stream, {'stream': stream})[key] = value
+    tracks = list(tracks.values())
+    try:
+        edit_mkv(args.file, get_console_log(), tracks, args.attach, args.replace, args.remove)
+    except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+        print(f"Не удалось изменить файл: {e}")
+        return 1
+    manifest = incremental.read_manifest(args.file)
+    if manifest:
+        # The manifest has to describe the edited file, or the next build would compare with the old layout.
+        manifest = incremental.apply_edit(manifest, tracks, args.attach, args.replace, args.remove)
+        incremental.write_manifest(args.file, manifest)
+    return 0
+
+
+def get_server_url(args):
+    return args.server or job_server_url or f"http://{job_server_host}:{job_server_port}"
+
+
+def run_server_command(args):
+    from app.job_server import run_server
+
+    try:
+        run_server(args.host, args.port, args.database, heartbeat_timeout=args.heartbeat_timeout)
+    except KeyboardInterrupt:
+        print("Сервер заданий остановлен")
+    return 0
+
+
+def run_worker_command(args):
+    from app.job_worker import run_worker
+
+    try:
+        run_worker(get_server_url(args), args.name, args.poll_interval, max_jobs=args.max_jobs,
+                   heartbeat_interval=args.heartbeat_interval)
+    except KeyboardInterrupt:
+        print("Исполнитель остановлен")
+    return 0
+
+
+def run_submit_command(args):
+    from app import job_client
+    from app.batch import get_console_log
+
+    params = {
+        'input_file': os.path.abspath(args.video),
+        'additional_audio': os.path.abspath(args.audio),
+        'subtitle_signs': os.path.abspath(args.signs),
+        'subtitle_full': os.path.abspath(args.full),
+        'font_directory': os.path.abspath(args.fonts) if args.fonts else '',
+        'output_file': os.path.abspath(args.output),
+        'is_remove_delay': not args.keep_delay,
+        'is_convert_audio': not args.no_convert_audio,
+    }
+    server_url = get_server_url(args)
+    try:
+        job_id = job_client.submit(server_url, params)
+        print(job_id)
+        if not args.wait:
+            return 0
+        job = job_client.wait_job(server_url, job_id, log=get_console_log(f"[{job_id}] "))
+    except (OSError, RuntimeError) as e:
+        print(f"Сервер заданий: {e}")
+        return 1
+    print(f"{job['status']}" + (f": {job['error']}" if job['error'] else ''))
+    return 0 if job['status'] == 'ok' else 1
+
+
+def run_jobs_command(args):
+    from app import job_client
+
+    server_url = get_server_url(args)
+    try:
+        for job_id in args.cancel:
+            job = job_client.cancel(server_url, job_id)
+            print(f"{job_id}: {'отмена запрошена' if job['status'] == 'running' else job['status']}")
+        if args.cancel:
+            return 0
+        jobs = job_client.list_jobs(server_url, args.status)
+        workers = job_client.list_workers(server_url)
+    except (OSError, RuntimeError) as e:
+        print(f"Сервер заданий: {e}")
+        return 1
+    print(f"{'Номер':>5}  {'Статус':<9} {'%':>3}  {'Этап':<8} {'Исполнитель':<24} Результат")
+    for job in jobs:
+        print(f"{job['id']:>5}  {job['status']:<9} {job['progress']:>3}  {job['stage'] or '':<8} "
+              f"{job['worker'] or '':<24} {job['error'] or job['params']['output_file']}")
+    now = time.time()
+    for worker in workers:
+        print(f"Исполнитель {worker['name']}: " + (f"задание {worker['job_id']}" if worker['job_id'] else "свободен")
+              + f", на связи {now - worker['last_seen']:.0f} с назад")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='MKVCreator', description="MKV Creator без графического интерфейса")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help="Собрать все серии сезона")
+    batch.add_argument('season_dir', help="Каталог сезона с видео, аудио AniLibria и субтитрами")
+    batch.add_argument('--fonts', default=None, help="Каталог шрифтов (по умолчанию подкаталог fonts)")
+    batch.add_argument('--output-dir', default=None, help="Каталог для готовых MKV (по умолчанию <сезон>/output)")
+    batch.add_argument('--workers', type=int, default=batch_workers, help="Количество одновременных заданий")
+    batch.add_argument('--keep-delay', action='store_true', help="Не удалять задержку аудио")
+    batch.add_argument('--no-convert-audio', action='store_true', help="Не конвертировать аудио в AAC")
+    batch.add_argument('--stream-audio', action='store_true', default=stream_audio_encode,
+                       help="Конвертировать аудио прямо во время сборки, без промежуточного файла")
+    batch.add_argument('--skip-existing', action='store_true', help="Пропускать уже собранные серии")
+    batch.add_argument('--dry-run', action='store_true', help="Только показать найденные серии")
+    batch.add_argument('--variant', action='append', choices=sorted(VARIANT_PRESETS), default=None,
+                       help="Собрать несколько вариантов серии за одно чтение исходника")
+    batch.set_defaults(handler=run_batch_command)
+
+    watch = subparsers.add_parser('watch', help="Собирать серии по мере появления файлов в каталоге")
+    watch.add_argument('incoming_dir', help="Каталог, куда приходят видео, аудио и субтитры")
+    watch.add_argument('--fonts', default=None, help="Каталог шрифтов (по умолчанию подкаталог fonts)")
+    watch.add_argument('--output-dir', default=None, help="Каталог для готовых MKV (по умолчанию <каталог>/output)")
+    watch.add_argument('--workers', type=int, default=batch_workers, help="Количество одновременных заданий")
+    watch.add_argument('--keep-delay', action='store_true', help="Не удалять задержку аудио")
+    watch.add_argument('--no-convert-audio', action='store_true', help="Не конвертировать аудио в AAC")
+    watch.add_argument('--stream-audio', action='store_true', default=stream_audio_encode,
+                       help="Конвертировать аудио прямо во время сборки, без промежуточного файла")
+    watch.add_argument('--stable-seconds', type=float, default=watch_stable_seconds,
+                       help="Сколько секунд файл не должен меняться, чтобы считаться готовым")
+    watch.add_argument('--poll-interval', type=float, default=watch_poll_interval,
+                       help="Интервал опроса каталога, если inotify недоступен")
+    watch.add_argument('--variant', action='append', choices=sorted(VARIANT_PRESETS), default=None,
+                       help="Собрать несколько вариантов серии за одно чтение исходника")
+    watch.set_defaults(handler=run_watch_command)
+
+    variants = subparsers.add_parser('variants', help="Собрать несколько вариантов одной серии за один проход")
+    variants.add_argument('video', help="Исходное видео")
+    variants.add_argument('audio', help="Аудио AniLibria")
+    variants.add_argument('signs', help="Субтитры с надписями")
+    variants.add_argument('full', help="Полные субтитры")
+    variants.add_argument('output', help="Выходной MKV, к имени добавляется суффикс варианта")
+    variants.add_argument('--fonts', default='', help="Каталог шрифтов")
+    variants.add_argument('--variant', action='append', choices=sorted(VARIANT_PRESETS), default=None,
+                          help="Вариант сборки (по умолчанию full), можно указать несколько")
+    variants.add_argument('--extra-audio', action='append', default=[],
+                          help="Дополнительная озвучка, доступна в вариантах как a:2, a:3 и далее")
+    variants.add_argument('--keep-delay', action='store_true', help="Не удалять задержку аудио")
+    variants.add_argument('--no-convert-audio', action='store_true', help="Не конвертировать аудио в AAC")
+    variants.set_defaults(handler=run_variants_command)
+
+    edit = subparsers.add_parser('edit', help="Изменить дорожки и вложения готового MKV без пересборки")
+    edit.add_argument('file', help="Готовый MKV-файл")
+    edit.add_argument('--layout', action='store_true', help="Применить названия, языки и флаги дорожек из настроек")
+    edit.add_argument('--set', action='append', type=parse_track_setting, default=[],
+                      help="Свойство дорожки, например a:0:title=AniLibria или s:1:default=yes")
+    edit.add_argument('--attach', action='append', default=[], help="Добавить шрифт")
+    edit.add_argument('--replace', action='append', default=[], help="Заменить вложение с тем же именем файла")
+    edit.add_argument('--remove', action='append', default=[], help="Удалить вложение по имени файла")
+    edit.set_defaults(handler=run_edit_command)
+
+    server = subparsers.add_parser('server', help="Сервер общей очереди заданий для нескольких машин")
+    server.add_argument('--host', default=job_server_host, help="Адрес, 0.0.0.0 для доступа из сети")
+    server.add_argument('--port', type=int, default=job_server_port)
+    server.add_argument('--database', default=job_database_path, help="Файл SQLite с очередью")
+    server.add_argument('--heartbeat-timeout', type=float, default=job_heartbeat_timeout,
+                        help="Через сколько секунд без связи задание исполнителя возвращается в очередь")
+    server.set_defaults(handler=run_server_command)
+
+    worker = subparsers.add_parser('worker', help="Забирать задания с сервера и собирать их")
+    worker.add_argument('--server', default=None, help="Адрес сервера заданий, например http://host:8765")
+    worker.add_argument('--name', default=None, help="Имя исполнителя (по умолчанию имя машины и PID)")
+    worker.add_argument('--poll-interval', type=float, default=job_poll_interval,
+                        help="Интервал опроса сервера, когда очередь пуста")
+    worker.add_argument('--heartbeat-interval', type=float, default=job_heartbeat_interval,
+                        help="Как часто сообщать серверу прогресс, должно быть меньше таймаута сервера")
+    worker.add_argument('--max-jobs', type=int, default=None, help="Завершиться после этого числа заданий")
+    worker.set_defaults(handler=run_worker_command)
+
+    submit = subparsers.add_parser('submit', help="Поставить сборку серии в очередь сервера")
+    submit.add_argument('video', help="Исходное видео")
+    submit.add_argument('audio', help="Аудио AniLibria")
+    submit.add_argument('signs', help="Субтитры с надписями")
+    submit.add_argument('full', help="Полные субтитры")
+    submit.add_argument('output', help="Выходной MKV")
+    submit.add_argument('--fonts', default='', help="Каталог шрифтов")
+    submit.add_argument('--keep-delay', action='store_true', help="Не удалять задержку аудио")
+    submit.add_argument('--no-convert-audio', action='store_true', help="Не конвертировать аудио в AAC")
+    submit.add_argument('--server', default=None, help="Адрес сервера заданий")
+    submit.add_argument('--wait', action='store_true', help="Дождаться окончания и показать журнал сборки")
+    submit.set_defaults(handler=run_submit_command)
+
+    jobs = subparsers.add_parser('jobs', help="Задания и исполнители сервера")
+    jobs.add_argument('--server', default=None, help="Адрес сервера заданий")
+    jobs.add_argument('--status', default=None, choices=('queued', 'running', 'ok', 'failed', 'cancelled'))
+    jobs.add_argument('--cancel', type=int, action='append', default=[], help="Отменить задание с этим номером")
+    jobs.set_defaults(handler=run_jobs_command)
+    return parser
+
+
+if __name__ == "__main__":
+    arguments = build_parser().parse_args()
+    sys.exit(arguments.handler(arguments))
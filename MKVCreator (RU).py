@@ -1,4 +1,5 @@
 import sys
+import app.logger
 from PyQt6.QtWidgets import QApplication
 from app.ui import MKVCreatorApp
 
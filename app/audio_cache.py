@@ -0,0 +1,104 @@
+import os
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from app.config import audio_cache_dir, audio_cache_max_bytes
+from app.probe import cached
+
+HASH_CHUNK_SIZE = 1024 * 1024
+CACHE_EXTENSION = '.aac'
+
+_lock = threading.Lock()
+_pinned = {}
+_local = threading.local()
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_content_hash(file_path):
+    return cached(file_path, 'sha256', hash_file)
+
+
+def get_cache_key(input_audio, encode_args):
+    digest = hashlib.sha256(get_content_hash(input_audio).encode('ascii'))
+    digest.update('\0'.join(encode_args).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_cache_path(key):
+    return os.path.join(audio_cache_dir, key + CACHE_EXTENSION)
+
+
+def get_temp_path(key):
+    return os.path.join(audio_cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp{CACHE_EXTENSION}")
+
+
+@contextmanager
+def pinned():
+    # Entries a job looks up or stores stay on disk until the job is done with them, whatever other jobs evict.
+    previous = getattr(_local, 'paths', None)
+    paths = _local.paths = []
+    try:
+        yield
+    finally:
+        _local.paths = previous
+        with _lock:
+            for path in paths:
+                _pinned[path] -= 1
+                if not _pinned[path]:
+                    del _pinned[path]
+
+
+def pin(path):
+    paths = getattr(_local, 'paths', None)
+    if paths is not None:
+        _pinned[path] = _pinned.get(path, 0) + 1
+        paths.append(path)
+
+
+def lookup(key):
+    path = get_cache_path(key)
+    with _lock:
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        pin(path)
+    return path
+
+
+def store(temp_path, key):
+    path = get_cache_path(key)
+    with _lock:
+        os.replace(temp_path, path)
+        pin(path)
+    evict(keep=path)
+    return path
+
+
+def evict(keep=None):
+    with _lock:
+        entries = []
+        for entry in os.scandir(audio_cache_dir):
+            if entry.is_file() and entry.name.endswith(CACHE_EXTENSION) and '.tmp' not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= audio_cache_max_bytes:
+                break
+            if path == keep or path in _pinned:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                logging.info(f"Удалён из кэша аудио: {path}")
+            except OSError:
+                pass
@@ -0,0 +1,234 @@
+import os
+import re
+import json
+import time
+import logging
+from concurrent.futures import as_completed
+from app.config import batch_workers, stream_audio_encode
+from app.media_processor import create_enhanced_mkv, create_variant_mkvs
+from app.tracks import get_variants
+from app.engine import Engine, JobCancelled
+
+VIDEO_EXTENSIONS = ('.mkv', '.mp4', '.avi', '.m2ts', '.ts')
+AUDIO_EXTENSIONS = ('.mka', '.aac', '.ac3', '.eac3', '.dts', '.flac', '.wav', '.m4a', '.mp3', '.opus', '.ogg')
+SUBTITLE_EXTENSIONS = ('.ass', '.ssa')
+SIGNS_MARKERS = ('sign', 'надпис')
+FONT_DIR_NAMES = ('fonts', 'font', 'шрифты')
+DEFAULT_OUTPUT_DIR = 'output'
+REPORT_NAME = 'batch_report.json'
+
+EPISODE_PATTERNS = [
+    re.compile(r's\d{1,2}\s*e(\d{1,4})', re.IGNORECASE),
+    re.compile(r'(?<![a-zа-я])(?:episode|серия|ep|e)[\s._-]*(\d{1,4})(?!\d)', re.IGNORECASE),
+    re.compile(r'\s-\s*(\d{1,4})(?:v\d)?(?!\d)'),
+    re.compile(r'\[(\d{1,4})\]'),
+]
+FALLBACK_PATTERN = re.compile(r'(?<![\dxXhH])(\d{1,4})(?![\d]|p|i|bit|к|k)', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'\[(?!\d{1,4}\])[^\]]*\]|\((?!\d{1,4}\))[^)]*\)')
+
+
+def get_console_log(prefix=''):
+    def log(message):
+        logging.info(f"{prefix}{message}")
+    return log
+
+
+def get_episode_number(file_name):
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    name = TAG_PATTERN.sub(' ', name).replace('_', ' ')
+    for pattern in EPISODE_PATTERNS:
+        match = pattern.search(name)
+        if match:
+            return int(match.group(1))
+    matches = FALLBACK_PATTERN.findall(name)
+    if matches:
+        return int(matches[-1])
+    return None
+
+
+def classify_file(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in SUBTITLE_EXTENSIONS:
+        lower_name = file_name.lower()
+        if any(marker in lower_name for marker in SIGNS_MARKERS):
+            return 'subtitle_signs'
+        return 'subtitle_full'
+    if extension in AUDIO_EXTENSIONS:
+        return 'audio'
+    if extension in VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+
+def find_font_directory(season_dir):
+    for entry in os.listdir(season_dir):
+        path = os.path.join(season_dir, entry)
+        if entry.lower() in FONT_DIR_NAMES and os.path.isdir(path):
+            return path
+    return ''
+
+
+def collect_episodes(season_dir, font_directory=None, output_dir=None):
+    season_dir = os.path.abspath(season_dir)
+    output_dir = os.path.abspath(output_dir or os.path.join(season_dir, DEFAULT_OUTPUT_DIR))
+    if font_directory is None:
+        font_directory = find_font_directory(season_dir)
+    skipped_dirs = {output_dir}
+    if font_directory:
+        skipped_dirs.add(os.path.abspath(font_directory))
+
+    episodes = {}
+    for root, dirs, files in os.walk(season_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in skipped_dirs]
+        for file in sorted(files):
+            role = classify_file(file)
+            if role is None:
+                continue
+            episode = get_episode_number(file)
+            if episode is None:
+                logging.warning(f"Не удалось определить номер серии: {os.path.join(root, file)}")
+                continue
+            episodes.setdefault(episode, {}).setdefault(role, []).append(os.path.join(root, file))
+
+    jobs = []
+    for episode in sorted(episodes):
+        files = episodes[episode]
+        job = {
+            'episode': episode,
+            'input_file': None,
+            'additional_audio': None,
+            'subtitle_signs': None,
+            'subtitle_full': None,
+            'font_directory': font_directory or '',
+            'output_file': None,
+            'errors': [],
+        }
+        for role, key in (('video', 'input_file'), ('audio', 'additional_audio'),
+                          ('subtitle_signs', 'subtitle_signs'), ('subtitle_full', 'subtitle_full')):
+            candidates = files.get(role, [])
+            if len(candidates) == 1:
+                job[key] = candidates[0]
+            elif not candidates:
+                job['errors'].append(f"нет файла ({role})")
+            else:
+                job['errors'].append(f"несколько файлов ({role}): {', '.join(candidates)}")
+        if job['input_file']:
+            name = os.path.splitext(os.path.basename(job['input_file']))[0]
+            job['output_file'] = os.path.join(output_dir, name + '.mkv')
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job, is_remove_delay, is_convert_audio, skip_existing=False, is_stream_audio=stream_audio_encode,
+            variants=None):
+    prefix = f"[{job['episode']:02d}] "
+    log = get_console_log(prefix)
+    result = {'episode': job['episode'], 'output_file': job['output_file'], 'status': 'failed', 'error': None,
+              'elapsed': 0.0}
+    if job['errors']:
+        result['error'] = '; '.join(job['errors'])
+        return result
+    output_files = [job['output_file']]
+    if variants:
+        variants = get_variants(job['output_file'], variants)
+        output_files = [variant['output_file'] for variant in variants]
+        result['outputs'] = output_files
+    if skip_existing and all(os.path.exists(path) for path in output_files):
+        result['status'] = 'skipped'
+        return result
+
+    last_progress = [-1]
+
+    def progress_callback(progress):
+        if progress != last_progress[0]:
+            last_progress[0] = progress
+            log(f"{progress}%")
+
+    os.makedirs(os.path.dirname(job['output_file']), exist_ok=True)
+    start = time.monotonic()
+    try:
+        if variants:
+            output = create_variant_mkvs(
+                input_file=job['input_file'],
+                additional_audio=job['additional_audio'],
+                subtitle_signs=job['subtitle_signs'],
+                subtitle_full=job['subtitle_full'],
+                font_directory=job['font_directory'],
+                variants=variants,
+                is_remove_delay=is_remove_delay,
+                is_convert_audio=is_convert_audio,
+                progress_callback=progress_callback,
+                log=log
+            )
+        else:
+            output = create_enhanced_mkv(
+                input_file=job['input_file'],
+                additional_audio=job['additional_audio'],
+                subtitle_signs=job['subtitle_signs'],
+                subtitle_full=job['subtitle_full'],
+                font_directory=job['font_directory'],
+                output_file=job['output_file'],
+                is_remove_delay=is_remove_delay,
+                is_convert_audio=is_convert_audio,
+                progress_callback=progress_callback,
+                log=log,
+                is_stream_audio=is_stream_audio
+            )
+        if output:
+            result['status'] = 'ok'
+        else:
+            result['error'] = "Не удалось конвертировать аудиофайл"
+    except JobCancelled as e:
+        result['status'] = 'cancelled'
+        result['error'] = str(e)
+    except Exception as e:
+        result['error'] = str(e)
+    result['elapsed'] = round(time.monotonic() - start, 2)
+    return result
+
+
+def run_batch(jobs, workers=batch_workers, is_remove_delay=True, is_convert_audio=True, skip_existing=False,
+              is_stream_audio=stream_audio_encode, variants=None):
+    engine = Engine(workers)
+    futures = [engine.submit(run_job, job, is_remove_delay, is_convert_audio, skip_existing, is_stream_audio,
+                             variants, name=f"серия {job['episode']:02d}").future for job in jobs]
+    results = []
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            logging.info(f"[{result['episode']:02d}] {result['status']}"
+                         + (f": {result['error']}" if result['error'] else ''))
+    except KeyboardInterrupt:
+        logging.info("Прерывание: отмена заданий")
+        engine.cancel_all()
+        results = [future.result() for future in futures]
+    finally:
+        engine.shutdown(wait=True)
+    results.sort(key=lambda r: r['episode'])
+    return results
+
+
+def write_report(results, report_path, elapsed):
+    report = {
+        'total': len(results),
+        'ok': sum(1 for r in results if r['status'] == 'ok'),
+        'failed': sum(1 for r in results if r['status'] == 'failed'),
+        'skipped': sum(1 for r in results if r['status'] == 'skipped'),
+        'cancelled': sum(1 for r in results if r['status'] == 'cancelled'),
+        'elapsed': round(elapsed, 2),
+        'jobs': results,
+    }
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, ensure_ascii=False, indent=2)
+    return report
+
+
+def format_summary(report):
+    lines = [f"{'Серия':>5}  {'Статус':<8} {'Время, с':>9}  Результат"]
+    for r in report['jobs']:
+        lines.append(f"{r['episode']:>5}  {r['status']:<8} {r['elapsed']:>9.1f}  {r['error'] or r['output_file']}")
+    lines.append(f"Готово: {report['ok']}, ошибок: {report['failed']}, пропущено: {report['skipped']}, "
+                 f"отменено: {report['cancelled']}, всего {report['elapsed']:.1f} с")
+    return '\n'.join(lines)
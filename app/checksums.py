@@ -0,0 +1,212 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from app import matroska
+
+SIDECAR_SUFFIX = '.checksums.json'
+BLOCK_SIZE = 4 * 1024 * 1024
+POLL_INTERVAL = 0.25
+DURATION_TOLERANCE = 1.0
+CRC32_POLYNOMIAL = 0xEDB88320
+# Written into the sidecar next to the value: this is not the digest sha256sum prints.
+SHA256_BLOCKS_SCHEME = 'sha256(sha256(block 1) + sha256(block 2) + ... + sha256(block N))'
+
+
+def gf2_times(matrix, vector):
+    total = 0
+    row = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return total
+
+
+def gf2_square(matrix):
+    return [gf2_times(matrix, row) for row in matrix]
+
+
+def crc32_shift(crc, length):
+    # Same as zlib's crc32_combine: appends length zero bytes to the data crc was computed over.
+    odd = [CRC32_POLYNOMIAL] + [1 << bit for bit in range(31)]
+    even = gf2_square(odd)
+    odd = gf2_square(even)
+    while length:
+        even = gf2_square(odd)
+        if length & 1:
+            crc = gf2_times(even, crc)
+        length >>= 1
+        if not length:
+            break
+        odd = gf2_square(even)
+        if length & 1:
+            crc = gf2_times(odd, crc)
+        length >>= 1
+    return crc
+
+
+@lru_cache(maxsize=64)
+def get_shift_matrix(length):
+    return [crc32_shift(1 << bit, length) for bit in range(32)]
+
+
+def crc32_combine(crc1, crc2, length2):
+    return gf2_times(get_shift_matrix(length2), crc1) ^ crc2
+
+
+def hash_block(data):
+    return hashlib.sha256(data).digest(), zlib.crc32(data)
+
+
+def combine_blocks(blocks, size):
+    # CRC32 of the whole file is assembled from the block CRCs. A plain SHA-256 can't be, the muxer rewrites
+    # the header after the blocks behind it were hashed, so the streamed digest is one over the block hashes.
+    crc = 0
+    digest = hashlib.sha256()
+    for number, (block_digest, block_crc) in enumerate(blocks):
+        crc = crc32_combine(crc, block_crc, min(BLOCK_SIZE, size - number * BLOCK_SIZE))
+        digest.update(block_digest)
+    return {
+        'size': size,
+        'crc32': f'{crc:08x}',
+        'sha256_blocks': {'digest': digest.hexdigest(), 'block_size': BLOCK_SIZE, 'scheme': SHA256_BLOCKS_SCHEME},
+    }
+
+
+def read_blocks(file_path, numbers):
+    blocks = {}
+    with open(file_path, 'rb') as media_file:
+        for number in numbers:
+            media_file.seek(number * BLOCK_SIZE)
+            blocks[number] = hash_block(media_file.read(BLOCK_SIZE))
+    return blocks
+
+
+def hash_file(file_path):
+    # Reading the whole file in order also gives the plain SHA-256 that sha256sum checks.
+    blocks = []
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as media_file:
+        for data in iter(lambda: media_file.read(BLOCK_SIZE), b''):
+            blocks.append(hash_block(data))
+            digest.update(data)
+    result = combine_blocks(blocks, os.path.getsize(file_path))
+    result['sha256'] = digest.hexdigest()
+    return result
+
+
+class StreamHasher:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.blocks = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.follow, name=f"hash {os.path.basename(file_path)}", daemon=True)
+
+    def start(self):
+        # A leftover file from an earlier run would be hashed before the muxer truncates it.
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def follow(self):
+        # Blocks are hashed as soon as the muxer has written past them, while they are still in the page cache.
+        media_file = None
+        try:
+            while not self.stop_event.wait(POLL_INTERVAL):
+                if media_file is None:
+                    if not os.path.exists(self.file_path):
+                        continue
+                    media_file = open(self.file_path, 'rb')
+                size = os.fstat(media_file.fileno()).st_size
+                while (len(self.blocks) + 1) * BLOCK_SIZE <= size and not self.stop_event.is_set():
+                    media_file.seek(len(self.blocks) * BLOCK_SIZE)
+                    self.blocks.append(hash_block(media_file.read(BLOCK_SIZE)))
+        except OSError as e:
+            logging.warning(f"Потоковый подсчёт контрольных сумм прерван: {e}")
+            self.blocks = []
+        finally:
+            if media_file:
+                media_file.close()
+
+    def finish(self, header_size):
+        # The muxer only seeks back into the header in front of the first cluster (seek head, duration,
+        # segment size), so those blocks and the unfinished tail are the only ones read again.
+        self.stop()
+        size = os.path.getsize(self.file_path)
+        count = (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        blocks = dict(enumerate(self.blocks[:count]))
+        stale = set(range((header_size + BLOCK_SIZE - 1) // BLOCK_SIZE)) | set(range(len(blocks), count))
+        blocks.update(read_blocks(self.file_path, sorted(stale)))
+        result = combine_blocks([blocks[number] for number in range(count)], size)
+        result['bytes_reread'] = sum(min(BLOCK_SIZE, size - number * BLOCK_SIZE)
+                                     for number in stale if number < count)
+        return result
+
+
+@contextmanager
+def follow(file_path, enabled=True):
+    if not enabled:
+        yield None
+        return
+    hasher = StreamHasher(file_path)
+    hasher.start()
+    try:
+        yield hasher
+    finally:
+        if hasher.thread.is_alive():
+            hasher.stop_event.set()
+
+
+def check_structure(structure, track_count=None, duration=None):
+    errors = []
+    if not structure['cues']:
+        errors.append("нет индекса (Cues)")
+    if structure['first_cluster'] is None:
+        errors.append("нет ни одного кластера")
+    if track_count is not None and len(structure['tracks']) != track_count:
+        errors.append(f"дорожек {len(structure['tracks'])}, ожидалось {track_count}")
+    if duration and (structure['duration'] is None or abs(structure['duration'] - duration) > DURATION_TOLERANCE):
+        errors.append(f"длительность {structure['duration']}, ожидалось {duration:.3f}")
+    return errors
+
+
+def verify_output(file_path, hasher=None, track_count=None, duration=None, is_checksums=True,
+                  is_structure_check=True):
+    try:
+        structure = matroska.read_structure(file_path)
+        errors = check_structure(structure, track_count, duration)
+    except (OSError, matroska.MatroskaError) as e:
+        structure = {'first_cluster': None, 'cues': False, 'tracks': [], 'duration': None}
+        errors = [str(e)]
+    result = {}
+    if hasher:
+        result = hasher.finish(structure['first_cluster'] or os.path.getsize(file_path))
+    elif is_checksums:
+        result = hash_file(file_path)
+    if is_structure_check:
+        result['structure'] = {
+            'cues': structure['cues'],
+            'tracks': len(structure['tracks']),
+            'duration': structure['duration'],
+            'errors': errors,
+        }
+    return result
+
+
+def write_sidecar(output_file, result):
+    sidecar = dict(result, file=os.path.basename(output_file))
+    sidecar.pop('bytes_reread', None)
+    temp_path = f"{output_file}{SIDECAR_SUFFIX}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as sidecar_file:
+        json.dump(sidecar, sidecar_file, ensure_ascii=False, indent=2)
+    os.replace(temp_path, output_file + SIDECAR_SUFFIX)
@@ -1,6 +1,51 @@
 import locale
+import os
 
-ffmpeg_path = '_internal\\ffmpeg\\ffmpeg.exe'
-ffprobe_path = '_internal\\ffmpeg\\ffprobe.exe'
-mkvmerge = '_internal\\mkvtoolnix\\mkvmerge.exe'
+ffmpeg_path = os.environ.get('MKVCREATOR_FFMPEG', '_internal\\ffmpeg\\ffmpeg.exe')
+ffprobe_path = os.environ.get('MKVCREATOR_FFPROBE', '_internal\\ffmpeg\\ffprobe.exe')
+mkvmerge = os.environ.get('MKVCREATOR_MKVMERGE', '_internal\\mkvtoolnix\\mkvmerge.exe')
+mkvpropedit = os.environ.get('MKVCREATOR_MKVPROPEDIT', '_internal\\mkvtoolnix\\mkvpropedit.exe')
 default_encoding = locale.getpreferredencoding()
+batch_workers = max(1, (os.cpu_count() or 2) // 2)
+single_pass_delay = True
+verify_single_pass_delay = True
+verify_delays_with_mediainfo = False
+write_checksums = False
+check_output_structure = False
+cache_dir = os.environ.get('MKVCREATOR_CACHE_DIR') or \
+    os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'), 'MKVCreator')
+probe_cache_path = os.path.join(cache_dir, 'probe_cache.json')
+probe_cache_max_entries = 5000
+audio_cache_dir = os.path.join(cache_dir, 'audio')
+audio_cache_max_bytes = 20 * 1024 * 1024 * 1024
+stream_audio_encode = False
+parallel_audio_encode = False
+parallel_audio_workers = os.cpu_count() or 2
+parallel_audio_min_duration = 20 * 60
+attach_used_fonts_only = True
+font_index_path = os.path.join(cache_dir, 'font_index.json')
+font_index_rescan_interval = 30
+log_max_lines = 5000
+log_max_pending = 2000
+log_flush_interval = 100
+write_trace_reports = True
+preflight_checks = True
+incremental_builds = True
+header_edits = False
+preflight_space_margin = 1.1
+io_scheduler = True
+device_slots = 1
+cpu_slots = max(1, (os.cpu_count() or 2) // 2)
+scratch_dir = os.environ.get('MKVCREATOR_SCRATCH_DIR', '')
+watch_stable_seconds = 10
+watch_poll_interval = 5
+job_server_host = '127.0.0.1'
+job_server_port = 8765
+job_server_url = os.environ.get('MKVCREATOR_SERVER', '')
+job_database_path = os.path.join(cache_dir, 'jobs.sqlite3')
+job_heartbeat_interval = 5
+job_heartbeat_timeout = 30
+job_max_attempts = 3
+job_poll_interval = 2
+job_request_timeout = 10
+stage_timeouts = {'probe': 120, 'audio': 2 * 3600, 'mux': 4 * 3600, 'delay': 2 * 3600, 'edit': 300}
@@ -0,0 +1,208 @@
+import os
+import re
+import codecs
+import asyncio
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from app.config import batch_workers
+
+READ_CHUNK_SIZE = 64 * 1024
+LINE_BREAK = re.compile(r'[\r\n]+')
+
+_local = threading.local()
+_default_engine = None
+_default_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.tasks = set()
+        self.outputs = []
+        self.future = None
+
+    def add_output(self, path):
+        with self.lock:
+            if path not in self.outputs:
+                self.outputs.append(path)
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobCancelled(f"Задание отменено: {self.name}")
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.lock:
+            tasks = list(self.tasks)
+        for task in tasks:
+            self.engine.loop.call_soon_threadsafe(task.cancel)
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def run(self, func, args, kwargs):
+        _local.job = self
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.job = None
+            if self.cancelled.is_set():
+                remove_files(self.outputs)
+
+
+class Engine:
+    def __init__(self, workers=batch_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='mkvcreator-engine', daemon=True)
+        self.thread.start()
+        self.lock = threading.Lock()
+        self.jobs = []
+
+    def submit(self, func, *args, name=None, **kwargs):
+        job = Job(self, name or getattr(func, '__name__', 'job'))
+        with self.lock:
+            self.jobs = [j for j in self.jobs if not j.done()] + [job]
+        job.future = self.executor.submit(job.run, func, args, kwargs)
+        return job
+
+    def cancel_all(self):
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, cancel=False, wait=True):
+        if cancel:
+            self.cancel_all()
+        self.executor.shutdown(wait=wait)
+        if wait:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+
+    def run_process(self, cmd, on_line=None, on_start=None, timeout=None, outputs=(), on_eof=None):
+        return self.run(cmd, lambda process: self.read_lines(process, on_line, on_eof), on_start, timeout, outputs)
+
+    def run_capture(self, cmd, timeout=None, on_start=None, on_eof=None):
+        return self.run(cmd, lambda process: self.capture(process, on_eof), on_start, timeout, (), subprocess.PIPE)
+
+    def run(self, cmd, handler, on_start, timeout, outputs, stderr=subprocess.STDOUT):
+        job = current_job()
+        if job:
+            job.check_cancelled()
+            for path in outputs:
+                job.add_output(path)
+        future = asyncio.run_coroutine_threadsafe(
+            self.execute(cmd, handler, on_start, timeout, outputs, stderr, job), self.loop)
+        try:
+            return future.result()
+        except CancelledError:
+            raise JobCancelled(f"Задание отменено: {job.name if job else cmd[0]}")
+
+    async def execute(self, cmd, handler, on_start, timeout, outputs, stderr, job):
+        task = asyncio.current_task()
+        if job:
+            with job.lock:
+                job.tasks.add(task)
+            if job.cancelled.is_set():
+                task.cancel()
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr)
+            if on_start:
+                on_start(process)
+            try:
+                result = await asyncio.wait_for(handler(process), timeout)
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if process.returncode:
+                remove_files(outputs)
+            return result
+        except BaseException:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+            remove_files(outputs)
+            raise
+        finally:
+            if job:
+                with job.lock:
+                    job.tasks.discard(task)
+
+    async def read_lines(self, process, on_line, on_eof=None):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        while True:
+            chunk = await process.stdout.read(READ_CHUNK_SIZE)
+            lines = LINE_BREAK.split(pending + decoder.decode(chunk, final=not chunk))
+            pending = lines.pop()
+            for line in lines:
+                if on_line and line.strip():
+                    on_line(line)
+            if not chunk:
+                break
+        if on_line and pending.strip():
+            on_line(pending)
+        if on_eof:
+            # The child closes its output as it exits, this is the last look at its counters before the wait
+            # below reaps it. The child watcher may reap it first, then the previous sample is kept.
+            on_eof(process)
+        return await process.wait()
+
+    async def capture(self, process, on_eof=None):
+        output, errors = await asyncio.gather(process.stdout.read(), process.stderr.read())
+        if on_eof:
+            on_eof(process)
+        await process.wait()
+        return process.returncode, output.decode('utf-8', errors='replace'), errors.decode('utf-8', errors='replace')
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                logging.info(f"Удалён незавершённый файл: {path}")
+        except OSError as e:
+            logging.warning(f"Не удалось удалить {path}: {e}")
+
+
+def current_job():
+    return getattr(_local, 'job', None)
+
+
+def bind_job(job):
+    _local.job = job
+
+
+def get_engine():
+    global _default_engine
+    job = current_job()
+    if job:
+        return job.engine
+    with _default_lock:
+        if _default_engine is None:
+            _default_engine = Engine()
+        return _default_engine
+
+
+def run_process(cmd, on_line=None, on_start=None, timeout=None, outputs=(), on_eof=None):
+    return get_engine().run_process(cmd, on_line, on_start, timeout, outputs, on_eof)
+
+
+def run_capture(cmd, timeout=None, on_start=None, on_eof=None):
+    return get_engine().run_capture(cmd, timeout, on_start, on_eof)
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import logging
+import threading
+from app.config import cache_dir, font_index_path, font_index_rescan_interval
+from app.fonts import load_font_info, FONT_INFO_VERSION
+from app.utils import scan_font_files
+
+MIME_TYPES = {
+    b'OTTO': 'application/vnd.ms-opentype',
+    b'ttcf': 'application/x-truetype-font',
+}
+DEFAULT_MIME_TYPE = 'application/x-truetype-font'
+
+_lock = threading.Lock()
+_fonts = None
+_scanned = {}
+
+
+def _load():
+    global _fonts
+    if _fonts is None:
+        try:
+            with open(font_index_path, encoding='utf-8') as index_file:
+                _fonts = json.load(index_file)
+        except (OSError, ValueError):
+            _fonts = {}
+    return _fonts
+
+
+def _save():
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{font_index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as index_file:
+            json.dump(_fonts, index_file, ensure_ascii=False)
+        os.replace(temp_path, font_index_path)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить индекс шрифтов: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def get_mime_type(file_path):
+    with open(file_path, 'rb') as font_file:
+        return MIME_TYPES.get(font_file.read(4), DEFAULT_MIME_TYPE)
+
+
+def index_font(file_path, stat):
+    info = load_font_info(file_path)
+    info.update({
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'mime': get_mime_type(file_path),
+    })
+    return info
+
+
+def refresh(font_directory):
+    font_directory = os.path.abspath(font_directory)
+    with _lock:
+        fonts = _load()
+        if time.monotonic() - _scanned.get(font_directory, float('-inf')) < font_index_rescan_interval:
+            return
+        prefix = os.path.join(font_directory, '')
+        known = {path for path in fonts if path.startswith(prefix)}
+        changed = 0
+        for entry in scan_font_files(font_directory):
+            stat = entry.stat()
+            path = os.path.abspath(entry.path)
+            known.discard(path)
+            info = fonts.get(path)
+            if info and info.get('version') == FONT_INFO_VERSION and info['size'] == stat.st_size \
+                    and info['mtime'] == stat.st_mtime_ns:
+                continue
+            try:
+                fonts[path] = index_font(path, stat)
+            except OSError as e:
+                logging.warning(f"Не удалось прочитать шрифт {path}: {e}")
+                continue
+            changed += 1
+        for path in known:
+            del fonts[path]
+        if changed or known:
+            logging.info(f"Индекс шрифтов {font_directory}: обновлено {changed}, удалено {len(known)}")
+            _save()
+        _scanned[font_directory] = time.monotonic()
+
+
+def get_fonts(font_directory):
+    refresh(font_directory)
+    prefix = os.path.join(os.path.abspath(font_directory), '')
+    with _lock:
+        return [info for path, info in sorted(_fonts.items()) if path.startswith(prefix)]
@@ -0,0 +1,217 @@
+import os
+import re
+import struct
+import hashlib
+
+NAME_IDS = (1, 2, 4, 6, 16, 17)
+# Stored with every indexed font, entries read by an older version are read again.
+FONT_INFO_VERSION = 2
+OVERRIDE_BLOCK = re.compile(r'\{([^}]*)\}')
+OVERRIDE_STYLE = re.compile(r'([bi])(\d*)')
+DEFAULT_EVENT_FORMAT = ['layer', 'start', 'end', 'style', 'name', 'marginl', 'marginr', 'marginv', 'effect', 'text']
+BOLD_STYLES = ('bold', 'black', 'heavy')
+ITALIC_STYLES = ('italic', 'oblique')
+
+
+def decode_name(platform_id, encoding_id, data):
+    if platform_id in (0, 3):
+        return data.decode('utf-16-be', errors='replace')
+    if platform_id == 1 and encoding_id == 0:
+        return data.decode('mac_roman', errors='replace')
+    return None
+
+
+def read_face_names(data, offset):
+    num_tables = struct.unpack_from('>H', data, offset + 4)[0]
+    name_offset = None
+    for i in range(num_tables):
+        tag, _, table_offset, _ = struct.unpack_from('>4sIII', data, offset + 12 + i * 16)
+        if tag == b'name':
+            name_offset = table_offset
+            break
+    if name_offset is None:
+        return {}
+
+    _, count, string_offset = struct.unpack_from('>HHH', data, name_offset)
+    names = {}
+    for i in range(count):
+        platform_id, encoding_id, _, name_id, length, str_offset = struct.unpack_from(
+            '>HHHHHH', data, name_offset + 6 + i * 12)
+        if name_id not in NAME_IDS:
+            continue
+        start = name_offset + string_offset + str_offset
+        name = decode_name(platform_id, encoding_id, data[start:start + length])
+        if name and name.strip():
+            names.setdefault(name_id, set()).add(name.strip())
+    return names
+
+
+def read_font_faces(data):
+    if data[:4] == b'ttcf':
+        num_fonts = struct.unpack_from('>I', data, 8)[0]
+        offsets = struct.unpack_from(f'>{num_fonts}I', data, 12)
+    else:
+        offsets = (0,)
+    faces = []
+    for offset in offsets:
+        names = read_face_names(data, offset)
+        faces.append({
+            'families': sorted(names.get(1, set()) | names.get(16, set())),
+            'full_names': sorted(names.get(4, set())),
+            'postscript_names': sorted(names.get(6, set())),
+            'styles': sorted(names.get(2, set()) | names.get(17, set())),
+        })
+    return faces
+
+
+def get_face_style(face):
+    styles = ' '.join(face['styles']).lower()
+    return any(name in styles for name in BOLD_STYLES), any(name in styles for name in ITALIC_STYLES)
+
+
+def get_style_label(bold, italic):
+    return ', '.join(['полужирный'] * bold + ['курсив'] * italic) or 'обычный'
+
+
+def read_text(file_path):
+    with open(file_path, 'rb') as subtitle_file:
+        data = subtitle_file.read()
+    if data.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return data.decode('utf-16')
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251', errors='replace')
+
+
+def normalize_font_name(name):
+    return name.strip().lstrip('@').strip().lower()
+
+
+def is_style_set(value):
+    # Styles write -1 for true, override tags take 0, 1 or a weight such as 700.
+    try:
+        value = int(value)
+    except ValueError:
+        return False
+    return value in (-1, 1) or value >= 600
+
+
+def get_line_fonts(text, base, styles):
+    state = list(base)
+    fonts = {base}
+    for block in OVERRIDE_BLOCK.findall(text):
+        # Tags inside \t(...) are split at their backslashes too, the closing parenthesis is dropped.
+        for tag in block.split('\\')[1:]:
+            tag = tag.strip().rstrip(')')
+            style = OVERRIDE_STYLE.fullmatch(tag)
+            if tag.startswith('fn'):
+                state[0] = normalize_font_name(tag[2:]) or base[0]
+            elif style:
+                index = 1 if style.group(1) == 'b' else 2
+                state[index] = is_style_set(style.group(2)) if style.group(2) else base[index]
+            elif tag.startswith('r'):
+                state = list(styles.get(tag[1:].strip().lstrip('*'), base))
+        fonts.add(tuple(state))
+    return fonts
+
+
+def get_subtitle_fonts(subtitle_path):
+    # Every font name the subtitles can render with, together with the bold and italic flags it is used with.
+    fonts = set()
+    styles = {}
+    section = None
+    style_format = None
+    event_format = DEFAULT_EVENT_FORMAT
+    for line in read_text(subtitle_path).splitlines():
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            section = line.lower()
+            style_format = None
+            continue
+        key, separator, value = line.partition(':')
+        if not separator:
+            continue
+        key = key.strip().lower()
+        if section in ('[v4+ styles]', '[v4 styles]'):
+            if key == 'format':
+                style_format = [field.strip().lower() for field in value.split(',')]
+            elif key == 'style' and style_format and 'fontname' in style_format:
+                fields = dict(zip(style_format, (field.strip() for field in value.split(',', len(style_format) - 1))))
+                style = (normalize_font_name(fields['fontname']), is_style_set(fields.get('bold', '0')),
+                         is_style_set(fields.get('italic', '0')))
+                styles[fields.get('name', '').lstrip('*')] = style
+                fonts.add(style)
+        elif section == '[events]':
+            if key == 'format':
+                event_format = [field.strip().lower() for field in value.split(',')]
+            elif key == 'dialogue' and 'text' in event_format:
+                fields = dict(zip(event_format, value.split(',', len(event_format) - 1)))
+                style_name = fields.get('style', '').strip().lstrip('*')
+                base = styles.get(style_name) or styles.get('Default') or ('', False, False)
+                fonts |= get_line_fonts(fields.get('text', ''), base, styles)
+    return {font for font in fonts if font[0]}
+
+
+def load_font_info(file_path):
+    with open(file_path, 'rb') as font_file:
+        data = font_file.read()
+    try:
+        faces = read_font_faces(data)
+    except struct.error:
+        faces = []
+    return {'path': file_path, 'hash': hashlib.sha1(data).hexdigest(), 'faces': faces, 'version': FONT_INFO_VERSION}
+
+
+def select_fonts(font_infos, subtitle_paths, log):
+    referenced = set()
+    for subtitle_path in subtitle_paths:
+        referenced |= get_subtitle_fonts(subtitle_path)
+
+    by_family = {}
+    by_full_name = {}
+    for info in font_infos:
+        for face in info['faces']:
+            for name in face['families']:
+                by_family.setdefault(name.lower(), []).append((info, face))
+            for name in face['full_names'] + face['postscript_names']:
+                by_full_name.setdefault(name.lower(), []).append((info, face))
+
+    chosen = set()
+    missing = set()
+    synthesized = set()
+    for name, bold, italic in sorted(referenced):
+        if name in by_full_name:
+            # A full name already picks the face, the renderer only synthesizes the flags on top of it.
+            chosen.update(info['path'] for info, _ in by_full_name[name])
+            continue
+        faces = by_family.get(name)
+        if not faces:
+            missing.add(name)
+            continue
+        distances = [sum(a != b for a, b in zip(get_face_style(face), (bold, italic))) for _, face in faces]
+        best = min(distances)
+        chosen.update(info['path'] for (info, _), distance in zip(faces, distances) if distance == best)
+        if best:
+            synthesized.add(f"{name} ({get_style_label(bold, italic)})")
+
+    selected = []
+    dropped = []
+    seen_hashes = set()
+    for info in font_infos:
+        if info['path'] not in chosen:
+            dropped.append(os.path.basename(info['path']))
+            continue
+        if info['hash'] in seen_hashes:
+            dropped.append(f"{os.path.basename(info['path'])} (дубликат)")
+            continue
+        seen_hashes.add(info['hash'])
+        selected.append(info)
+
+    if dropped:
+        log(f"Не используются в субтитрах, не прикреплены: {', '.join(sorted(dropped))}")
+    if missing:
+        log(f"Шрифты из субтитров не найдены в каталоге: {', '.join(sorted(missing))}")
+    if synthesized:
+        log(f"Нет нужного начертания, оно будет синтезировано: {', '.join(sorted(synthesized))}")
+    return selected
@@ -0,0 +1,79 @@
+import os
+import json
+import subprocess
+from app.config import mkvmerge, mkvpropedit, stage_timeouts
+from app.instrumentation import run_capture
+from app.font_index import get_mime_type
+
+TRACK_PROPERTIES = {'title': 'name', 'language': 'language', 'default': 'flag-default'}
+
+
+def identify(file_path):
+    return_code, output, errors = run_capture([mkvmerge, '-J', file_path], stage_timeouts.get('probe'))
+    if return_code > 1 or not output.strip():
+        raise RuntimeError(f"mkvmerge не смог прочитать {file_path}: {errors.strip() or output.strip()}")
+    return json.loads(output)
+
+
+def get_track_selector(stream):
+    # ffmpeg counts streams of a type from 0, mkvpropedit from 1.
+    codec_type, _, number = stream.partition(':')
+    return f'track:{codec_type}{int(number or 0) + 1}'
+
+
+def get_track_args(tracks):
+    args = []
+    for track in tracks:
+        properties = []
+        for key, name in TRACK_PROPERTIES.items():
+            if key not in track:
+                continue
+            value = track[key]
+            if key == 'default':
+                value = '1' if value else '0'
+            properties += ['--set', f'{name}={value}']
+        if properties:
+            args += ['--edit', get_track_selector(track['stream'])] + properties
+    return args
+
+
+def get_attachment_uids(file_info, names):
+    attachments = {}
+    for attachment in file_info.get('attachments', []):
+        attachments.setdefault(attachment.get('file_name'), []).append(attachment['properties']['uid'])
+    uids = []
+    for name in names:
+        matches = attachments.get(name, [])
+        if not matches:
+            raise RuntimeError(f"В файле нет вложения {name}")
+        if len(matches) > 1:
+            raise RuntimeError(f"В файле несколько вложений с именем {name}")
+        uids.append(matches[0])
+    return uids
+
+
+def get_attachment_args(file_info, add=(), replace=(), remove=()):
+    args = []
+    # A replaced font is deleted by UID and added again, so paths never have to be escaped in selectors.
+    for uid in get_attachment_uids(file_info, list(remove) + [os.path.basename(path) for path in replace]):
+        args += ['--delete-attachment', f'={uid}']
+    for path in list(replace) + list(add):
+        args += ['--attachment-name', os.path.basename(path), '--attachment-mime-type', get_mime_type(path),
+                 '--add-attachment', path]
+    return args
+
+
+def edit_mkv(file_path, log, tracks=(), add=(), replace=(), remove=()):
+    cmd = [mkvpropedit, file_path] + get_track_args(tracks)
+    if add or replace or remove:
+        cmd += get_attachment_args(identify(file_path), add, replace, remove)
+    if len(cmd) == 2:
+        log("Нет изменений для записи в заголовок")
+        return
+    return_code, output, errors = run_capture(cmd, stage_timeouts.get('edit'))
+    for line in output.splitlines():
+        if line.strip():
+            log(line.strip())
+    if return_code > 1:
+        raise subprocess.CalledProcessError(return_code, cmd, output, errors)
+    log(f"Заголовок обновлён: {file_path}")
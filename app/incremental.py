@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import logging
+from app.probe import cached
+from app.fonts import load_font_info
+
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 2
+INPUT_KEYS = ('input_file', 'additional_audio', 'subtitle_signs', 'subtitle_full')
+FULL_HASH_LIMIT = 64 * 1024 * 1024
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 1024 * 1024
+
+
+def hash_content(file_path):
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(file_path, 'rb') as input_file:
+        if size <= FULL_HASH_LIMIT:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        else:
+            # Large media files are sampled: any remux or re-encode changes the size or the sampled blocks.
+            step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+            for number in range(SAMPLE_COUNT):
+                input_file.seek(number * step)
+                digest.update(input_file.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def get_fingerprint(file_path):
+    return {'size': os.path.getsize(file_path), 'hash': cached(file_path, 'fingerprint', hash_content)}
+
+
+def get_output_record(output_file):
+    stat = os.stat(output_file)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def create_manifest(inputs, font_infos, options, layout):
+    return {
+        'version': MANIFEST_VERSION,
+        'inputs': {key: get_fingerprint(inputs[key]) for key in INPUT_KEYS},
+        'fonts': sorted([info['hash'], os.path.basename(info['path'])] for info in font_infos),
+        'options': options,
+        'tracks': layout,
+    }
+
+
+def read_manifest(output_file):
+    try:
+        with open(output_file + MANIFEST_SUFFIX, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def write_manifest(output_file, manifest):
+    manifest = dict(manifest, output=get_output_record(output_file))
+    temp_path = f"{output_file}{MANIFEST_SUFFIX}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, output_file + MANIFEST_SUFFIX)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить манифест сборки: {e}")
+
+
+def remove_manifest(output_file):
+    if os.path.exists(output_file + MANIFEST_SUFFIX):
+        os.remove(output_file + MANIFEST_SUFFIX)
+
+
+def apply_edit(manifest, tracks=(), add=(), replace=(), remove=()):
+    # A header edit changes the file the manifest describes, the next build compares its own layout and fonts with this.
+    layout = {track['stream']: dict(track) for track in manifest['tracks']}
+    for track in tracks:
+        layout.setdefault(track['stream'], {'stream': track['stream']}).update(track)
+    removed = set(remove) | {os.path.basename(path) for path in replace}
+    fonts = [[font_hash, name] for font_hash, name in manifest['fonts'] if name not in removed]
+    fonts += [[load_font_info(path)['hash'], os.path.basename(path)] for path in list(replace) + list(add)]
+    return dict(manifest, tracks=list(layout.values()), fonts=sorted(fonts))
+
+
+def get_font_changes(previous, manifest, font_infos):
+    current = {font_hash for font_hash, _ in manifest['fonts']}
+    known = {font_hash for font_hash, _ in previous['fonts']}
+    removed = [name for font_hash, name in previous['fonts'] if font_hash not in current]
+    added = [info['path'] for info in font_infos if info['hash'] not in known]
+    return added, removed
+
+
+def get_changes(output_file, previous, manifest):
+    if previous is None or not os.path.isfile(output_file):
+        return None
+    if previous.get('output') != get_output_record(output_file):
+        return None
+    if previous['options'] != manifest['options']:
+        return None
+    if any(previous['inputs'].get(key) != manifest['inputs'][key] for key in ('input_file', 'additional_audio')):
+        return None
+    changes = set()
+    if any(previous['inputs'].get(key) != manifest['inputs'][key] for key in ('subtitle_signs', 'subtitle_full')):
+        changes.add('subtitles')
+    if previous['fonts'] != manifest['fonts']:
+        changes.add('fonts')
+    if previous['tracks'] != manifest['tracks']:
+        changes.add('tracks')
+    return changes
@@ -0,0 +1,221 @@
+import os
+import json
+import shlex
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from app import engine
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SAMPLE_INTERVAL = 0.5
+REPORT_SUFFIX = '.report.json'
+TRACE_SUFFIX = '.trace.json'
+
+_local = threading.local()
+
+
+def read_proc_stats(pid):
+    stats = {}
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        stats['cpu_user'] = int(fields[11]) / ticks
+        stats['cpu_system'] = int(fields[12]) / ticks
+        with open(f'/proc/{pid}/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    stats['peak_rss'] = int(line.split()[1]) * 1024
+        with open(f'/proc/{pid}/io') as io_file:
+            for line in io_file:
+                key, _, value = line.partition(':')
+                if key in ('read_bytes', 'write_bytes'):
+                    stats[key] = int(value)
+    except (OSError, ValueError, IndexError):
+        pass
+    return stats
+
+
+def read_process_stats(pid):
+    if psutil is None:
+        return read_proc_stats(pid)
+    stats = {}
+    try:
+        process = psutil.Process(pid)
+        with process.oneshot():
+            cpu = process.cpu_times()
+            stats['cpu_user'] = cpu.user
+            stats['cpu_system'] = cpu.system
+            memory = process.memory_info()
+            stats['peak_rss'] = getattr(memory, 'peak_wset', memory.rss)
+            io = process.io_counters()
+            stats['read_bytes'] = io.read_bytes
+            stats['write_bytes'] = io.write_bytes
+    except (psutil.Error, AttributeError, NotImplementedError):
+        pass
+    return stats
+
+
+class ProcessMonitor:
+    def __init__(self, trace, process, cmd, stage):
+        self.trace = trace
+        self.process = process
+        program = cmd[0] if isinstance(cmd, list) else shlex.split(cmd, posix=False)[0].strip('"')
+        self.name = os.path.basename(program)
+        self.stage = stage
+        self.start = time.perf_counter()
+        self.last_sample = 0.0
+        self.stats = {}
+
+    def sample(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_sample < SAMPLE_INTERVAL:
+            return
+        self.last_sample = now
+        stats = read_process_stats(self.process.pid)
+        peak_rss = max(self.stats.get('peak_rss', 0), stats.get('peak_rss', 0))
+        self.stats.update(stats)
+        if peak_rss:
+            self.stats['peak_rss'] = peak_rss
+
+    def finish(self, return_code):
+        self.trace.add_event(self.name, 'process', self.start, time.perf_counter(),
+                             dict(self.stats, stage=self.stage, pid=self.process.pid, return_code=return_code))
+
+
+class Trace:
+    def __init__(self, job):
+        self.job = job
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.stages = []
+
+    def add_event(self, name, category, start, end, args=None):
+        with self.lock:
+            self.events.append({
+                'name': name,
+                'category': category,
+                'start': start - self.origin,
+                'duration': end - start,
+                'thread': threading.get_ident(),
+                'args': args or {},
+            })
+
+    @contextmanager
+    def stage(self, name):
+        self.stages.append(name)
+        start = time.perf_counter()
+        with self.lock:
+            first_event = len(self.events)
+        try:
+            yield
+        finally:
+            self.stages.pop()
+            end = time.perf_counter()
+            # Stages such as probe are entered several times per job, each one counts only its own processes.
+            with self.lock:
+                events = self.events[first_event:]
+            processes = [e for e in events if e['category'] == 'process' and e['args'].get('stage') == name]
+            totals = {key: sum(e['args'].get(key, 0) for e in processes)
+                      for key in ('cpu_user', 'cpu_system', 'read_bytes', 'write_bytes')}
+            totals['peak_rss'] = max((e['args'].get('peak_rss', 0) for e in processes), default=0)
+            self.add_event(name, 'stage', start, end, totals)
+
+    def current_stage(self):
+        return self.stages[-1] if self.stages else None
+
+    def report(self):
+        stages = [e for e in self.events if e['category'] == 'stage']
+        return {
+            'job': self.job,
+            'started': self.started,
+            'wall_time': time.perf_counter() - self.origin,
+            'stages': [{'name': e['name'], 'wall_time': round(e['duration'], 3), **e['args']} for e in stages],
+            'processes': [{'name': e['name'], 'wall_time': round(e['duration'], 3), **e['args']}
+                          for e in self.events if e['category'] == 'process'],
+        }
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        return {'traceEvents': [{
+            'name': e['name'],
+            'cat': e['category'],
+            'ph': 'X',
+            'ts': round(e['start'] * 1000000),
+            'dur': round(e['duration'] * 1000000),
+            'pid': pid,
+            'tid': e['thread'],
+            'args': e['args'],
+        } for e in self.events], 'displayTimeUnit': 'ms'}
+
+    def write(self, output_file):
+        try:
+            with open(output_file + REPORT_SUFFIX, 'w', encoding='utf-8') as report_file:
+                json.dump(self.report(), report_file, ensure_ascii=False, indent=2)
+            with open(output_file + TRACE_SUFFIX, 'w', encoding='utf-8') as trace_file:
+                json.dump(self.chrome_trace(), trace_file, ensure_ascii=False)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить отчёт о времени выполнения: {e}")
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def job_trace(output_file, enabled=True):
+    if not enabled:
+        yield None
+        return
+    trace = Trace(output_file)
+    previous = current()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+        if os.path.isdir(os.path.dirname(os.path.abspath(output_file))):
+            trace.write(output_file)
+
+
+@contextmanager
+def stage(name):
+    trace = current()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def monitor(process, cmd, trace=None):
+    trace = trace or current()
+    if trace is None:
+        return None
+    return ProcessMonitor(trace, process, cmd, trace.current_stage())
+
+
+def run_capture(cmd, timeout=None, trace=None):
+    # Probes run through the job's engine like the mux, with the same timeout and cancellation, and are traced.
+    trace = trace or current()
+    process_monitor = None
+
+    def on_start(process):
+        nonlocal process_monitor
+        process_monitor = monitor(process, cmd, trace)
+
+    def on_eof(process):
+        if process_monitor:
+            process_monitor.sample(force=True)
+
+    return_code, output, errors = engine.run_capture(cmd, timeout, on_start, on_eof)
+    if process_monitor:
+        process_monitor.finish(return_code)
+    return return_code, output, errors
@@ -0,0 +1,91 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from app.config import job_request_timeout, job_poll_interval
+from app.job_server import FINISHED, LOG_LINES_PER_REQUEST
+
+
+class ServerError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def request(server_url, method, path, data=None, timeout=job_request_timeout):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8') if data is not None else None
+    http_request = urllib.request.Request(server_url.rstrip('/') + path, body, method=method,
+                                          headers={'Content-Type': 'application/json; charset=utf-8'})
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8') or 'null')
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read().decode('utf-8'))['error']
+        except (ValueError, KeyError, TypeError):
+            message = f"HTTP {e.code}"
+        raise ServerError(e.code, message)
+
+
+def submit(server_url, params):
+    return request(server_url, 'POST', '/jobs', params)['id']
+
+
+def get_job(server_url, job_id, log_after=None):
+    query = f'?log_after={log_after}' if log_after is not None else ''
+    return request(server_url, 'GET', f'/jobs/{job_id}{query}')
+
+
+def list_jobs(server_url, status=None):
+    return request(server_url, 'GET', '/jobs' + (f'?status={quote(status)}' if status else ''))['jobs']
+
+
+def list_workers(server_url):
+    return request(server_url, 'GET', '/workers')['workers']
+
+
+def cancel(server_url, job_id):
+    return request(server_url, 'POST', f'/jobs/{job_id}/cancel')
+
+
+def claim(server_url, worker):
+    return request(server_url, 'POST', f'/workers/{quote(worker, safe="")}/claim')['job']
+
+
+def heartbeat(server_url, job_id, worker, progress=None, stage=None, lines=()):
+    return request(server_url, 'POST', f'/jobs/{job_id}/heartbeat',
+                   {'worker': worker, 'progress': progress, 'stage': stage, 'log': list(lines)})['cancel']
+
+
+def finish(server_url, job_id, worker, status, error=None, stages=()):
+    return request(server_url, 'POST', f'/jobs/{job_id}/finish',
+                   {'worker': worker, 'status': status, 'error': error, 'stages': list(stages)})
+
+
+def release(server_url, job_id, worker):
+    return request(server_url, 'POST', f'/jobs/{job_id}/release', {'worker': worker})['status']
+
+
+def wait_job(server_url, job_id, progress_callback=None, log=None, poll_interval=job_poll_interval,
+             is_cancelled=None):
+    # Follows a job until it finishes: progress, the lines its worker logged and the cancel request of the caller.
+    log_after = 0
+    cancel_sent = False
+    while True:
+        if is_cancelled and is_cancelled() and not cancel_sent:
+            cancel(server_url, job_id)
+            cancel_sent = True
+        job = get_job(server_url, job_id, log_after)
+        lines = job.pop('log', [])
+        for line in lines:
+            log_after = line['id']
+            if log:
+                log(line['message'])
+        if progress_callback:
+            progress_callback(job['progress'])
+        if len(lines) == LOG_LINES_PER_REQUEST:
+            continue
+        if job['status'] in FINISHED:
+            return job
+        time.sleep(poll_interval)
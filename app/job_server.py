@@ -0,0 +1,394 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from app.config import job_server_host, job_server_port, job_database_path, job_heartbeat_timeout, \
+    job_max_attempts
+
+JOB_PARAMS = ('input_file', 'additional_audio', 'subtitle_signs', 'subtitle_full', 'font_directory', 'output_file')
+JOB_FLAGS = {'is_remove_delay': True, 'is_convert_audio': True}
+FINISHED = ('ok', 'failed', 'cancelled')
+LOG_LINES_PER_REQUEST = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    progress INTEGER NOT NULL DEFAULT 0,
+    stage TEXT,
+    stages TEXT,
+    error TEXT,
+    submitted REAL NOT NULL,
+    started REAL,
+    heartbeat REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS job_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    time REAL NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_log_job ON job_log (job_id, id);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL,
+    job_id INTEGER
+);
+'''
+
+
+def get_job_params(data):
+    if not isinstance(data, dict):
+        raise ValueError("ожидается JSON-объект с параметрами задания")
+    params = {}
+    for key in JOB_PARAMS:
+        value = data.get(key, '' if key == 'font_directory' else None)
+        if not isinstance(value, str) or not value and key != 'font_directory':
+            raise ValueError(f"не указан параметр {key}")
+        params[key] = value
+    for key, default in JOB_FLAGS.items():
+        params[key] = bool(data.get(key, default))
+    return params
+
+
+class JobStore:
+    # One connection behind a lock: the server is the only process that opens the database, workers go through
+    # the HTTP API, so claiming a job never races with another claim.
+    def __init__(self, database_path):
+        directory = os.path.dirname(os.path.abspath(database_path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def to_job(self, row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['stages'] = json.loads(job['stages']) if job['stages'] else []
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def get_row(self, job_id):
+        return self.connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def submit(self, params):
+        with self.lock, self.connection:
+            cursor = self.connection.execute('INSERT INTO jobs (params, status, submitted) VALUES (?, ?, ?)',
+                                             (json.dumps(params, ensure_ascii=False), 'queued', time.time()))
+            return cursor.lastrowid
+
+    def get(self, job_id, log_after=None):
+        with self.lock:
+            row = self.get_row(job_id)
+            if row is None:
+                return None
+            job = self.to_job(row)
+            if log_after is not None:
+                job['log'] = [dict(line) for line in self.connection.execute(
+                    'SELECT id, time, message FROM job_log WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?',
+                    (job_id, log_after, LOG_LINES_PER_REQUEST))]
+            return job
+
+    def list(self, status=None, limit=100):
+        query = 'SELECT * FROM jobs'
+        args = []
+        if status:
+            query += ' WHERE status = ?'
+            args.append(status)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY id DESC LIMIT ?', args + [limit]).fetchall()
+            return [self.to_job(row) for row in rows]
+
+    def workers(self):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute('SELECT * FROM workers ORDER BY name')]
+
+    def touch_worker(self, worker, job_id, now):
+        self.connection.execute('INSERT OR REPLACE INTO workers (name, last_seen, job_id) VALUES (?, ?, ?)',
+                                (worker, now, job_id))
+
+    def claim(self, worker):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            self.touch_worker(worker, row['id'] if row else None, now)
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, progress = 0, stage = NULL, "
+                "started = ?, heartbeat = ? WHERE id = ?", (worker, now, now, row['id']))
+            return self.to_job(self.get_row(row['id']))
+
+    def is_owner(self, row, worker):
+        return row is not None and row['status'] == 'running' and row['worker'] == worker
+
+    def heartbeat(self, job_id, worker, progress=None, stage=None, lines=()):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.get_row(job_id)
+            if not self.is_owner(row, worker):
+                return None
+            self.connection.execute(
+                'UPDATE jobs SET heartbeat = ?, progress = COALESCE(?, progress), stage = COALESCE(?, stage) '
+                'WHERE id = ?', (now, progress, stage, job_id))
+            self.connection.executemany('INSERT INTO job_log (job_id, time, message) VALUES (?, ?, ?)',
+                                        [(job_id, now, str(line)) for line in lines])
+            self.touch_worker(worker, job_id, now)
+            return bool(row['cancel_requested'])
+
+    def finish(self, job_id, worker, status, error=None, stages=()):
+        if status not in FINISHED:
+            raise ValueError(f"неизвестный статус задания: {status}")
+        now = time.time()
+        with self.lock, self.connection:
+            if not self.is_owner(self.get_row(job_id), worker):
+                return False
+            self.connection.execute(
+                'UPDATE jobs SET status = ?, error = ?, stages = ?, finished = ?, heartbeat = ?, stage = NULL, '
+                'progress = CASE WHEN ? THEN 100 ELSE progress END WHERE id = ?',
+                (status, error, json.dumps(list(stages), ensure_ascii=False), now, now, status == 'ok', job_id))
+            self.touch_worker(worker, None, now)
+            return True
+
+    def release(self, job_id, worker):
+        # A worker that shuts down gives its job back right away instead of letting it wait for the timeout.
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.get_row(job_id)
+            if not self.is_owner(row, worker):
+                return None
+            if row['cancel_requested']:
+                status = 'cancelled'
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'cancelled', error = ?, worker = NULL, stage = NULL, finished = ? "
+                    "WHERE id = ?", ("Задание отменено, исполнитель остановлен", now, job_id))
+            else:
+                status = 'queued'
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, attempts = attempts - 1, stage = NULL "
+                    "WHERE id = ?", (job_id,))
+            self.connection.execute('DELETE FROM workers WHERE name = ?', (worker,))
+            return status
+
+    def cancel(self, job_id):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.get_row(job_id)
+            if row is None:
+                return None
+            if row['status'] == 'queued':
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'cancelled', error = ?, finished = ? WHERE id = ?",
+                    ("Задание отменено до запуска", now, job_id))
+            elif row['status'] == 'running':
+                self.connection.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+            return self.to_job(self.get_row(job_id))
+
+    def requeue_dead(self, timeout=job_heartbeat_timeout, max_attempts=job_max_attempts):
+        now = time.time()
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND heartbeat < ?", (now - timeout,)).fetchall()
+            requeued = []
+            for row in rows:
+                if row['cancel_requested']:
+                    status, error = 'cancelled', "Задание отменено, исполнитель не ответил"
+                elif row['attempts'] >= max_attempts:
+                    status, error = 'failed', f"Исполнитель не отвечает, попыток: {row['attempts']}"
+                else:
+                    status, error = 'queued', None
+                self.connection.execute(
+                    'UPDATE jobs SET status = ?, error = ?, worker = NULL, stage = NULL, finished = ? WHERE id = ?',
+                    (status, error, None if status == 'queued' else now, row['id']))
+                self.connection.execute('DELETE FROM workers WHERE name = ?', (row['worker'],))
+                requeued.append((row['id'], row['worker'], status))
+            return requeued
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    routes = [
+        ('GET', re.compile(r'/jobs'), 'list_jobs'),
+        ('POST', re.compile(r'/jobs'), 'submit_job'),
+        ('GET', re.compile(r'/jobs/(\d+)'), 'get_job'),
+        ('POST', re.compile(r'/jobs/(\d+)/cancel'), 'cancel_job'),
+        ('POST', re.compile(r'/jobs/(\d+)/heartbeat'), 'heartbeat'),
+        ('POST', re.compile(r'/jobs/(\d+)/finish'), 'finish_job'),
+        ('POST', re.compile(r'/jobs/(\d+)/release'), 'release_job'),
+        ('GET', re.compile(r'/workers'), 'list_workers'),
+        ('POST', re.compile(r'/workers/([^/]+)/claim'), 'claim_job'),
+    ]
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        for route_method, pattern, name in self.routes:
+            match = pattern.fullmatch(url.path.rstrip('/'))
+            if route_method == method and match:
+                break
+        else:
+            self.send_json(404, {'error': f"Нет такого адреса: {method} {url.path}"})
+            return
+        try:
+            # Worker names come quoted in the path, heartbeats and results carry them unquoted in JSON.
+            status, data = getattr(self, name)(*[unquote(group) for group in match.groups()])
+        except (ValueError, KeyError, TypeError) as e:
+            status, data = 400, {'error': f"Неверный запрос: {e}"}
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка базы заданий: {e}")
+            status, data = 500, {'error': f"Ошибка базы заданий: {e}"}
+        self.send_json(status, data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def get_query(self, key, default=None):
+        return self.query.get(key, [default])[0]
+
+    def list_jobs(self):
+        return 200, {'jobs': self.store.list(self.get_query('status'), int(self.get_query('limit', 100)))}
+
+    def submit_job(self):
+        params = get_job_params(self.read_json())
+        job_id = self.store.submit(params)
+        self.server.log(f"Задание {job_id} поставлено в очередь: {params['output_file']}")
+        return 201, {'id': job_id}
+
+    def get_job(self, job_id):
+        log_after = self.get_query('log_after')
+        job = self.store.get(int(job_id), int(log_after) if log_after is not None else None)
+        if job is None:
+            return 404, {'error': f"Задание {job_id} не найдено"}
+        return 200, job
+
+    def cancel_job(self, job_id):
+        job = self.store.cancel(int(job_id))
+        if job is None:
+            return 404, {'error': f"Задание {job_id} не найдено"}
+        self.server.log(f"Отмена задания {job_id}")
+        return 200, job
+
+    def heartbeat(self, job_id):
+        data = self.read_json()
+        cancel = self.store.heartbeat(int(job_id), data['worker'], data.get('progress'), data.get('stage'),
+                                      data.get('log', []))
+        if cancel is None:
+            return 409, {'error': f"Задание {job_id} больше не выполняется исполнителем {data['worker']}"}
+        return 200, {'cancel': cancel}
+
+    def finish_job(self, job_id):
+        data = self.read_json()
+        if not self.store.finish(int(job_id), data['worker'], data['status'], data.get('error'),
+                                 data.get('stages', [])):
+            return 409, {'error': f"Задание {job_id} больше не выполняется исполнителем {data['worker']}"}
+        self.server.log(f"Задание {job_id}: {data['status']}" + (f" ({data['error']})" if data.get('error') else ''))
+        return 200, {'id': int(job_id)}
+
+    def release_job(self, job_id):
+        data = self.read_json()
+        status = self.store.release(int(job_id), data['worker'])
+        if status is None:
+            return 409, {'error': f"Задание {job_id} больше не выполняется исполнителем {data['worker']}"}
+        if status == 'queued':
+            self.server.log(f"Задание {job_id} возвращено в очередь исполнителем {data['worker']}")
+        else:
+            self.server.log(f"Задание {job_id} отменено, исполнитель {data['worker']} остановлен")
+        return 200, {'id': int(job_id), 'status': status}
+
+    def list_workers(self):
+        return 200, {'workers': self.store.workers()}
+
+    def claim_job(self, worker):
+        job = self.store.claim(worker)
+        if job:
+            self.server.log(f"Задание {job['id']} выдано исполнителю {worker}, попытка {job['attempts']}")
+        return 200, {'job': job}
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store, log, heartbeat_timeout=job_heartbeat_timeout):
+        super().__init__(address, JobRequestHandler)
+        self.store = store
+        self.log = log
+        self.heartbeat_timeout = heartbeat_timeout
+        self.stop_event = threading.Event()
+        self.reaper = threading.Thread(target=self.requeue_dead, name='job-reaper', daemon=True)
+
+    def requeue_dead(self):
+        while not self.stop_event.wait(max(1.0, self.heartbeat_timeout / 3)):
+            try:
+                for job_id, worker, status in self.store.requeue_dead(self.heartbeat_timeout):
+                    self.log(f"Исполнитель {worker} не отвечает, задание {job_id}: "
+                             + ("возвращено в очередь" if status == 'queued' else status))
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка базы заданий: {e}")
+
+    def serve_forever(self, poll_interval=0.5):
+        self.reaper.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.stop_event.set()
+
+    def server_close(self):
+        super().server_close()
+        self.store.close()
+
+
+def create_server(host=job_server_host, port=job_server_port, database_path=job_database_path, log=logging.info,
+                  heartbeat_timeout=job_heartbeat_timeout):
+    server = JobServer((host, port), JobStore(database_path), log, heartbeat_timeout)
+    log(f"Сервер заданий: http://{host}:{server.server_address[1]}, база {database_path}")
+    return server
+
+
+def run_server(host=job_server_host, port=job_server_port, database_path=job_database_path, log=logging.info,
+               heartbeat_timeout=job_heartbeat_timeout):
+    server = create_server(host, port, database_path, log, heartbeat_timeout)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
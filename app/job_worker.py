@@ -0,0 +1,180 @@
+import os
+import re
+import glob
+import time
+import socket
+import logging
+import threading
+from concurrent.futures import wait
+from app.config import job_heartbeat_interval, job_poll_interval
+from app import job_client
+from app.job_client import ServerError
+from app.engine import Engine, JobCancelled, current_job
+from app import instrumentation
+from app.scheduler import get_fixed_path
+
+FINISH_RETRIES = 5
+
+
+def get_worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def get_work_tag(worker, job):
+    return re.sub(r'[^\w-]', '_', f"{worker}-{job['id']}-{job['attempts']}")
+
+
+def remove_attempt_files(output_file, log):
+    # Files of an earlier attempt whose worker died or lost the job; a worker still running can no longer
+    # move its file in place, the server does not accept it as the owner.
+    directory, name = os.path.split(os.path.abspath(output_file))
+    for pattern in (name, get_fixed_path(name)):
+        for path in glob.glob(os.path.join(glob.escape(directory), '.*.' + glob.escape(pattern))):
+            try:
+                os.remove(path)
+                log(f"Удалён файл прошлой попытки: {path}")
+            except OSError as e:
+                log(f"Не удалось удалить файл прошлой попытки {path}: {e}")
+
+
+def execute_job(params, progress_callback, log, work_tag=None, check_owner=None, is_retry=False):
+    from app.media_processor import create_enhanced_mkv
+
+    os.makedirs(os.path.dirname(os.path.abspath(params['output_file'])), exist_ok=True)
+    if is_retry:
+        remove_attempt_files(params['output_file'], log)
+    return create_enhanced_mkv(progress_callback=progress_callback, log=log, work_tag=work_tag,
+                               check_owner=check_owner, **params)
+
+
+class RemoteJob:
+    def __init__(self, server_url, worker, job, log, heartbeat_interval=job_heartbeat_interval):
+        self.server_url = server_url
+        self.heartbeat_interval = heartbeat_interval
+        self.worker = worker
+        self.job = job
+        self.console_log = log
+        self.prefix = f"[{job['id']}] "
+        self.progress = 0
+        self.trace = None
+        self.lock = threading.Lock()
+        self.lines = []
+
+    def progress_callback(self, progress):
+        self.progress = progress
+        # The pipeline reports progress from its own thread at every stage boundary, which is where its trace
+        # is reachable; the heartbeats read the current stage from it later.
+        if self.trace is None:
+            self.trace = instrumentation.current()
+
+    def log(self, message):
+        self.console_log(self.prefix + message)
+        with self.lock:
+            self.lines.append(message)
+
+    def send_heartbeat(self):
+        with self.lock:
+            lines, self.lines = self.lines, []
+        stage = self.trace.current_stage() if self.trace else None
+        try:
+            return job_client.heartbeat(self.server_url, self.job['id'], self.worker, self.progress, stage, lines)
+        except ServerError as e:
+            if e.status == 409:
+                self.console_log(f"{self.prefix}{e}, задание будет остановлено")
+                return True
+            self.console_log(f"{self.prefix}Сервер заданий ответил ошибкой: {e}")
+        except OSError as e:
+            self.console_log(f"{self.prefix}Сервер заданий недоступен: {e}")
+        with self.lock:
+            self.lines = lines + self.lines
+        return False
+
+    def check_owner(self):
+        # Asked right before the output is replaced: after missed heartbeats the job may belong to another worker.
+        for _ in range(FINISH_RETRIES):
+            try:
+                cancel = job_client.heartbeat(self.server_url, self.job['id'], self.worker, self.progress)
+                break
+            except ServerError as e:
+                if e.status == 409:
+                    cancel = True
+                    break
+                self.console_log(f"{self.prefix}Сервер заданий ответил ошибкой: {e}")
+            except OSError as e:
+                self.console_log(f"{self.prefix}Сервер заданий недоступен: {e}")
+            time.sleep(job_poll_interval)
+        else:
+            cancel = True
+        if cancel:
+            current_job().cancel()
+            raise JobCancelled(f"Задание {self.job['id']} отменено или передано другому исполнителю")
+
+    def send_result(self, status, error):
+        stages = self.trace.report()['stages'] if self.trace else []
+        for _ in range(FINISH_RETRIES):
+            try:
+                job_client.finish(self.server_url, self.job['id'], self.worker, status, error, stages)
+                return
+            except ServerError as e:
+                self.console_log(f"{self.prefix}Результат не принят: {e}")
+                return
+            except OSError as e:
+                self.console_log(f"{self.prefix}Не удалось отправить результат: {e}")
+                time.sleep(job_poll_interval)
+
+    def run(self, engine):
+        params = self.job['params']
+        self.console_log(f"{self.prefix}Сборка {params['output_file']}, попытка {self.job['attempts']}")
+        engine_job = engine.submit(execute_job, params, self.progress_callback, self.log,
+                                   get_work_tag(self.worker, self.job), self.check_owner, self.job['attempts'] > 1,
+                                   name=params['output_file'])
+        try:
+            while not wait([engine_job.future], timeout=self.heartbeat_interval).done:
+                if self.send_heartbeat():
+                    engine_job.cancel()
+        except KeyboardInterrupt:
+            engine_job.cancel()
+            wait([engine_job.future])
+            try:
+                if job_client.release(self.server_url, self.job['id'], self.worker) == 'cancelled':
+                    self.console_log(f"{self.prefix}Задание отменено")
+            except (OSError, ServerError) as e:
+                self.console_log(f"{self.prefix}Не удалось вернуть задание в очередь: {e}")
+            raise
+
+        status, error = 'failed', None
+        try:
+            if engine_job.result():
+                status = 'ok'
+            else:
+                error = "Не удалось конвертировать аудиофайл"
+        except JobCancelled as e:
+            status, error = 'cancelled', str(e)
+        except Exception as e:
+            error = str(e)
+        self.send_heartbeat()
+        self.send_result(status, error)
+        self.console_log(f"{self.prefix}{status}" + (f": {error}" if error else ''))
+        return status
+
+
+def run_worker(server_url, name=None, poll_interval=job_poll_interval, log=logging.info, max_jobs=None,
+               heartbeat_interval=job_heartbeat_interval):
+    name = name or get_worker_name()
+    engine = Engine(1)
+    log(f"Исполнитель {name} получает задания с {server_url}")
+    done = 0
+    try:
+        while max_jobs is None or done < max_jobs:
+            try:
+                job = job_client.claim(server_url, name)
+            except (OSError, ServerError) as e:
+                log(f"Сервер заданий недоступен: {e}")
+                job = None
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            RemoteJob(server_url, name, job, log, heartbeat_interval).run(engine)
+            done += 1
+    finally:
+        engine.shutdown(cancel=True)
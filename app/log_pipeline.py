@@ -0,0 +1,61 @@
+import re
+import logging
+import threading
+from collections import deque
+from app.config import log_max_pending
+
+PROGRESS_LINE = re.compile(r'^(?:(?P<stage>[^:|]{1,40}): \d+% \||(?P<ffmpeg>frame=|size=)|(?P<mkvmerge>Progress:))')
+
+
+def get_progress_key(message):
+    match = PROGRESS_LINE.match(message)
+    if not match:
+        return None
+    return match.group('stage') or match.group('ffmpeg') or match.group('mkvmerge')
+
+
+class LogPipeline:
+    def __init__(self, logger=None, max_pending=log_max_pending):
+        self.logger = logger or logging.getLogger()
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.max_pending = max_pending
+        self.progress_index = {}
+        self.dropped = 0
+        self.repeats = 0
+
+    def emit(self, message):
+        message = str(message)
+        self.logger.info(message)
+        key = get_progress_key(message)
+        with self.lock:
+            if key is not None and key in self.progress_index:
+                self.pending[self.progress_index[key]] = message
+                return
+            if self.pending and self.pending[-1] == message:
+                self.repeats += 1
+                return
+            self.flush_repeats()
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.progress_index = {k: i - 1 for k, i in self.progress_index.items() if i > 0}
+                self.dropped += 1
+            self.pending.append(message)
+            if key is not None:
+                self.progress_index[key] = len(self.pending) - 1
+
+    def flush_repeats(self):
+        if self.repeats:
+            self.pending.append(f"(повторено ещё {self.repeats} раз)")
+            self.repeats = 0
+
+    def drain(self):
+        with self.lock:
+            self.flush_repeats()
+            lines = list(self.pending)
+            if self.dropped:
+                lines.insert(0, f"... пропущено строк: {self.dropped} (полный журнал в application.log)")
+                self.dropped = 0
+            self.pending.clear()
+            self.progress_index = {}
+        return lines
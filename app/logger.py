@@ -1,7 +1,8 @@
+import sys
 import logging
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', filename='application.log',
-                    filemode='w')
+                    filemode='w', encoding='utf-8')
 
-logging.getLogger().handlers.clear()
-logging.getLogger().addHandler(logging.StreamHandler())
+if sys.stderr is not None:
+    logging.getLogger().addHandler(logging.StreamHandler(sys.stderr))
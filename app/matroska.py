@@ -0,0 +1,260 @@
+import struct
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+CODEC_DELAY = 0x56AA
+LANGUAGE = 0x22B59C
+NAME = 0x536E
+FLAG_DEFAULT = 0x88
+CLUSTER = 0x1F43B675
+CUES = 0x1C53BB6B
+CLUSTER_TIMESTAMP = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+CLUSTER_CHILDREN = {CLUSTER_TIMESTAMP, SIMPLE_BLOCK, BLOCK_GROUP, 0x5854, 0xA7, 0xAB, 0xAF}
+
+TRACK_TYPES = {1: 'video', 2: 'audio', 17: 'subtitle'}
+UNSIGNED_FIELDS = {TRACK_NUMBER: 'number', TRACK_UID: 'uid', TRACK_TYPE: 'type', CODEC_DELAY: 'codec_delay',
+                   FLAG_DEFAULT: 'default'}
+STRING_FIELDS = {CODEC_ID: 'codec', LANGUAGE: 'language', NAME: 'name'}
+MAX_CLUSTERS = 64
+MAX_SCAN_BYTES = 256 * 1024 * 1024
+
+
+class MatroskaError(Exception):
+    pass
+
+
+class Reader:
+    def __init__(self, file):
+        self.file = file
+        self.bytes_read = 0
+        self.header_position = 0
+
+    def read(self, size):
+        data = self.file.read(size)
+        self.bytes_read += len(data)
+        if len(data) < size:
+            raise MatroskaError("неожиданный конец файла")
+        return data
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, position):
+        self.file.seek(position)
+
+    def read_vint(self, keep_marker=False):
+        first = self.read(1)[0]
+        length = 1
+        mask = 0x80
+        while length <= 8 and not first & mask:
+            length += 1
+            mask >>= 1
+        if length > 8:
+            raise MatroskaError("некорректное число EBML")
+        value = first if keep_marker else first & (mask - 1)
+        unknown = value == mask - 1
+        for byte in self.read(length - 1):
+            value = (value << 8) | byte
+            unknown = unknown and byte == 0xFF
+        return value, length, unknown and not keep_marker
+
+    def read_element_header(self):
+        self.header_position = self.tell()
+        element_id, _, _ = self.read_vint(keep_marker=True)
+        size, _, unknown = self.read_vint()
+        return element_id, None if unknown else size
+
+    def read_unsigned(self, size):
+        return int.from_bytes(self.read(size), 'big') if size else 0
+
+    def read_float(self, size):
+        if size == 4:
+            return struct.unpack('>f', self.read(4))[0]
+        if size == 8:
+            return struct.unpack('>d', self.read(8))[0]
+        raise MatroskaError("некорректная длина числа с плавающей точкой")
+
+    def read_string(self, size):
+        return self.read(size).rstrip(b'\0').decode('utf-8', errors='replace')
+
+    def children(self, end):
+        while end is None or self.tell() < end:
+            try:
+                element_id, size = self.read_element_header()
+            except MatroskaError:
+                if end is None:
+                    return
+                raise
+            start = self.tell()
+            yield element_id, size, start
+            if size is not None:
+                self.seek(start + size)
+
+
+def read_track_entry(reader, end):
+    track = {'codec_delay': 0, 'default': 1, 'language': 'eng', 'name': ''}
+    for element_id, size, _ in reader.children(end):
+        if element_id in UNSIGNED_FIELDS:
+            track[UNSIGNED_FIELDS[element_id]] = reader.read_unsigned(size)
+        elif element_id in STRING_FIELDS:
+            track[STRING_FIELDS[element_id]] = reader.read_string(size)
+    track['type'] = TRACK_TYPES.get(track.get('type'), track.get('type'))
+    track['default'] = bool(track['default'])
+    return track
+
+
+def read_block_track(reader):
+    track_number, _, _ = reader.read_vint()
+    timestamp = struct.unpack('>h', reader.read(2))[0]
+    return track_number, timestamp
+
+
+def read_cluster(reader, end, starts, wanted):
+    # Only block headers are read, payloads are skipped by seeking past them.
+    cluster_timestamp = 0
+    for element_id, size, start in reader.children(end):
+        if end is None and element_id not in CLUSTER_CHILDREN:
+            # A cluster of unknown size ends where the next level 1 element begins.
+            reader.seek(reader.header_position)
+            return
+        if element_id == CLUSTER_TIMESTAMP:
+            cluster_timestamp = reader.read_unsigned(size)
+        elif element_id == SIMPLE_BLOCK:
+            track_number, timestamp = read_block_track(reader)
+            starts.setdefault(track_number, cluster_timestamp + timestamp)
+        elif element_id == BLOCK_GROUP:
+            for child_id, _, _ in reader.children(start + size):
+                if child_id == BLOCK:
+                    track_number, timestamp = read_block_track(reader)
+                    starts.setdefault(track_number, cluster_timestamp + timestamp)
+                    break
+        if all(number in starts for number in wanted):
+            return
+
+
+def open_segment(reader, file_path):
+    element_id, size = reader.read_element_header()
+    if element_id != EBML_HEADER:
+        raise MatroskaError(f"{file_path} не является файлом Matroska")
+    reader.seek(reader.tell() + size)
+    element_id, segment_size = reader.read_element_header()
+    if element_id != SEGMENT:
+        raise MatroskaError(f"{file_path}: не найден сегмент Matroska")
+    segment_start = reader.tell()
+    return segment_start, segment_start + segment_size if segment_size is not None else None
+
+
+def read_tracks(file_path):
+    with open(file_path, 'rb') as media_file:
+        reader = Reader(media_file)
+        segment_start, segment_end = open_segment(reader, file_path)
+
+        timestamp_scale = 1000000
+        tracks = {}
+        starts = {}
+        clusters = 0
+        for element_id, size, start in reader.children(segment_end):
+            if element_id == INFO:
+                for child_id, child_size, _ in reader.children(start + size):
+                    if child_id == TIMESTAMP_SCALE:
+                        timestamp_scale = reader.read_unsigned(child_size)
+            elif element_id == TRACKS:
+                for child_id, child_size, child_start in reader.children(start + size):
+                    if child_id == TRACK_ENTRY:
+                        track = read_track_entry(reader, child_start + child_size)
+                        tracks[track['number']] = track
+            elif element_id == CLUSTER:
+                if not tracks:
+                    raise MatroskaError(f"{file_path}: кластеры раньше описания дорожек")
+                wanted = [number for number, track in tracks.items() if track['type'] in ('video', 'audio')]
+                read_cluster(reader, start + size if size is not None else None, starts, wanted)
+                clusters += 1
+                if all(number in starts for number in wanted):
+                    break
+                if clusters >= MAX_CLUSTERS or start - segment_start > MAX_SCAN_BYTES:
+                    break
+
+        for number, track in tracks.items():
+            track['start'] = starts[number] * timestamp_scale if number in starts else None
+        return {'timestamp_scale': timestamp_scale, 'tracks': sorted(tracks.values(), key=lambda t: t['number']),
+                'bytes_read': reader.bytes_read}
+
+
+def get_delays(file_path):
+    info = read_tracks(file_path)
+    video = next((t for t in info['tracks'] if t['type'] == 'video' and t['start'] is not None), None)
+    video_start = video['start'] if video else 0
+    return [[track['number'], round((track['start'] - video_start) / 1000000)]
+            for track in info['tracks'] if track['type'] == 'audio' and track['start'] is not None]
+
+
+def read_seek_head(reader, end, segment_start):
+    positions = {}
+    for element_id, size, start in reader.children(end):
+        if element_id != SEEK:
+            continue
+        seek_id = position = None
+        for child_id, child_size, _ in reader.children(start + size):
+            if child_id == SEEK_ID:
+                seek_id = reader.read_unsigned(child_size)
+            elif child_id == SEEK_POSITION:
+                position = reader.read_unsigned(child_size)
+        if seek_id is not None and position is not None:
+            positions.setdefault(seek_id, segment_start + position)
+    return positions
+
+
+def read_structure(file_path):
+    # Everything in front of the first cluster, plus the element the seek head points to for the cues.
+    with open(file_path, 'rb') as media_file:
+        reader = Reader(media_file)
+        segment_start, segment_end = open_segment(reader, file_path)
+        structure = {'segment_size': segment_end - segment_start if segment_end is not None else None,
+                     'first_cluster': None, 'duration': None, 'tracks': [], 'cues': False}
+        timestamp_scale = 1000000
+        duration = None
+        positions = {}
+        for element_id, size, start in reader.children(segment_end):
+            if size is None and element_id != CLUSTER:
+                raise MatroskaError(f"{file_path}: элемент неизвестной длины перед кластерами")
+            if element_id == SEEK_HEAD:
+                positions.update(read_seek_head(reader, start + size, segment_start))
+            elif element_id == INFO:
+                for child_id, child_size, _ in reader.children(start + size):
+                    if child_id == TIMESTAMP_SCALE:
+                        timestamp_scale = reader.read_unsigned(child_size)
+                    elif child_id == DURATION:
+                        duration = reader.read_float(child_size)
+            elif element_id == TRACKS:
+                for child_id, child_size, child_start in reader.children(start + size):
+                    if child_id == TRACK_ENTRY:
+                        structure['tracks'].append(read_track_entry(reader, child_start + child_size))
+            elif element_id == CUES:
+                structure['cues'] = size > 0
+            elif element_id == CLUSTER:
+                structure['first_cluster'] = reader.header_position
+                break
+        if duration is not None:
+            structure['duration'] = duration * timestamp_scale / 1000000000
+        if not structure['cues'] and CUES in positions:
+            reader.seek(positions[CUES])
+            element_id, size = reader.read_element_header()
+            structure['cues'] = element_id == CUES and bool(size)
+        structure['bytes_read'] = reader.bytes_read
+        return structure
@@ -1,73 +1,167 @@
 import subprocess
 import os
-import json
-from app.config import ffmpeg_path, ffprobe_path, mkvmerge
-from pymediainfo import MediaInfo
-from app.utils import get_font_files
-
-
-def run_command(cmd, signal_handler):
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
-                               universal_newlines=True, encoding='utf-8')
-    for line in process.stdout:
-        signal_handler.log_message.emit(line.strip())
-    process.stdout.close()
-    return_code = process.wait()
+import logging
+import tempfile
+from contextlib import ExitStack
+from app.config import ffmpeg_path, mkvmerge, single_pass_delay, verify_single_pass_delay, audio_cache_dir, \
+    stream_audio_encode, attach_used_fonts_only, write_trace_reports, preflight_checks, stage_timeouts, \
+    incremental_builds, header_edits, verify_delays_with_mediainfo, write_checksums, check_output_structure, \
+    parallel_audio_encode, parallel_audio_workers, parallel_audio_min_duration
+from app.fonts import select_fonts
+from app import matroska
+from app import checksums
+from app import font_index
+from app.probe import probe_media, cached, run_first_packet
+from app import audio_cache
+from app import parallel_audio
+from app.progress import ProgressTracker, FFMPEG_PROGRESS_ARGS
+from app import instrumentation
+from app.instrumentation import stage
+from app.preflight import run_preflight
+from app import engine
+from app.engine import JobCancelled
+from app import scheduler
+from app import incremental
+from app.tracks import TRACK_LAYOUT, get_metadata_args
+from app.header_edit import edit_mkv
+from app import muxers
+from app.muxers import get_attachment_args, get_mux_inputs, get_output_args
+
+AAC_ENCODE_ARGS = ['-acodec', 'aac', '-ac', '2', '-ar', '48000', '-b:a', '192k']
+# Offsets are written with millisecond precision, so one millisecond of rounding is left on either side.
+DELAY_TOLERANCE_MS = 1
+
+
+def run_command(cmd, log, progress=None, timeout=None, outputs=()):
+    trace = instrumentation.current()
+    process_monitor = None
+
+    def on_start(process):
+        nonlocal process_monitor
+        process_monitor = instrumentation.monitor(process, cmd, trace)
+
+    def on_line(line):
+        if process_monitor:
+            process_monitor.sample()
+        if progress and progress.feed(line):
+            return
+        log(line.strip())
+
+    def on_eof(process):
+        if process_monitor:
+            process_monitor.sample(force=True)
+
+    try:
+        return_code = engine.run_process(cmd, on_line, on_start, timeout, outputs, on_eof)
+    except subprocess.TimeoutExpired:
+        log(f"Превышено время ожидания ({timeout} с): {os.path.basename(cmd[0])}")
+        raise
+    if process_monitor:
+        process_monitor.finish(return_code)
     if return_code:
         raise subprocess.CalledProcessError(return_code, cmd)
+    if progress:
+        progress.finish()
 
 
-def convert_audio_to_aac(input_audio, signal_handler):
-    cmd_probe = [
-        ffprobe_path,
-        '-loglevel', 'error',
-        '-select_streams', 'a:0',
-        '-show_entries', 'stream=codec_name',
-        '-of', 'default=nokey=1:noprint_wrappers=1',
-        input_audio
-    ]
+def get_duration(media):
+    try:
+        return float(media['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-    probe_process = subprocess.Popen(cmd_probe, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                                     encoding='utf-8')
-    codec_name, probe_errors = probe_process.communicate()
 
-    if 'aac' in codec_name.strip():
-        signal_handler.log_message.emit("Входной звук уже в формате AAC. Никакого преобразования не требуется.")
-        return input_audio
+def get_size(media):
+    try:
+        return int(media['format']['size'])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-    output_audio = os.path.splitext(input_audio)[0] + "_converted.aac"
-    cmd_convert = [
-        ffmpeg_path,
-        '-y',
-        '-i', input_audio,
-        '-acodec', 'aac',
-        '-ac', '2',
-        '-ar', '48000',
-        '-b:a', '192k',
-        output_audio
-    ]
-
-    run_command(cmd_convert, signal_handler)
-    return output_audio
 
+def is_aac(media):
+    audio_streams = [s for s in media['streams'] if s['codec_type'] == 'audio']
+    codec_name = audio_streams[0].get('codec_name', '') if audio_streams else ''
+    return 'aac' in codec_name.strip()
 
-def get_stream_indexes(file_path, signal_handler):
-    cmd = [
-        ffprobe_path,
-        '-v', 'error',
-        '-print_format', 'json',
-        '-show_streams',
-        file_path
-    ]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
-                               text=True, encoding='utf-8')
-    output, errors = process.communicate()
 
-    if errors:
-        signal_handler.log_message.emit("Ошибка: " + errors)
+def find_converted_audio(input_audio):
+    if not audio_cache_dir:
+        return None
+    return audio_cache.lookup(audio_cache.get_cache_key(input_audio, AAC_ENCODE_ARGS))
+
+
+def get_audio_work_files(audio_files, log):
+    # Parallel conversion first decodes a track to raw PCM next to the converted file, about 23 MB a minute.
+    if not parallel_audio_encode:
+        return []
+    work_files = []
+    for input_audio in audio_files:
+        if not input_audio or not os.path.isfile(input_audio) or find_converted_audio(input_audio):
+            continue
+        try:
+            media = probe_media(input_audio, log)
+        except (OSError, RuntimeError, ValueError, subprocess.SubprocessError):
+            continue
+        duration = get_duration(media)
+        if is_aac(media) or not duration or duration < parallel_audio_min_duration:
+            continue
+        output_dir = audio_cache_dir if audio_cache_dir else os.path.dirname(os.path.abspath(input_audio))
+        work_files.append((os.path.join(output_dir, os.path.basename(input_audio) + '.pcm'),
+                           parallel_audio.get_pcm_size(duration)))
+    return work_files
+
+
+def convert_audio_to_aac(input_audio, log, media=None, progress_callback=None, start=1, end=10):
+    if media is None:
+        media = probe_media(input_audio, log)
+
+    if is_aac(media):
+        log("Входной звук уже в формате AAC. Никакого преобразования не требуется.")
+        return input_audio
+
+    cache_key = None
+    if audio_cache_dir:
+        cache_key = audio_cache.get_cache_key(input_audio, AAC_ENCODE_ARGS)
+        cached_audio = audio_cache.lookup(cache_key)
+        if cached_audio:
+            log(f"Используется ранее сконвертированное аудио: {cached_audio}")
+            return cached_audio
+        os.makedirs(audio_cache_dir, exist_ok=True)
+        output_audio = audio_cache.get_temp_path(cache_key)
+    else:
+        output_audio = os.path.splitext(input_audio)[0] + "_converted.aac"
+    duration = get_duration(media)
+    progress = None
+    if progress_callback:
+        progress = ProgressTracker("Конвертация аудио", progress_callback, log, start, end, duration, get_size(media))
+    if parallel_audio_encode and duration and duration >= parallel_audio_min_duration:
+        parallel_audio.encode(input_audio, output_audio, AAC_ENCODE_ARGS, log, parallel_audio_workers,
+                              progress.update if progress else None, stage_timeouts.get('audio'))
+        if progress:
+            progress.finish()
+    else:
+        cmd_convert = [
+            ffmpeg_path,
+            '-y',
+            '-i', input_audio,
+        ] + AAC_ENCODE_ARGS + FFMPEG_PROGRESS_ARGS + [
+            output_audio
+        ]
+        run_command(cmd_convert, log, progress, stage_timeouts.get('audio'), [output_audio])
+    if cache_key:
+        output_audio = audio_cache.store(output_audio, cache_key)
+    return output_audio
+
 
-    streams = json.loads(output)['streams']
-    signal_handler.log_message.emit(f"Потоки: {streams}")
+def get_stream_indexes(file_path, log, media=None):
+    if media is None:
+        media = probe_media(file_path, log)
+    streams = media['streams']
+    logging.debug(f"Потоки {file_path}: {streams}")
+    log("Потоки: " + ', '.join(
+        f"{stream['index']}:{stream['codec_type']}/{stream.get('codec_name', '?')}"
+        + (f" ({stream['tags']['language']})" if 'language' in stream.get('tags', {}) else '')
+        for stream in streams))
 
     audio_stream_jpn_index = None
     audio_stream_any_index = None
@@ -82,89 +176,447 @@ def get_stream_indexes(file_path, signal_handler):
             temp_audio_index += 1
 
     audio_stream_index = audio_stream_jpn_index if audio_stream_jpn_index is not None else audio_stream_any_index
-    signal_handler.log_message.emit(f"Индекс аудиопотока: {audio_stream_index}")
+    log(f"Индекс аудиопотока: {audio_stream_index}")
     return audio_stream_index
 
 
-def remove_delay(input_file, signal_handler):
-    rel = {}
-    audio_count = 0
+def get_start_time(media, stream=None, default=None):
+    value = (stream if stream is not None else media['format']).get('start_time')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_codec_delay(stream):
+    # MediaInfo and mkvmerge read raw Matroska block timestamps, which still include the encoder priming
+    # that ffprobe subtracts from start_time.
+    try:
+        return int(stream.get('initial_padding', 0)) / int(stream['sample_rate'])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def get_copied_start(file_path, media, audio_number):
+    # The first packet, not start_time: an MP4 edit list starts the stream at zero while its first packet,
+    # the priming frame, is muxed 21 ms earlier. Raw streams such as ADTS AAC carry no timestamps and start
+    # at zero, ffmpeg moves every other input to start there too.
+    stream = [s for s in media['streams'] if s['codec_type'] == 'audio'][audio_number]
+    first_packet = cached(file_path, f'first_packet a:{audio_number}',
+                          lambda path: run_first_packet(path, f'a:{audio_number}'))
+    if first_packet is None:
+        return None
+    return first_packet - get_start_time(media, default=0.0) + get_codec_delay(stream)
+
+
+def read_encoded_start(file_path, encode_args):
+    fd, temp_path = tempfile.mkstemp(suffix='.mka')
+    os.close(fd)
+    try:
+        cmd = [ffmpeg_path, '-y', '-v', 'error', '-i', file_path, '-map', '0:a:0', '-t', '1'] + encode_args + [
+            '-bitexact', temp_path]
+        return_code, _, errors = instrumentation.run_capture(cmd, stage_timeouts.get('probe'))
+        if return_code:
+            raise RuntimeError(f"Не удалось закодировать начало {file_path}: {errors.strip()}")
+        starts = [track['start'] for track in matroska.read_tracks(temp_path)['tracks']
+                  if track['type'] == 'audio' and track['start'] is not None]
+        return starts[0] / 1000000000 if starts else None
+    finally:
+        engine.remove_files([temp_path])
+
+
+def get_encoded_start(file_path, encode_args):
+    # The encoder's priming and the codec delay the muxer writes for it decide where the track starts, so
+    # the first second is encoded the same way and the start is read from the result.
+    return cached(file_path, 'encoded_start ' + ' '.join(encode_args),
+                  lambda path: read_encoded_start(path, encode_args))
+
+
+def get_audio_shifts(input_file, video_media, audio_file, audio_media, audio_index, encode_args=None):
+    video_streams = [s for s in video_media['streams'] if s['codec_type'] == 'video']
+    audio_streams = [s for s in audio_media['streams'] if s['codec_type'] == 'audio']
+    if not video_streams or audio_index is None or not audio_streams:
+        return None
+    video_offset = get_start_time(video_media)
+    video_start = get_start_time(video_media, video_streams[0])
+    try:
+        original_start = get_copied_start(input_file, video_media, audio_index)
+        additional_start = get_encoded_start(audio_file, encode_args) if encode_args \
+            else get_copied_start(audio_file, audio_media, 0)
+    except (OSError, RuntimeError, ValueError, subprocess.SubprocessError, matroska.MatroskaError) as e:
+        logging.warning(f"Не удалось определить начало звука: {e}")
+        return None
+    if None in (video_offset, video_start, original_start, additional_start):
+        return None
+
+    # ffmpeg shifts every input to start at zero, so the delay of each output track relative to the video
+    # is what MediaInfo would report as delay_relative_to_video on the muxed file.
+    video_out = video_start - video_offset
+    return [video_out - additional_start, video_out - original_start]
+
+
+def read_mediainfo_delays(input_file):
+    from pymediainfo import MediaInfo
+    rel = []
     media_info = MediaInfo.parse(input_file)
     for track in media_info.tracks:
         if track.track_type == 'Audio':
-            rel[track.track_id] = -track.delay_relative_to_video
-            audio_count += 1
-    signal_handler.log_message.emit(f"Detected audio tracks: {audio_count}")
-    if audio_count == 1:
-        audio = ['--sync !num:!rel ']
-    elif audio_count == 2:
-        audio = ['--sync !num:!rel ',
-                 '--sync !num:!rel ']
-    else:
-        audio = ['']
-    params = audio
-    cmd_param = ''
-    param_id = 0
-    for track in rel.keys():
-        repl = str(track - 1).replace('!rel', str(rel.get(track)))
-        cmd_param += params[param_id].replace('!num', repl).replace('!rel', str(rel.get(track)))
-        param_id += 1
-    temp_output = input_file.replace('.mkv', '_fixed.mkv')
-    cmd = f'"{mkvmerge}" -o "{temp_output}" {cmd_param} "{input_file}"'
-    run_command(cmd, signal_handler)
+            rel.append([track.track_id, -track.delay_relative_to_video])
+    return rel
+
+
+def read_output_delays(input_file):
+    try:
+        rel = [[number, -delay] for number, delay in matroska.get_delays(input_file)]
+    except matroska.MatroskaError as e:
+        logging.warning(f"Не удалось прочитать заголовок Matroska, используется MediaInfo: {e}")
+        return read_mediainfo_delays(input_file)
+    if verify_delays_with_mediainfo:
+        expected = read_mediainfo_delays(input_file)
+        if rel != expected:
+            logging.warning(f"Задержки {input_file} расходятся с MediaInfo: {rel} != {expected}")
+    return rel
+
+
+def get_output_delays(input_file):
+    return dict(cached(input_file, 'delays', read_output_delays))
+
+
+def remove_delay(input_file, log, progress_callback=None, start=90, end=100):
+    rel = get_output_delays(input_file)
+    audio_count = len(rel)
+    log(f"Detected audio tracks: {audio_count}")
+    sync_args = []
+    for track, delay in rel.items():
+        sync_args += ['--sync', f'{track - 1}:{delay}']
+    temp_output = scheduler.get_fixed_path(input_file)
+    cmd = [mkvmerge, '-o', temp_output] + sync_args + [input_file]
+    progress = None
+    if progress_callback:
+        progress = ProgressTracker("Удаление задержки", progress_callback, log, start, end,
+                                   input_size=os.path.getsize(input_file))
+    run_command(cmd, log, progress, stage_timeouts.get('delay'), [temp_output])
 
     if os.path.exists(input_file):
         os.remove(input_file)
     os.rename(temp_output, input_file)
 
 
+def get_font_infos(font_directory, subtitle_paths, log):
+    if not font_directory or not subtitle_paths:
+        return []
+    font_infos = font_index.get_fonts(font_directory)
+    if attach_used_fonts_only:
+        font_infos = select_fonts(font_infos, subtitle_paths, log)
+    return font_infos
+
+
+def check_output(work_file, output_file, hasher=None, track_count=None, duration=None):
+    if not write_checksums and not check_output_structure:
+        return None
+    with stage('checksums'):
+        result = checksums.verify_output(work_file, hasher, track_count, duration, write_checksums,
+                                         check_output_structure)
+    errors = result.get('structure', {}).get('errors')
+    if errors:
+        raise RuntimeError(f"Проверка структуры {output_file} не пройдена: {'; '.join(errors)}")
+    return result
+
+
+def get_residual_delays(file_path):
+    return {track: delay for track, delay in get_output_delays(file_path).items()
+            if abs(delay) > DELAY_TOLERANCE_MS}
+
+
+def finish_output(work_file, output_file, manifest, is_remove_delay, delay_fixed, progress_callback, log,
+                  start=90, end=100, hasher=None, track_count=None, duration=None, check_owner=None):
+    if is_remove_delay and delay_fixed and verify_single_pass_delay:
+        with stage('verify'):
+            residual = get_residual_delays(work_file)
+        if residual:
+            log(f"Остаточная задержка после сборки, мс: {residual}, будет выполнен второй проход")
+            delay_fixed = False
+    if is_remove_delay and not delay_fixed:
+        log(f"Удаление задержки для: {work_file}")
+        with stage('delay'), scheduler.io_slot([work_file], log):
+            remove_delay(work_file, log, progress_callback, start, end)
+    # The two-pass delay removal rewrites the file, so the hashes of the mux output no longer apply.
+    result = check_output(work_file, output_file, hasher if delay_fixed or not is_remove_delay else None,
+                          track_count, duration)
+    if work_file != output_file:
+        if check_owner:
+            check_owner()
+        with stage('move'), scheduler.io_slot([work_file, output_file], log):
+            scheduler.move_output(work_file, output_file)
+    if result:
+        checksums.write_sidecar(output_file, result)
+    if manifest:
+        incremental.write_manifest(output_file, manifest)
+
+
+def update_enhanced_mkv(output_file, subtitle_signs, subtitle_full, font_infos, changes, progress_callback,
+                        log):
+    log(f"Изменились: {', '.join(sorted(changes))}, пересборка из готового файла")
+    temp_output = scheduler.create_update_path(output_file)
+    cmd = [ffmpeg_path, '-y', '-i', output_file]
+    maps = ['-map', '0:v', '-map', '0:a']
+    if 'subtitles' in changes:
+        cmd += ['-i', subtitle_signs, '-i', subtitle_full]
+        maps += ['-map', '1:s:0', '-map', '2:s:0']
+    else:
+        maps += ['-map', '0:s']
+    if 'fonts' in changes:
+        cmd += get_attachment_args(font_infos)
+    else:
+        maps += ['-map', '0:t?']
+    cmd += maps + get_metadata_args(TRACK_LAYOUT) + ['-c', 'copy', '-bitexact'] + FFMPEG_PROGRESS_ARGS + [temp_output]
+    progress = ProgressTracker("Обновление MKV", progress_callback, log, 20, 99,
+                               input_size=os.path.getsize(output_file))
+    with stage('update'), scheduler.io_slot([output_file], log):
+        try:
+            run_command(cmd, log, progress, stage_timeouts.get('mux'), [temp_output])
+            os.replace(temp_output, output_file)
+        finally:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+
+def apply_changes(output_file, subtitle_signs, subtitle_full, font_infos, changes, previous, manifest,
+                  progress_callback, log):
+    if header_edits and changes <= {'tracks', 'fonts'}:
+        added, removed = incremental.get_font_changes(previous, manifest, font_infos) if 'fonts' in changes \
+            else ([], [])
+        try:
+            with stage('edit'):
+                edit_mkv(output_file, log, TRACK_LAYOUT if 'tracks' in changes else (), added,
+                         remove=removed)
+            return
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            log(f"Не удалось изменить заголовок через mkvpropedit: {e}")
+    update_enhanced_mkv(output_file, subtitle_signs, subtitle_full, font_infos, changes, progress_callback,
+                        log)
+
+
 def create_enhanced_mkv(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory, output_file,
-                        is_remove_delay, is_convert_audio, progress_callback, signal_handler):
+                        is_remove_delay, is_convert_audio, progress_callback, log,
+                        is_stream_audio=stream_audio_encode, work_tag=None, check_owner=None):
+    with instrumentation.job_trace(output_file, write_trace_reports), audio_cache.pinned():
+        return build_enhanced_mkv(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory,
+                                  output_file, is_remove_delay, is_convert_audio, progress_callback, log,
+                                  is_stream_audio, work_tag, check_owner)
+
+
+def build_enhanced_mkv(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory, output_file,
+                       is_remove_delay, is_convert_audio, progress_callback, log, is_stream_audio, work_tag,
+                       check_owner):
+    if preflight_checks:
+        with stage('preflight'):
+            work_files = get_audio_work_files([additional_audio], log) \
+                if is_convert_audio and not is_stream_audio else []
+            run_preflight(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory, output_file,
+                          log, is_remove_delay and not single_pass_delay, work_files=work_files)
+    with stage('fonts'):
+        font_infos = get_font_infos(font_directory, [subtitle_signs, subtitle_full], log)
+
+    manifest = None
+    if incremental_builds:
+        with stage('manifest'):
+            manifest = incremental.create_manifest(
+                {'input_file': input_file, 'additional_audio': additional_audio,
+                 'subtitle_signs': subtitle_signs, 'subtitle_full': subtitle_full},
+                font_infos,
+                {'is_remove_delay': is_remove_delay, 'is_convert_audio': is_convert_audio,
+                 'is_stream_audio': is_stream_audio, 'audio_encode_args': AAC_ENCODE_ARGS},
+                TRACK_LAYOUT)
+            previous = incremental.read_manifest(output_file)
+            changes = incremental.get_changes(output_file, previous, manifest)
+        if changes is not None:
+            if changes:
+                if check_owner:
+                    check_owner()
+                apply_changes(output_file, subtitle_signs, subtitle_full, font_infos, changes, previous, manifest,
+                              progress_callback, log)
+                result = check_output(output_file, output_file, track_count=len(TRACK_LAYOUT))
+                if result:
+                    checksums.write_sidecar(output_file, result)
+                incremental.write_manifest(output_file, manifest)
+            else:
+                log(f"Входные файлы не изменились, сборка не нужна: {output_file}")
+            progress_callback(100)
+            return output_file
+        incremental.remove_manifest(output_file)
+
+    encoded_sources = []
     try:
         progress_callback(1)
         if is_convert_audio:
-            additional_audio = convert_audio_to_aac(additional_audio, signal_handler)
-        progress_callback(5)
+            with stage('probe'):
+                audio_media = probe_media(additional_audio, log)
+            if is_stream_audio and not is_aac(audio_media) and not find_converted_audio(additional_audio):
+                log("Аудио будет сконвертировано в AAC во время сборки")
+                encoded_sources = ['a:0']
+            else:
+                with stage('audio'), scheduler.cpu_slot(log):
+                    additional_audio = convert_audio_to_aac(additional_audio, log, audio_media,
+                                                            progress_callback, 1, 10)
+        progress_callback(10)
+    except JobCancelled:
+        raise
     except Exception as e:
-        signal_handler.log_message.emit(f"Не удалось конвертировать аудиофайл: {e}")
+        log(f"Не удалось конвертировать аудиофайл: {e}")
         return
 
-    audio_index = get_stream_indexes(input_file, signal_handler)
-    progress_callback(10)
-    cmd = [ffmpeg_path, '-y']
-
-    cmd += [
-        '-i', input_file,
-        '-i', additional_audio,
-        '-i', subtitle_signs,
-        '-i', subtitle_full
-    ]
-    progress_callback(15)
-    if font_directory:
-        font_files = get_font_files(font_directory)
-        for font_file in font_files:
-            cmd += ['-attach', font_file, '-metadata:s:t', 'mimetype=application/x-truetype-font']
-    progress_callback(30)
-    cmd += [
-        '-map', '0:v',
-        '-map', '1:a:0',
-        '-map', f'0:a:{audio_index}',
-        '-map', '2:s:0',
-        '-map', '3:s:0',
-        '-metadata:s:v:0', 'language=jpn', '-metadata:s:v:0', 'title=Original', '-disposition:v:0', 'default',
-        '-metadata:s:a:0', 'language=rus', '-metadata:s:a:0', 'title=AniLibria', '-disposition:a:0', 'default',
-        '-metadata:s:a:1', 'language=jpn', '-metadata:s:a:1', 'title=Original', '-disposition:a:1', '0',
-        '-metadata:s:s:0', 'language=rus', '-metadata:s:s:0', 'title=Надписи', '-disposition:s:0', 'default',
-        '-metadata:s:s:1', 'language=rus', '-metadata:s:s:1', 'title=Субтитры', '-disposition:s:1', '0',
-        '-c', 'copy',
-        '-bitexact',
-        output_file
-    ]
-    progress_callback(40)
-    run_command(cmd, signal_handler)
-    progress_callback(90)
-
-    if is_remove_delay:
-        signal_handler.log_message.emit(f"Удаление задержки для: {output_file}")
-        remove_delay(output_file, signal_handler)
+    work_file = scheduler.get_work_path(output_file, work_tag)
+    with stage('probe'):
+        video_media = probe_media(input_file, log)
+        audio_index = get_stream_indexes(input_file, log, video_media)
+        job = {
+            'input_file': input_file,
+            'audio_files': [additional_audio],
+            'subtitle_signs': subtitle_signs,
+            'subtitle_full': subtitle_full,
+            'layout': TRACK_LAYOUT,
+            'font_infos': font_infos,
+            'audio_index': audio_index,
+            'shifts': [0.0, 0.0],
+            'encoded_sources': encoded_sources,
+            'encode_args': AAC_ENCODE_ARGS,
+        }
+        delay_fixed = False
+        if is_remove_delay and single_pass_delay:
+            predicted = get_audio_shifts(input_file, video_media, additional_audio,
+                                         probe_media(additional_audio, log), audio_index,
+                                         AAC_ENCODE_ARGS if encoded_sources else None)
+            if predicted is None:
+                log("Не удалось определить задержку до сборки, будет выполнен второй проход")
+            else:
+                log(f"Сдвиг аудиодорожек, мс: {', '.join(str(round(shift * 1000)) for shift in predicted)}")
+                job['shifts'] = predicted
+                delay_fixed = True
+    if work_file != output_file:
+        log(f"Сборка во временный файл: {work_file}")
+    progress_callback(12)
+    cmd = muxers.get_ffmpeg_command(job, work_file)
+    progress_callback(20)
+    mux_end = 90 if is_remove_delay and not delay_fixed else 99
+    input_size = sum(os.path.getsize(path) for path in (input_file, additional_audio, subtitle_signs, subtitle_full))
+    progress = ProgressTracker("Сборка MKV", progress_callback, log, 20, mux_end,
+                               get_duration(video_media), input_size)
+    with stage('mux'), ExitStack() as slots:
+        if encoded_sources:
+            slots.enter_context(scheduler.cpu_slot(log))
+        slots.enter_context(scheduler.io_slot([input_file, additional_audio, work_file], log))
+        hasher = slots.enter_context(checksums.follow(work_file, write_checksums))
+        run_command(cmd, log, progress, stage_timeouts.get('mux'), [work_file])
+    progress_callback(mux_end)
+
+    finish_output(work_file, output_file, manifest, is_remove_delay, delay_fixed, progress_callback, log,
+                  mux_end, 100, hasher, len(TRACK_LAYOUT), get_duration(video_media), check_owner)
+    progress_callback(100)
+    return output_file
+
+
+def create_variant_mkvs(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory, variants,
+                        is_remove_delay, is_convert_audio, progress_callback, log, extra_audio=()):
+    with instrumentation.job_trace(variants[0]['output_file'], write_trace_reports), audio_cache.pinned():
+        return build_variant_mkvs(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory,
+                                  variants, is_remove_delay, is_convert_audio, progress_callback, log,
+                                  list(extra_audio))
+
+
+def build_variant_mkvs(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory, variants,
+                       is_remove_delay, is_convert_audio, progress_callback, log, extra_audio):
+    output_files = [variant['output_file'] for variant in variants]
+    if preflight_checks:
+        with stage('preflight'):
+            run_preflight(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory,
+                          output_files[0], log, is_remove_delay and not single_pass_delay, extra_audio,
+                          output_files[1:],
+                          get_audio_work_files([additional_audio] + extra_audio, log) if is_convert_audio else [])
+    subtitles = {'s:0': subtitle_signs, 's:1': subtitle_full}
+    with stage('fonts'):
+        font_infos = [get_font_infos(font_directory, [subtitles[track['source']] for track in variant['tracks']
+                                                      if track['source'] in subtitles], log)
+                      for variant in variants]
+
+    pending = []
+    with stage('manifest'):
+        if incremental_builds:
+            options = {'is_remove_delay': is_remove_delay, 'is_convert_audio': is_convert_audio,
+                       'audio_encode_args': AAC_ENCODE_ARGS,
+                       'extra_audio': [incremental.get_fingerprint(path) for path in extra_audio]}
+        for variant, fonts in zip(variants, font_infos):
+            manifest = None
+            if incremental_builds:
+                manifest = incremental.create_manifest(
+                    {'input_file': input_file, 'additional_audio': additional_audio,
+                     'subtitle_signs': subtitle_signs, 'subtitle_full': subtitle_full},
+                    fonts, options, variant['tracks'])
+                previous = incremental.read_manifest(variant['output_file'])
+                if incremental.get_changes(variant['output_file'], previous, manifest) == set():
+                    log(f"Входные файлы не изменились, сборка не нужна: {variant['output_file']}")
+                    continue
+                incremental.remove_manifest(variant['output_file'])
+            pending.append((variant, fonts, manifest))
+    if not pending:
+        progress_callback(100)
+        return output_files
+
+    # Every variant is written by the same ffmpeg run, so the audio is converted once up front instead of
+    # being encoded again for each output.
+    audio_files = [additional_audio] + extra_audio
+    try:
+        progress_callback(1)
+        if is_convert_audio:
+            with stage('audio'), scheduler.cpu_slot(log):
+                audio_files = [convert_audio_to_aac(path, log, None, progress_callback, 1, 10)
+                               for path in audio_files]
+        progress_callback(10)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        log(f"Не удалось конвертировать аудиофайл: {e}")
+        return
+
+    with stage('probe'):
+        video_media = probe_media(input_file, log)
+        audio_index = get_stream_indexes(input_file, log, video_media)
+        shifts = [0.0] * (len(audio_files) + 1)
+        delay_fixed = False
+        if is_remove_delay and single_pass_delay:
+            predicted = [get_audio_shifts(input_file, video_media, path, probe_media(path, log), audio_index)
+                         for path in audio_files]
+            if None in predicted:
+                log("Не удалось определить задержку до сборки, будет выполнен второй проход")
+            else:
+                shifts = predicted[0] + [shift[0] for shift in predicted[1:]]
+                log(f"Сдвиг аудиодорожек, мс: {', '.join(str(round(shift * 1000)) for shift in shifts)}")
+                delay_fixed = True
+    work_files = [scheduler.get_scratch_path(variant['output_file']) or variant['output_file']
+                  for variant, _, _ in pending]
+    progress_callback(12)
+    input_args, sources = get_mux_inputs(input_file, audio_files, subtitle_signs, subtitle_full, shifts,
+                                         audio_index)
+    cmd = [ffmpeg_path, '-y'] + input_args + FFMPEG_PROGRESS_ARGS
+    for (variant, fonts, _), work_file in zip(pending, work_files):
+        cmd += get_output_args(variant['tracks'], sources, fonts) + [work_file]
+    log(f"Сборка вариантов за одно чтение исходника: {', '.join(variant['name'] for variant, _, _ in pending)}")
+    progress_callback(20)
+
+    mux_end = 90 if is_remove_delay and not delay_fixed else 99
+    input_size = sum(os.path.getsize(path) for path in [input_file, subtitle_signs, subtitle_full] + audio_files)
+    progress = ProgressTracker("Сборка MKV", progress_callback, log, 20, mux_end,
+                               get_duration(video_media), input_size)
+    with stage('mux'), ExitStack() as slots:
+        slots.enter_context(scheduler.io_slot([input_file] + audio_files + work_files, log))
+        hashers = [slots.enter_context(checksums.follow(work_file, write_checksums)) for work_file in work_files]
+        run_command(cmd, log, progress, stage_timeouts.get('mux'), work_files)
+    progress_callback(mux_end)
+
+    step = (100 - mux_end) / len(pending)
+    for number, ((variant, _, manifest), work_file, hasher) in enumerate(zip(pending, work_files, hashers)):
+        finish_output(work_file, variant['output_file'], manifest, is_remove_delay, delay_fixed, progress_callback,
+                      log, round(mux_end + number * step), round(mux_end + (number + 1) * step),
+                      hasher, len(variant['tracks']), get_duration(video_media))
     progress_callback(100)
+    return output_files
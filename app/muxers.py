@@ -0,0 +1,72 @@
+from app.config import ffmpeg_path
+from app.progress import FFMPEG_PROGRESS_ARGS
+from app.tracks import get_metadata_args
+
+
+def get_offset_args(shift):
+    # Matroska stores timestamps in milliseconds, smaller shifts would be lost anyway.
+    if abs(shift) < 0.001:
+        return []
+    return ['-itsoffset', f'{shift:.3f}']
+
+
+def get_attachment_args(font_infos):
+    args = []
+    for info in font_infos:
+        args += ['-attach', info['path'], '-metadata:s:t', f"mimetype={info['mime']}"]
+    return args
+
+
+def get_stream_encode_args(stream, encode_args):
+    args = []
+    for option, value in zip(encode_args[::2], encode_args[1::2]):
+        option = {'-acodec': '-c', '-b:a': '-b'}.get(option, option)
+        args += [f'{option}:{stream}', value]
+    return args
+
+
+def get_mux_inputs(input_file, audio_files, subtitle_signs, subtitle_full, shifts, audio_index):
+    args = [
+        '-i', input_file,
+    ] + get_offset_args(shifts[0]) + [
+        '-i', audio_files[0],
+        '-i', subtitle_signs,
+        '-i', subtitle_full
+    ]
+    original_audio_input = 0
+    if get_offset_args(shifts[1]):
+        # The original track needs its own offset, so the video file is opened once more for its audio only.
+        args += get_offset_args(shifts[1]) + ['-i', input_file]
+        original_audio_input = 4
+    sources = {
+        'v:0': '0:v',
+        'a:0': '1:a:0',
+        'a:1': f'{original_audio_input}:a:{audio_index}',
+        's:0': '2:s:0',
+        's:1': '3:s:0',
+    }
+    for number, (path, shift) in enumerate(zip(audio_files[1:], shifts[2:])):
+        sources[f'a:{number + 2}'] = f"{args.count('-i')}:a:0"
+        args += get_offset_args(shift) + ['-i', path]
+    return args, sources
+
+
+def get_output_args(layout, sources, font_infos, encoded_sources=(), encode_args=()):
+    args = get_attachment_args(font_infos)
+    stream_encode_args = []
+    for track in layout:
+        source = track.get('source', track['stream'])
+        args += ['-map', sources[source]]
+        if source in encoded_sources:
+            stream_encode_args += get_stream_encode_args(track['stream'], encode_args)
+    return args + get_metadata_args(layout) + ['-c', 'copy'] + stream_encode_args + ['-bitexact']
+
+
+def get_ffmpeg_command(job, work_file):
+    input_args, sources = get_mux_inputs(job['input_file'], job['audio_files'], job['subtitle_signs'],
+                                         job['subtitle_full'], job['shifts'], job['audio_index'])
+    return [ffmpeg_path, '-y'] + input_args + get_output_args(
+        job['layout'], sources, job['font_infos'], job['encoded_sources'], job['encode_args']
+    ) + FFMPEG_PROGRESS_ARGS + [
+        work_file
+    ]
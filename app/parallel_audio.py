@@ -0,0 +1,133 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from app.config import ffmpeg_path
+from app.progress import FFMPEG_PROGRESS_KEYS, FFMPEG_PROGRESS_ARGS
+from app import engine
+from app.engine import current_job, bind_job
+
+SAMPLE_RATE = 48000
+FRAME_SAMPLES = 1024
+# Interleaved stereo float, the same samples the AAC encoder gets in a single-pass conversion.
+PCM_ARGS = ['-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '2']
+PCM_FRAME_BYTES = FRAME_SAMPLES * 2 * 4
+# Audio encoded in front of a segment and thrown away. The first frames of an encode overlap the priming
+# silence instead of the audio before the cut, and the encoder's rate control needs several seconds to reach
+# the quantization a single pass would be using at that point, until then the audio after a join is noisier.
+OVERLAP_FRAMES = 10 * SAMPLE_RATE // FRAME_SAMPLES
+TAIL_FRAMES = 2
+MIN_SEGMENT_FRAMES = 2 * 60 * SAMPLE_RATE // FRAME_SAMPLES
+ADTS_HEADER_SIZE = 7
+
+
+def read_adts_frames(file_path):
+    with open(file_path, 'rb') as adts_file:
+        data = adts_file.read()
+    frames = []
+    position = 0
+    while position < len(data):
+        header = data[position:position + ADTS_HEADER_SIZE]
+        if len(header) < ADTS_HEADER_SIZE or header[0] != 0xFF or header[1] & 0xF0 != 0xF0:
+            raise RuntimeError(f"Повреждённый поток ADTS: {file_path}, смещение {position}")
+        length = ((header[3] & 0x03) << 11) | (header[4] << 3) | (header[5] >> 5)
+        if length < ADTS_HEADER_SIZE or position + length > len(data):
+            raise RuntimeError(f"Обрезанный кадр ADTS: {file_path}, смещение {position}")
+        frames.append(data[position:position + length])
+        position += length
+    return frames
+
+
+def get_pcm_size(duration):
+    return (int(duration * SAMPLE_RATE) + FRAME_SAMPLES) // FRAME_SAMPLES * PCM_FRAME_BYTES
+
+
+def get_segment_count(frame_count, workers):
+    return max(1, min(workers, frame_count // MIN_SEGMENT_FRAMES))
+
+
+def get_segments(frame_count, count):
+    bounds = [round(number * frame_count / count) for number in range(count + 1)]
+    segments = []
+    for number in range(count):
+        first = max(0, bounds[number] - OVERLAP_FRAMES)
+        last = number == count - 1
+        segments.append({
+            'start_frame': first,
+            'skip_frames': bounds[number] - first,
+            'frames': None if last else bounds[number + 1] - bounds[number],
+            'input_frames': None if last else bounds[number + 1] + TAIL_FRAMES - first,
+        })
+    return segments
+
+
+def get_segment_command(pcm_path, segment, encode_args, output_path):
+    cmd = [ffmpeg_path, '-y', '-v', 'error'] + PCM_ARGS + [
+        '-skip_initial_bytes', str(segment['start_frame'] * PCM_FRAME_BYTES),
+        '-i', pcm_path,
+    ]
+    if segment['input_frames'] is not None:
+        cmd += ['-af', f"atrim=end_sample={segment['input_frames'] * FRAME_SAMPLES}"]
+    return cmd + encode_args + FFMPEG_PROGRESS_ARGS + ['-f', 'adts', output_path]
+
+
+def run_ffmpeg(cmd, output_path, log, timeout, on_time=None):
+    def on_line(line):
+        key, _, value = line.strip().partition('=')
+        if key == 'out_time_us' and on_time and value.isdigit():
+            on_time(int(value) / 1000000)
+        elif key not in FFMPEG_PROGRESS_KEYS and line.strip():
+            log(line.strip())
+
+    return_code = engine.run_process(cmd, on_line, None, timeout, [output_path])
+    if return_code:
+        raise subprocess.CalledProcessError(return_code, cmd)
+
+
+def encode(input_audio, output_audio, encode_args, log, workers, progress=None, timeout=None):
+    pcm_path = output_audio + '.pcm'
+    segment_paths = []
+    try:
+        run_ffmpeg([ffmpeg_path, '-y', '-v', 'error', '-i', input_audio, '-vn'] + PCM_ARGS + FFMPEG_PROGRESS_ARGS
+                   + [pcm_path], pcm_path, log, timeout)
+        samples = os.path.getsize(pcm_path) // (PCM_FRAME_BYTES // FRAME_SAMPLES)
+        frame_count = (samples + FRAME_SAMPLES - 1) // FRAME_SAMPLES
+        count = get_segment_count(frame_count, workers)
+        segments = get_segments(frame_count, count)
+        segment_paths = [f"{output_audio}.{number}.aac" for number in range(count)]
+        log(f"Аудио разбито на {count} частей для параллельной конвертации")
+
+        done = [0.0] * count
+        total = samples / SAMPLE_RATE
+
+        def encode_segment(number):
+            # The overlap in front of a segment is encoded by its neighbour too, only the audio after it is counted.
+            skipped = segments[number]['skip_frames'] * FRAME_SAMPLES / SAMPLE_RATE
+
+            def on_time(seconds):
+                done[number] = max(0.0, seconds - skipped)
+                if progress and total:
+                    progress(min(1.0, sum(done) / total))
+
+            run_ffmpeg(get_segment_command(pcm_path, segments[number], encode_args, segment_paths[number]),
+                       segment_paths[number], log, timeout, on_time)
+
+        with ThreadPoolExecutor(count, initializer=bind_job, initargs=(current_job(),)) as executor:
+            for future in [executor.submit(encode_segment, number) for number in range(count)]:
+                future.result()
+
+        written = 0
+        with open(output_audio, 'wb') as output_file:
+            for segment, segment_path in zip(segments, segment_paths):
+                frames = read_adts_frames(segment_path)
+                end = len(frames) if segment['frames'] is None else segment['skip_frames'] + segment['frames']
+                if end > len(frames):
+                    raise RuntimeError(f"В части {segment_path} {len(frames)} кадров, нужно {end}")
+                for frame in frames[segment['skip_frames']:end]:
+                    output_file.write(frame)
+                written += end - segment['skip_frames']
+        return written
+    except BaseException:
+        engine.remove_files([output_audio])
+        raise
+    finally:
+        engine.remove_files([pcm_path] + segment_paths)
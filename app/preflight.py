@@ -0,0 +1,160 @@
+import os
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from app.config import preflight_space_margin
+from app.fonts import read_text
+from app.probe import cached, run_ffprobe
+from app.utils import scan_font_files
+from app.engine import current_job, bind_job
+from app.scheduler import get_scratch_path
+
+ASS_EXTENSIONS = ('.ass', '.ssa')
+MEGABYTE = 1024 * 1024
+
+
+def check_file(file_path, title):
+    if not file_path:
+        return f"{title}: путь не указан"
+    if not os.path.isfile(file_path):
+        return f"{title}: файл не найден ({file_path})"
+    if not os.access(file_path, os.R_OK):
+        return f"{title}: нет доступа на чтение ({file_path})"
+    if not os.path.getsize(file_path):
+        return f"{title}: файл пустой ({file_path})"
+    return None
+
+
+def check_streams(file_path, title, required):
+    try:
+        media = cached(file_path, 'ffprobe', run_ffprobe)
+    except (OSError, RuntimeError, ValueError, subprocess.SubprocessError) as e:
+        return [f"{title}: {e}"]
+    present = {s.get('codec_type') for s in media['streams']}
+    names = {'video': 'видео', 'audio': 'аудио', 'subtitle': 'субтитров'}
+    return [f"{title}: нет дорожки {names[codec_type]} ({file_path})"
+            for codec_type in required if codec_type not in present]
+
+
+def check_ass(file_path, title):
+    try:
+        text = read_text(file_path)
+    except (OSError, UnicodeError) as e:
+        return [f"{title}: не удалось прочитать ({e})"]
+    section = None
+    sections = set()
+    has_format = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            section = line.lower()
+            sections.add(section)
+        elif section == '[events]' and line.lower().startswith('format:'):
+            has_format = True
+    if '[script info]' not in sections and '[events]' not in sections:
+        return [f"{title}: файл не похож на субтитры ASS ({file_path})"]
+    if not has_format:
+        return [f"{title}: в разделе [Events] нет строки Format ({file_path})"]
+    return []
+
+
+def check_input(file_path, title, required):
+    error = check_file(file_path, title)
+    if error:
+        return [error]
+    if 'subtitle' in required and file_path.lower().endswith(ASS_EXTENSIONS):
+        return check_ass(file_path, title)
+    return check_streams(file_path, title, required)
+
+
+def check_font_directory(font_directory):
+    if not font_directory:
+        return []
+    if not os.path.isdir(font_directory):
+        return [f"Каталог шрифтов не найден ({font_directory})"]
+    return []
+
+
+def get_font_directory_size(font_directory):
+    if not font_directory or not os.path.isdir(font_directory):
+        return 0
+    return sum(entry.stat().st_size for entry in scan_font_files(font_directory))
+
+
+def get_existing_dir(file_path):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    while not os.path.isdir(directory) and os.path.dirname(directory) != directory:
+        directory = os.path.dirname(directory)
+    return directory
+
+
+def check_space(directory, estimated_size, reclaimed=0):
+    free = shutil.disk_usage(directory).free + reclaimed
+    required = int(estimated_size * preflight_space_margin)
+    if free < required:
+        return [f"Недостаточно места в {directory}: нужно около {required / MEGABYTE:.0f} МБ, "
+                f"свободно {free / MEGABYTE:.0f} МБ"]
+    return []
+
+
+def check_output(output_file, input_files, estimated_size):
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    if any(path and os.path.abspath(path) == os.path.abspath(output_file) for path in input_files):
+        return [f"Выходной файл совпадает с одним из входных ({output_file})"]
+    if not os.path.isdir(output_dir):
+        return [f"Каталог для выходного файла не существует ({output_dir})"]
+
+    check_path = os.path.join(output_dir, f".mkvcreator.{os.getpid()}.{threading.get_ident()}.check")
+    try:
+        with open(check_path, 'wb'):
+            pass
+        os.remove(check_path)
+    except OSError as e:
+        return [f"Нет доступа на запись в каталог {output_dir}: {e}"]
+
+    return check_space(output_dir, estimated_size, os.path.getsize(output_file) if os.path.isfile(output_file) else 0)
+
+
+def run_preflight(input_file, additional_audio, subtitle_signs, subtitle_full, font_directory, output_file,
+                  log, is_two_pass=False, extra_audio=(), extra_outputs=(), work_files=()):
+    checks = [
+        (check_input, input_file, "Видео", ('video', 'audio')),
+        (check_input, additional_audio, "Аудио", ('audio',)),
+        (check_input, subtitle_signs, "Надписи", ('subtitle',)),
+        (check_input, subtitle_full, "Субтитры", ('subtitle',)),
+    ] + [(check_input, path, "Дополнительное аудио", ('audio',)) for path in extra_audio]
+    with ThreadPoolExecutor(len(checks) + 1, initializer=bind_job, initargs=(current_job(),)) as executor:
+        futures = [executor.submit(*check) for check in checks]
+        fonts_future = executor.submit(get_font_directory_size, font_directory)
+        errors = check_font_directory(font_directory)
+        for future in futures:
+            errors += future.result()
+        font_size = fonts_future.result()
+
+    input_files = (input_file, additional_audio, subtitle_signs, subtitle_full) + tuple(extra_audio)
+    estimated_size = sum(os.path.getsize(path) for path in input_files if path and os.path.isfile(path)) + font_size
+    # Removing the delay with mkvmerge keeps a second copy of the output until it replaces the first one.
+    # Variants are written side by side, so each directory is checked for all of them at once.
+    outputs = [output_file] + list(extra_outputs)
+    required = estimated_size * (2 if is_two_pass else 1) * len(outputs)
+    # Audio tracks are converted one at a time, so the largest temporary file is added to the output on
+    # the same disk, or checked on its own disk.
+    work_space = {}
+    for path, size in work_files:
+        directory = get_existing_dir(path)
+        device = os.stat(directory).st_dev
+        if size > work_space.get(device, (None, 0))[1]:
+            work_space[device] = (directory, size)
+    for path in outputs:
+        for target in (path, get_scratch_path(path)):
+            if target:
+                device = os.stat(get_existing_dir(target)).st_dev
+                errors += check_output(target, input_files, required + work_space.pop(device, (None, 0))[1])
+    for directory, size in work_space.values():
+        errors += check_space(directory, size)
+
+    for error in errors:
+        log(f"Ошибка: {error}")
+    if errors:
+        raise RuntimeError(f"Проверка входных файлов не пройдена: {'; '.join(errors)}")
@@ -0,0 +1,128 @@
+import os
+import json
+import atexit
+import time
+import logging
+import threading
+from app.config import ffprobe_path, cache_dir, probe_cache_path, probe_cache_max_entries, stage_timeouts
+from app.instrumentation import run_capture
+
+_lock = threading.Lock()
+_entries = None
+_dirty = set()
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        _entries = _read_cache_file()
+    return _entries
+
+
+def _read_cache_file():
+    try:
+        with open(probe_cache_path, encoding='utf-8') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save():
+    entries = _read_cache_file()
+    for key in _dirty:
+        if key in _entries:
+            entries[key] = _entries[key]
+    if len(entries) > probe_cache_max_entries:
+        for key in sorted(entries, key=lambda k: entries[k].get('used', 0))[:len(entries) - probe_cache_max_entries]:
+            del entries[key]
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{probe_cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(entries, cache_file, ensure_ascii=False)
+        os.replace(temp_path, probe_cache_path)
+        _dirty.clear()
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить кэш метаданных: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def cached(file_path, kind, loader):
+    key = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    with _lock:
+        entry = _load().get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns and kind in entry:
+            entry['used'] = time.time()
+            # Saved with the next miss or at exit, rewriting the file on every hit would cost more than the probe.
+            _dirty.add(key)
+            return entry[kind]
+
+    value = loader(file_path)
+
+    with _lock:
+        entries = _load()
+        entry = entries.get(key)
+        if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            entry = entries[key] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        entry[kind] = value
+        entry['used'] = time.time()
+        _dirty.add(key)
+        _save()
+    return value
+
+
+def flush():
+    with _lock:
+        if _dirty:
+            _save()
+
+
+atexit.register(flush)
+
+
+def run_ffprobe(file_path):
+    cmd = [
+        ffprobe_path,
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        file_path
+    ]
+    return_code, output, errors = run_capture(cmd, stage_timeouts.get('probe'))
+    if return_code or not output.strip():
+        raise RuntimeError(f"ffprobe не смог прочитать {file_path}: {errors.strip()}")
+    media = json.loads(output)
+    media.setdefault('streams', [])
+    media.setdefault('format', {})
+    return media
+
+
+def run_first_packet(file_path, stream):
+    cmd = [
+        ffprobe_path,
+        '-v', 'error',
+        '-print_format', 'json',
+        '-select_streams', stream,
+        '-show_entries', 'packet=pts_time',
+        '-read_intervals', '%+#1',
+        file_path
+    ]
+    return_code, output, errors = run_capture(cmd, stage_timeouts.get('probe'))
+    if return_code or not output.strip():
+        raise RuntimeError(f"ffprobe не смог прочитать {file_path}: {errors.strip()}")
+    packets = json.loads(output).get('packets') or [{}]
+    try:
+        return float(packets[0]['pts_time'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def probe_media(file_path, log):
+    try:
+        return cached(file_path, 'ffprobe', run_ffprobe)
+    except RuntimeError as e:
+        log(f"Ошибка: {e}")
+        raise
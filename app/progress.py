@@ -0,0 +1,102 @@
+import re
+import time
+
+FFMPEG_PROGRESS_KEYS = ('frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time',
+                        'dup_frames', 'drop_frames', 'speed', 'progress')
+FFMPEG_PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats']
+MKVMERGE_PROGRESS = re.compile(r'(?:Progress|#GUI#progress):?\s*(\d+)%')
+MEGABYTE = 1024 * 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressTracker:
+    def __init__(self, stage, progress_callback, log, start, end, duration=None, input_size=None,
+                 interval=2.0):
+        self.stage = stage
+        self.progress_callback = progress_callback
+        self.log = log
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.input_size = input_size
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = 0.0
+        self.last_percent = None
+        self.block = {}
+        self.stats = {'fraction': 0.0, 'read_mbps': None, 'write_mbps': None, 'speed': None, 'eta': None}
+
+    def feed(self, line):
+        line = line.strip()
+        match = MKVMERGE_PROGRESS.search(line)
+        if match:
+            self.update(int(match.group(1)) / 100)
+            return True
+        key, separator, value = line.partition('=')
+        if not separator or key not in FFMPEG_PROGRESS_KEYS and not key.startswith('stream_'):
+            return False
+        self.block[key] = value.strip()
+        if key == 'progress':
+            self.update_from_ffmpeg(self.block)
+            self.block = {}
+        return True
+
+    def update_from_ffmpeg(self, block):
+        fraction = None
+        out_time = block.get('out_time_us') or block.get('out_time_ms')
+        if self.duration and out_time and out_time.lstrip('-').isdigit():
+            fraction = max(0, int(out_time)) / 1000000 / self.duration
+        written = block.get('total_size')
+        written = int(written) if written and written.isdigit() else None
+        speed = block.get('speed', '')
+        speed = speed if speed and speed != 'N/A' else None
+        if block.get('progress') == 'end':
+            fraction = 1.0
+        self.update(fraction, written, speed)
+
+    def update(self, fraction, written=None, speed=None):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        if fraction is not None:
+            fraction = min(max(fraction, 0.0), 1.0)
+            self.stats['fraction'] = fraction
+            if self.input_size:
+                self.stats['read_mbps'] = self.input_size * fraction / elapsed / MEGABYTE
+            self.stats['eta'] = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        if written is not None:
+            self.stats['write_mbps'] = written / elapsed / MEGABYTE
+        if speed is not None:
+            self.stats['speed'] = speed
+        elif fraction and self.duration:
+            self.stats['speed'] = f"{self.duration * fraction / elapsed:.1f}x"
+
+        percent = int(self.start + (self.end - self.start) * self.stats['fraction'])
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.progress_callback(percent)
+        now = time.monotonic()
+        if now - self.last_report >= self.interval or self.stats['fraction'] >= 1.0:
+            self.last_report = now
+            self.log(self.format())
+
+    def format(self):
+        parts = [f"{self.stage}: {self.stats['fraction'] * 100:.0f}%"]
+        if self.stats['read_mbps'] is not None:
+            parts.append(f"чтение {self.stats['read_mbps']:.1f} МБ/с")
+        if self.stats['write_mbps'] is not None:
+            parts.append(f"запись {self.stats['write_mbps']:.1f} МБ/с")
+        if self.stats['speed']:
+            parts.append(f"скорость {self.stats['speed']}")
+        parts.append(f"осталось {format_eta(self.stats['eta'])}")
+        return ' | '.join(parts)
+
+    def finish(self):
+        if self.stats['fraction'] < 1.0:
+            self.update(1.0)
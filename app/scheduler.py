@@ -0,0 +1,164 @@
+import os
+import glob
+import shutil
+import tempfile
+import logging
+import threading
+from contextlib import contextmanager, ExitStack
+from app.config import io_scheduler, device_slots, cpu_slots, scratch_dir
+from app.engine import current_job
+
+WAIT_INTERVAL = 0.5
+
+_lock = threading.Lock()
+_slots = {}
+_devices = {}
+_limits = {'device': device_slots, 'cpu': cpu_slots}
+
+
+def configure(devices=None, cpu=None):
+    with _lock:
+        if devices is not None:
+            _limits['device'] = devices
+        if cpu is not None:
+            _limits['cpu'] = cpu
+        _slots.clear()
+
+
+def find_existing(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def read_block_device(st_dev):
+    # Partitions of one disk share the queue and the heads, so they are grouped under the whole disk.
+    sys_path = f'/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}'
+    try:
+        real_path = os.path.realpath(sys_path)
+    except OSError:
+        return None
+    if not os.path.isdir(real_path):
+        return None
+    if os.path.exists(os.path.join(real_path, 'partition')):
+        real_path = os.path.dirname(real_path)
+    return os.path.basename(real_path)
+
+
+def get_device(path):
+    st_dev = os.stat(find_existing(path)).st_dev
+    with _lock:
+        if st_dev in _devices:
+            return _devices[st_dev]
+    device = None
+    if hasattr(os, 'major'):
+        device = read_block_device(st_dev)
+    device = device or str(st_dev)
+    with _lock:
+        _devices[st_dev] = device
+    return device
+
+
+def get_slot(kind, key):
+    with _lock:
+        slot = _slots.get((kind, key))
+        if slot is None:
+            slot = _slots[(kind, key)] = threading.BoundedSemaphore(max(1, _limits[kind]))
+        return slot
+
+
+@contextmanager
+def acquire(kind, key, log=None, title=None):
+    slot = get_slot(kind, key)
+    if not slot.acquire(blocking=False):
+        if log:
+            log(f"Ожидание очереди: {title or key}")
+        job = current_job()
+        while not slot.acquire(timeout=WAIT_INTERVAL):
+            if job:
+                job.check_cancelled()
+    try:
+        yield
+    finally:
+        slot.release()
+
+
+@contextmanager
+def io_slot(paths, log=None):
+    if not io_scheduler:
+        yield
+        return
+    devices = sorted({get_device(path) for path in paths if path})
+    with ExitStack() as stack:
+        for device in devices:
+            stack.enter_context(acquire('device', device, log, f"диск {device}"))
+        yield
+
+
+@contextmanager
+def cpu_slot(log=None):
+    if not io_scheduler:
+        yield
+        return
+    with acquire('cpu', 'cpu', log, "кодирование"):
+        yield
+
+
+def get_scratch_path(output_file):
+    if not scratch_dir or not os.path.isdir(scratch_dir):
+        return None
+    if get_device(scratch_dir) == get_device(output_file):
+        return None
+    return os.path.join(scratch_dir, f"{os.getpid()}.{threading.get_ident()}.{os.path.basename(output_file)}")
+
+
+def get_work_path(output_file, tag=None):
+    # A job that another worker may take over is built into a file of its own attempt, so a worker that lost
+    # the job removes only its own files.
+    scratch_file = get_scratch_path(output_file)
+    if scratch_file or not tag:
+        return scratch_file or output_file
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f".{tag}.{name}")
+
+
+def get_fixed_path(work_file):
+    root, extension = os.path.splitext(work_file)
+    return f"{root}_fixed{extension}"
+
+
+def create_update_path(output_file):
+    # Several workers may update the same output, each one gets a name of its own next to it.
+    directory, name = os.path.split(os.path.abspath(output_file))
+    root, extension = os.path.splitext(name)
+    fd, path = tempfile.mkstemp(prefix=f".{root}.", suffix=f".updated{extension}", dir=directory)
+    os.close(fd)
+    return path
+
+
+def get_update_pattern(output_file):
+    directory, name = os.path.split(os.path.abspath(output_file))
+    root, extension = os.path.splitext(name)
+    return os.path.join(glob.escape(directory), f".{glob.escape(root)}.*.updated{glob.escape(extension)}")
+
+
+def move_output(work_file, output_file):
+    if os.stat(work_file).st_dev == os.stat(find_existing(output_file)).st_dev:
+        os.replace(work_file, output_file)
+        return
+    part_file = output_file + '.part'
+    try:
+        shutil.copyfile(work_file, part_file)
+        os.replace(part_file, output_file)
+    except OSError:
+        if os.path.exists(part_file):
+            os.remove(part_file)
+        raise
+    try:
+        os.remove(work_file)
+    except OSError as e:
+        logging.warning(f"Не удалось удалить промежуточный файл {work_file}: {e}")
@@ -0,0 +1,74 @@
+import os
+
+TRACK_LAYOUT = [
+    {'stream': 'v:0', 'language': 'jpn', 'title': 'Original', 'default': True},
+    {'stream': 'a:0', 'language': 'rus', 'title': 'AniLibria', 'default': True},
+    {'stream': 'a:1', 'language': 'jpn', 'title': 'Original', 'default': False},
+    {'stream': 's:0', 'language': 'rus', 'title': 'Надписи', 'default': True},
+    {'stream': 's:1', 'language': 'rus', 'title': 'Субтитры', 'default': False},
+]
+
+
+def get_metadata_args(layout=TRACK_LAYOUT):
+    args = []
+    for track in layout:
+        stream = track['stream']
+        args += [
+            f'-metadata:s:{stream}', f"language={track['language']}",
+            f'-metadata:s:{stream}', f"title={track['title']}",
+            f'-disposition:{stream}', 'default' if track['default'] else '0',
+        ]
+    return args
+
+
+# Variants list streams of the full layout above, extra dubs follow the original track as a:2, a:3 and so on.
+VARIANT_PRESETS = {
+    'full': {'suffix': '', 'tracks': ['v:0', 'a:0', 'a:1', 's:0', 's:1']},
+    'no_original': {'suffix': ' [RUS]', 'tracks': ['v:0', 'a:0', 's:0', 's:1']},
+    'signs_only': {'suffix': ' [Signs]', 'tracks': ['v:0', 'a:0', 'a:1', 's:0']},
+    'extra_dubs': {'suffix': ' [Multi]', 'tracks': ['v:0', 'a:0', 'a:1', 'a:2', 'a:3', 'a:4', 's:0', 's:1']},
+}
+
+
+def get_extra_audio_layout(extra_audio):
+    return [{'stream': f'a:{number + 2}', 'language': 'rus',
+             'title': os.path.splitext(os.path.basename(path))[0], 'default': False}
+            for number, path in enumerate(extra_audio)]
+
+
+def get_variant_layout(tracks, extra_audio=()):
+    known = {track['stream']: track for track in TRACK_LAYOUT + get_extra_audio_layout(extra_audio)}
+    counts = {}
+    layout = []
+    for track in tracks:
+        if isinstance(track, str):
+            track = {'stream': track}
+        source = track['stream']
+        if source not in known:
+            if source.startswith('a:'):
+                # The preset allows for more extra dubs than this episode has.
+                continue
+            raise ValueError(f"Неизвестная дорожка в варианте сборки: {source}")
+        codec_type = source.partition(':')[0]
+        number = counts.get(codec_type, 0)
+        counts[codec_type] = number + 1
+        entry = dict(known[source])
+        entry.update(track)
+        # ffmpeg numbers output streams per type, so a dropped track shifts the ones after it.
+        entry.update(source=source, stream=f'{codec_type}:{number}')
+        layout.append(entry)
+    return layout
+
+
+def get_variants(output_file, names, extra_audio=()):
+    root, extension = os.path.splitext(output_file)
+    variants = []
+    for name in names:
+        if name not in VARIANT_PRESETS:
+            raise ValueError(f"Неизвестный вариант сборки: {name}")
+        preset = VARIANT_PRESETS[name]
+        variants.append({'name': name, 'output_file': root + preset['suffix'] + extension,
+                         'tracks': get_variant_layout(preset['tracks'], extra_audio)})
+    if len({variant['output_file'] for variant in variants}) < len(variants):
+        raise ValueError("У вариантов сборки совпадают имена выходных файлов")
+    return variants
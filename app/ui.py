@@ -1,9 +1,10 @@
+import os
 import sys
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QLineEdit, QFileDialog, QCheckBox, \
-    QTextEdit, QProgressBar
-from PyQt6.QtCore import Qt, pyqtSignal, QObject
-from app.media_processor import create_enhanced_mkv
-import threading
+    QPlainTextEdit, QProgressBar
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QTimer
+from app.config import log_max_lines, log_flush_interval, job_server_url
+from app.log_pipeline import LogPipeline
 
 
 class Stream:
@@ -17,7 +18,8 @@ class Stream:
             self.flush()
 
     def flush(self):
-        self.emit(self.buffer.strip())
+        if self.buffer.strip():
+            self.emit(self.buffer.strip())
         self.buffer = ''
 
 
@@ -110,6 +112,10 @@ class FramelessWindow(QWidget):
         self._drag_pos = None
         event.accept()
 
+    def closeEvent(self, event):
+        self.contentWidget.close()
+        super().closeEvent(event)
+
 
 class InputField(QLineEdit):
     def __init__(self, parent=None):
@@ -134,14 +140,19 @@ class InputField(QLineEdit):
 
 class SignalHandler(QObject):
     update_progress = pyqtSignal(int)
-    log_message = pyqtSignal(str)
     toggle_buttons = pyqtSignal(bool)
 
+    def __init__(self):
+        super().__init__()
+        self.log_message = LogPipeline()
+
 
 class MKVCreatorApp(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.signal_handler = SignalHandler()
+        self.engine = None
+        self.job = None
         self.initUI()
         self.connect_signals()
 
@@ -188,26 +199,39 @@ class MKVCreatorApp(QWidget):
         self.convertAudioCheckBox.setChecked(True)
         layout.addWidget(self.convertAudioCheckBox)
 
+        self.serverCheckBox = QCheckBox(f"Отправить на сервер заданий ({job_server_url})")
+        self.serverCheckBox.setChecked(bool(job_server_url))
+        self.serverCheckBox.setVisible(bool(job_server_url))
+        layout.addWidget(self.serverCheckBox)
+
         self.createButton = QPushButton("Создать MKV")
         self.createButton.clicked.connect(self.createMKV)
         layout.addWidget(self.createButton)
 
+        self.cancelButton = QPushButton("Отменить")
+        self.cancelButton.clicked.connect(self.cancelMKV)
+        self.cancelButton.setVisible(False)
+        layout.addWidget(self.cancelButton)
+
         self.progressBar = QProgressBar()
         self.progressBar.setVisible(False)
         layout.addWidget(self.progressBar)
 
-        self.logConsole = QTextEdit()
+        self.logConsole = QPlainTextEdit()
         self.logConsole.setReadOnly(True)
+        self.logConsole.setMaximumBlockCount(log_max_lines)
         layout.addWidget(self.logConsole)
 
-        sys.stdout = Stream(self.logMessage)
-        sys.stderr = Stream(self.logMessage)
+        sys.stdout = Stream(self.signal_handler.log_message.emit)
+        sys.stderr = Stream(self.signal_handler.log_message.emit)
 
         self.setLayout(layout)
         self.resize(800, 600)
 
-    def logMessage(self, message):
-        self.logConsole.append(message)
+    def flushLog(self):
+        lines = self.signal_handler.log_message.drain()
+        if lines:
+            self.logConsole.appendPlainText('\n'.join(lines))
 
     def setupComponent(self, labelText, entryWidget, browseFunction, layout, isFolder=False, isDelay=False):
         componentLayout = QHBoxLayout()
@@ -239,11 +263,15 @@ class MKVCreatorApp(QWidget):
 
     def connect_signals(self):
         self.signal_handler.update_progress.connect(self.updateProgressBar)
-        self.signal_handler.log_message.connect(self.logConsole.append)
+        self.logTimer = QTimer(self)
+        self.logTimer.timeout.connect(self.flushLog)
+        self.logTimer.start(log_flush_interval)
         self.signal_handler.toggle_buttons.connect(self.toggleCreateButtonVisibility)
 
     def toggleCreateButtonVisibility(self, visible):
         self.createButton.setVisible(visible)
+        self.cancelButton.setVisible(not visible)
+        self.cancelButton.setEnabled(True)
         self.progressBar.setVisible(not visible)
 
     def createMKV(self):
@@ -255,12 +283,17 @@ class MKVCreatorApp(QWidget):
         output_file = self.outputEntry.text()
         is_remove_delay = self.removeDelayCheckBox.isChecked()
         is_convert_audio = self.convertAudioCheckBox.isChecked()
+        is_remote = bool(job_server_url) and self.serverCheckBox.isChecked()
 
         if not all([video_file, audio_file, subtitle_signs_file, subtitle_full_file, output_file]):
             self.signal_handler.log_message.emit("Все поля, кроме «Каталог шрифтов», обязательны для заполнения!")
             return
 
         def create_mkv_thread(audio_file):
+            # The media pipeline is imported on first use, so the window shows up without loading it.
+            from app.media_processor import create_enhanced_mkv
+            from app.engine import JobCancelled
+
             self.signal_handler.toggle_buttons.emit(False)
             self.signal_handler.update_progress.emit(0)
             self.createButton.setVisible(False)
@@ -268,6 +301,9 @@ class MKVCreatorApp(QWidget):
             self.progressBar.setValue(0)
 
             try:
+                if is_remote:
+                    submit_remote(audio_file)
+                    return
                 create_enhanced_mkv(
                     input_file=video_file,
                     additional_audio=audio_file,
@@ -278,16 +314,61 @@ class MKVCreatorApp(QWidget):
                     is_remove_delay=is_remove_delay,
                     is_convert_audio=is_convert_audio,
                     progress_callback=self.signal_handler.update_progress.emit,
-                    signal_handler=self.signal_handler
+                    log=self.signal_handler.log_message.emit
                 )
                 self.signal_handler.log_message.emit("MKV-файл создан!")
+            except JobCancelled:
+                self.signal_handler.log_message.emit("Создание MKV отменено")
             except Exception as e:
                 self.signal_handler.log_message.emit(f"Не удалось создать файл MKV: {e}")
             finally:
                 self.signal_handler.toggle_buttons.emit(True)
 
-        thread = threading.Thread(target=create_mkv_thread, args=(audio_file,))
-        thread.start()
+        def submit_remote(audio_file):
+            # The worker opens the files by these paths, so they have to be the same on every machine.
+            from app import job_client
+            from app.engine import current_job
+
+            params = {
+                'input_file': os.path.abspath(video_file),
+                'additional_audio': os.path.abspath(audio_file),
+                'subtitle_signs': os.path.abspath(subtitle_signs_file),
+                'subtitle_full': os.path.abspath(subtitle_full_file),
+                'font_directory': os.path.abspath(fonts_dir) if fonts_dir else '',
+                'output_file': os.path.abspath(output_file),
+                'is_remove_delay': is_remove_delay,
+                'is_convert_audio': is_convert_audio,
+            }
+            job_id = job_client.submit(job_server_url, params)
+            self.signal_handler.log_message.emit(f"Задание {job_id} поставлено в очередь {job_server_url}")
+            job = job_client.wait_job(job_server_url, job_id, self.signal_handler.update_progress.emit,
+                                      self.signal_handler.log_message.emit,
+                                      is_cancelled=current_job().cancelled.is_set)
+            if job['status'] == 'ok':
+                self.signal_handler.log_message.emit("MKV-файл создан!")
+            elif job['status'] == 'cancelled':
+                self.signal_handler.log_message.emit("Создание MKV отменено")
+            else:
+                self.signal_handler.log_message.emit(f"Не удалось создать файл MKV: {job['error']}")
+
+        self.job = self.get_engine().submit(create_mkv_thread, audio_file, name=output_file)
+
+    def get_engine(self):
+        if self.engine is None:
+            from app.engine import Engine
+            self.engine = Engine(workers=1)
+        return self.engine
+
+    def cancelMKV(self):
+        if self.job and not self.job.done():
+            self.signal_handler.log_message.emit("Отмена создания MKV...")
+            self.cancelButton.setEnabled(False)
+            self.job.cancel()
+
+    def closeEvent(self, event):
+        if self.engine:
+            self.engine.shutdown(cancel=True)
+        super().closeEvent(event)
 
     def updateProgressBar(self, progress):
         self.progressBar.setValue(progress)
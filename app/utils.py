@@ -1,12 +1,14 @@
 import os
-import logging
 
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
 
-def get_font_files(font_directory):
-    font_files = []
-    for root, dirs, files in os.walk(font_directory):
-        for file in files:
-            if file.lower().endswith(('.ttf', '.otf')):
-                logging.info(f"Обнаружены: {os.path.join(root, file)}")
-                font_files.append(os.path.join(root, file))
-    return font_files
+
+def scan_font_files(font_directory):
+    pending = [font_directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.name.lower().endswith(FONT_EXTENSIONS):
+                    yield entry
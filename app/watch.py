@@ -0,0 +1,274 @@
+import os
+import sys
+import glob
+import json
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import logging
+import threading
+from app.config import batch_workers, stream_audio_encode, watch_stable_seconds, watch_poll_interval, scratch_dir
+from app.batch import collect_episodes, run_job, DEFAULT_OUTPUT_DIR
+from app.engine import Engine
+from app.tracks import get_variants
+from app.scheduler import get_fixed_path, get_update_pattern
+from app import incremental
+
+STATE_NAME = 'watch_state.json'
+INPUT_KEYS = ('input_file', 'additional_audio', 'subtitle_signs', 'subtitle_full')
+STOP_CHECK_INTERVAL = 1.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.watched = {}
+        self.rescan = True
+
+    def add_tree(self, directory, skipped_dirs=()):
+        # The tree is walked again only when a directory appeared or a watch was lost, not on every file event.
+        if not self.rescan:
+            return
+        self.rescan = False
+        watched_paths = set(self.watched.values())
+        for root, dirs, _ in os.walk(directory):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) not in skipped_dirs]
+            if root in watched_paths:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "превышен лимит fs.inotify.max_user_watches")
+                continue
+            self.watched[wd] = root
+
+    def read_events(self, data):
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + name_length
+            if mask & IN_Q_OVERFLOW or mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.rescan = True
+            elif mask & IN_MOVE_SELF:
+                # A directory moved elsewhere keeps its watch under a path that is no longer right.
+                self.libc.inotify_rm_watch(self.fd, wd)
+                self.watched.pop(wd, None)
+                self.rescan = True
+            elif mask & IN_IGNORED:
+                self.watched.pop(wd, None)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], min(timeout, STOP_CHECK_INTERVAL))
+        if not readable:
+            return False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.read_events(data)
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+
+    def add_tree(self, directory, skipped_dirs=()):
+        pass
+
+    def wait(self, timeout):
+        self.stop_event.wait(timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+def create_watcher(stop_event):
+    if sys.platform.startswith('linux'):
+        try:
+            return Inotify()
+        except (OSError, AttributeError) as e:
+            logging.info(f"inotify недоступен ({e}), используется опрос каталога")
+    return Poller(stop_event)
+
+
+def load_state(state_path):
+    try:
+        with open(state_path, encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_path, state):
+    temp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, ensure_ascii=False, indent=2)
+    os.replace(temp_path, state_path)
+
+
+def get_fingerprint(job):
+    fingerprint = {}
+    for key in INPUT_KEYS:
+        stat = os.stat(job[key])
+        fingerprint[key] = [job[key], stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+class StabilityTracker:
+    def __init__(self, stable_seconds):
+        self.stable_seconds = stable_seconds
+        self.seen = {}
+
+    def check(self, path, now):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.seen.pop(path, None)
+            return None
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self.seen.get(path)
+        # An old mtime proves nothing: a copy may keep the source's mtime or be stalled, so every file has to be
+        # seen unchanged for the whole interval after it was first noticed.
+        if previous is None or previous[0] != signature:
+            self.seen[path] = (signature, now)
+            return self.stable_seconds
+        return max(0.0, self.stable_seconds - (now - previous[1]))
+
+
+def get_outputs(output_file, variants=None):
+    if not variants:
+        return [output_file]
+    return [variant['output_file'] for variant in get_variants(output_file, variants)]
+
+
+def get_leftovers(output_file):
+    # Temporary files of the delay pass, of an update from the finished file and of a copy from the scratch disk.
+    paths = [get_fixed_path(output_file), output_file + '.part'] + glob.glob(get_update_pattern(output_file))
+    if scratch_dir and os.path.isdir(scratch_dir):
+        name = os.path.basename(output_file)
+        for pattern in (name, get_fixed_path(name)):
+            paths += glob.glob(os.path.join(glob.escape(scratch_dir), '*.*.' + glob.escape(pattern)))
+    return paths
+
+
+def is_finished(output_file):
+    # The manifest is written last, a file it describes was built to the end.
+    manifest = incremental.read_manifest(output_file)
+    return (manifest is not None and os.path.isfile(output_file)
+            and manifest.get('output') == incremental.get_output_record(output_file))
+
+
+def resume_state(state):
+    for output_file, entry in state.items():
+        if entry.get('status') == 'running':
+            logging.info(f"Задание прервано при прошлом запуске, будет выполнено заново: {output_file}")
+            for path in entry.get('outputs', [output_file]):
+                for leftover in get_leftovers(path) + ([] if is_finished(path) else [path]):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+            entry['status'] = 'pending'
+
+
+def should_build(outputs, entry, fingerprint):
+    if entry is None or entry.get('status') == 'done' and entry.get('fingerprint') == fingerprint:
+        return not all(os.path.exists(path) for path in outputs)
+    if entry.get('fingerprint') != fingerprint:
+        return True
+    return entry.get('status') in ('pending', 'cancelled')
+
+
+def watch(incoming_dir, font_directory=None, output_dir=None, workers=batch_workers, is_remove_delay=True,
+          is_convert_audio=True, is_stream_audio=stream_audio_encode, stable_seconds=watch_stable_seconds,
+          poll_interval=watch_poll_interval, stop_event=None, variants=None):
+    incoming_dir = os.path.abspath(incoming_dir)
+    output_dir = os.path.abspath(output_dir or os.path.join(incoming_dir, DEFAULT_OUTPUT_DIR))
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_NAME)
+    state = load_state(state_path)
+    resume_state(state)
+    save_state(state_path, state)
+
+    stop_event = stop_event or threading.Event()
+    watcher = create_watcher(stop_event)
+    engine = Engine(workers)
+    tracker = StabilityTracker(stable_seconds)
+    running = {}
+    logging.info(f"Наблюдение за каталогом {incoming_dir}, готовые файлы: {output_dir}")
+    try:
+        while not stop_event.is_set():
+            watcher.add_tree(incoming_dir, {output_dir})
+            now = time.monotonic()
+            next_check = poll_interval
+            changed = False
+
+            for output_file, (job, handle) in list(running.items()):
+                if not handle.done():
+                    continue
+                del running[output_file]
+                result = handle.result()
+                state[output_file]['status'] = 'done' if result['status'] == 'ok' else result['status']
+                state[output_file]['error'] = result['error']
+                logging.info(f"[{job['episode']:02d}] {result['status']}"
+                             + (f": {result['error']}" if result['error'] else ''))
+                changed = True
+
+            for job in collect_episodes(incoming_dir, font_directory, output_dir):
+                if job['errors'] or job['output_file'] in running:
+                    continue
+                waits = [tracker.check(job[key], now) for key in INPUT_KEYS]
+                if any(wait is None for wait in waits):
+                    continue
+                if any(waits):
+                    next_check = min(next_check, max(waits))
+                    continue
+                fingerprint = get_fingerprint(job)
+                outputs = get_outputs(job['output_file'], variants)
+                if not should_build(outputs, state.get(job['output_file']), fingerprint):
+                    continue
+                logging.info(f"[{job['episode']:02d}] Все файлы серии готовы, сборка: {', '.join(outputs)}")
+                state[job['output_file']] = {'episode': job['episode'], 'status': 'running',
+                                             'fingerprint': fingerprint, 'outputs': outputs, 'error': None}
+                running[job['output_file']] = (job, engine.submit(
+                    run_job, job, is_remove_delay, is_convert_audio, False, is_stream_audio, variants,
+                    name=f"серия {job['episode']:02d}"))
+                changed = True
+
+            if changed:
+                save_state(state_path, state)
+            if running:
+                next_check = min(next_check, 1.0)
+            watcher.wait(max(0.1, next_check))
+    finally:
+        watcher.close()
+        engine.shutdown(cancel=True)
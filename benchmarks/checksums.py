@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEGABYTE = 1024 * 1024
+
+
+def build(dataset, codec, output_file, is_streaming):
+    from app import media_processor, checksums
+    from benchmarks.run import null_log
+
+    media_processor.write_checksums = is_streaming
+    media_processor.check_output_structure = is_streaming
+    start = time.perf_counter()
+    media_processor.create_enhanced_mkv(dataset['video'], dataset['audio'][codec], dataset['signs'], dataset['full'],
+                                        dataset['fonts'], output_file, True, True, lambda progress: None,
+                                        null_log)
+    if not is_streaming:
+        # What the upload script did before: a second pass over the finished file.
+        checksums.write_sidecar(output_file, checksums.verify_output(output_file))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Контрольные суммы во время сборки против отдельного прохода")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--ffprobe', default=os.environ.get('MKVCREATOR_FFPROBE', 'ffprobe'))
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--video-bitrate', default='40M')
+    parser.add_argument('--codec', default='aac')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_checksums_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+    os.environ['MKVCREATOR_FFPROBE'] = args.ffprobe
+    os.environ['MKVCREATOR_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    from app import media_processor, checksums
+    from benchmarks.synthetic import make_dataset
+    from benchmarks.run import reset_caches
+    from benchmarks.scheduler import drop_caches
+
+    media_processor.incremental_builds = False
+    results = {}
+    mismatches = 0
+    try:
+        dataset = make_dataset(args.ffmpeg, os.path.join(work_dir, 'source'), args.duration, [args.codec], 20,
+                               16 * 1024, args.video_bitrate)
+        output_file = os.path.join(work_dir, 'episode.mkv')
+        for mode, is_streaming in (('second_pass', False), ('streaming', True)):
+            timings = []
+            for _ in range(args.runs):
+                reset_caches()
+                cold = drop_caches()
+                timings.append(build(dataset, args.codec, output_file, is_streaming))
+                with open(output_file + checksums.SIDECAR_SUFFIX, encoding='utf-8') as sidecar_file:
+                    sidecar = json.load(sidecar_file)
+                expected = checksums.hash_file(output_file)
+                if (sidecar['crc32'], sidecar['sha256_blocks']) != (expected['crc32'], expected['sha256_blocks']) \
+                        or sidecar.get('sha256', expected['sha256']) != expected['sha256']:
+                    mismatches += 1
+                    print(f"{mode}: контрольные суммы не совпали с полным чтением файла")
+            results[mode] = {'runs': timings, 'best': min(timings),
+                             'output_mb': os.path.getsize(output_file) / MEGABYTE, 'cold_cache': cold}
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Режим':<12} {'лучшее, с':>10} {'МБ':>8}  все запуски")
+    for mode, result in results.items():
+        print(f"{mode:<12} {result['best']:>10.2f} {result['output_mb']:>8.1f}  "
+              f"{', '.join(f'{t:.2f}' for t in result['runs'])}")
+    print(f"Ускорение: {results['second_pass']['best'] / results['streaming']['best']:.2f}x")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
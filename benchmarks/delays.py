@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import run, make_video, make_audio
+
+SAMPLE_OFFSETS = (0, 0.5, -0.25, 1.2)
+
+
+def make_samples(ffmpeg, directory, duration):
+    os.makedirs(directory, exist_ok=True)
+    video = make_video(ffmpeg, os.path.join(directory, 'video.mkv'), duration)
+    audio = make_audio(ffmpeg, directory, 'flac', duration)
+    samples = []
+    for offset in SAMPLE_OFFSETS:
+        path = os.path.join(directory, f'delay_{offset:+.2f}.mkv')
+        run([ffmpeg, '-y', '-v', 'error', '-i', video, '-itsoffset', str(offset), '-i', audio,
+             '-map', '0', '-map', '1', '-c', 'copy', path])
+        samples.append(path)
+    return samples
+
+
+def measure(func, file_path, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(file_path)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение чтения задержек через Matroska и MediaInfo")
+    parser.add_argument('files', nargs='*', help="Готовые MKV (по умолчанию создаются синтетические)")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    from app import matroska
+    from app.media_processor import read_mediainfo_delays
+
+    work_dir = None
+    files = args.files
+    if not files:
+        work_dir = tempfile.mkdtemp(prefix='mkvcreator_delays_')
+        files = make_samples(args.ffmpeg, work_dir, args.duration)
+
+    results = []
+    mismatches = 0
+    try:
+        for file_path in files:
+            ours, ours_time = measure(lambda path: [[number, -delay] for number, delay in matroska.get_delays(path)],
+                                      file_path, args.runs)
+            expected, mediainfo_time = measure(read_mediainfo_delays, file_path, args.runs)
+            bytes_read = matroska.read_tracks(file_path)['bytes_read']
+            match = ours == expected
+            mismatches += not match
+            results.append({'file': file_path, 'matroska': ours, 'mediainfo': expected, 'match': match,
+                            'bytes_read': bytes_read, 'matroska_ms': ours_time * 1000,
+                            'mediainfo_ms': mediainfo_time * 1000})
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Файл':<30} {'байт':>8} {'Matroska, мс':>13} {'MediaInfo, мс':>14}  совпадение")
+    for result in results:
+        match = 'да' if result['match'] else f"нет: {result['matroska']} != {result['mediainfo']}"
+        print(f"{os.path.basename(result['file'])[:30]:<30} {result['bytes_read']:>8} "
+              f"{result['matroska_ms']:>13.2f} {result['mediainfo_ms']:>14.2f}  {match}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
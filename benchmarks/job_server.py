@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'MKVCreator (CLI).py')
+WAIT_TIMEOUT = 3600
+
+
+def make_job_audio(ffmpeg, source, directory, count):
+    # The audio cache is keyed by content, so every job gets its own track to convert.
+    paths = []
+    for number in range(count):
+        path = os.path.join(directory, f'audio_{number:02d}' + os.path.splitext(source)[1])
+        run([ffmpeg, '-y', '-v', 'error', '-i', source, '-af', f'volume={1 - number / 100:.2f}', path])
+        paths.append(path)
+    return paths
+
+
+def start_server(database_path, heartbeat_timeout):
+    from app.job_server import create_server
+    from benchmarks.run import null_log
+
+    server = create_server('127.0.0.1', 0, database_path, null_log, heartbeat_timeout)
+    threading.Thread(target=server.serve_forever, name='job-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_worker(server_url, name, work_dir, heartbeat_interval):
+    # Each worker has a cache of its own, as it would on a separate machine.
+    env = dict(os.environ, MKVCREATOR_CACHE_DIR=os.path.join(work_dir, 'cache', name))
+    log_file = open(os.path.join(work_dir, f'{name}.log'), 'w', encoding='utf-8')
+    try:
+        return subprocess.Popen([sys.executable, CLI, 'worker', '--server', server_url, '--name', name,
+                                 '--poll-interval', '0.2', '--heartbeat-interval', str(heartbeat_interval)],
+                                cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+                                start_new_session=True)
+    finally:
+        log_file.close()
+
+
+def kill_worker(process):
+    # The whole process group goes, ffmpeg included, as if the machine had gone down.
+    os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+
+
+def wait_all(server_url, job_ids, on_poll=None):
+    from app import job_client
+    from app.job_server import FINISHED
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        jobs = [job_client.get_job(server_url, job_id) for job_id in job_ids]
+        if all(job['status'] in FINISHED for job in jobs):
+            return jobs
+        if on_poll:
+            on_poll(jobs)
+        time.sleep(0.2)
+    raise RuntimeError("задания не завершились вовремя")
+
+
+def submit_jobs(server_url, dataset, audio_files, output_dir):
+    from app import job_client
+
+    return [job_client.submit(server_url, {
+        'input_file': dataset['video'],
+        'additional_audio': audio_file,
+        'subtitle_signs': dataset['signs'],
+        'subtitle_full': dataset['full'],
+        'font_directory': dataset['fonts'],
+        'output_file': os.path.join(output_dir, f'episode_{number:02d}.mkv'),
+    }) for number, audio_file in enumerate(audio_files)]
+
+
+def run_round(args, dataset, audio_files, work_dir, workers, kill=False):
+    round_dir = os.path.join(work_dir, f'{workers}_workers' + ('_kill' if kill else ''))
+    os.makedirs(round_dir)
+    server, server_url = start_server(os.path.join(round_dir, 'jobs.sqlite3'), args.heartbeat_timeout)
+    processes = {f'worker{number}': start_worker(server_url, f'worker{number}', round_dir, args.heartbeat_interval)
+                 for number in range(workers)}
+    killed = {}
+
+    def kill_first_running(jobs):
+        # Waits for a job to reach the stage, by default the mux, so the worker dies with a half-written file.
+        for job in jobs:
+            if not killed and job['status'] == 'running' and job['stage'] == args.kill_stage:
+                kill_worker(processes[job['worker']])
+                killed.update(job=job['id'], worker=job['worker'], stage=job['stage'], progress=job['progress'])
+
+    try:
+        start = time.perf_counter()
+        job_ids = submit_jobs(server_url, dataset, audio_files, os.path.join(round_dir, 'output'))
+        jobs = wait_all(server_url, job_ids, kill_first_running if kill else None)
+        wall_time = time.perf_counter() - start
+    finally:
+        for process in processes.values():
+            if process.poll() is None:
+                kill_worker(process)
+        server.shutdown()
+        server.server_close()
+
+    return {
+        'workers': workers,
+        'wall_time': wall_time,
+        'jobs_per_minute': len(jobs) * 60 / wall_time,
+        'ids': job_ids,
+        'statuses': [job['status'] for job in jobs],
+        'attempts': [job['attempts'] for job in jobs],
+        'errors': [job['error'] for job in jobs if job['error']],
+        'per_worker': {name: sum(job['worker'] == name for job in jobs) for name in processes},
+        'kill': kill,
+        'killed': killed,
+    }
+
+
+def check(result):
+    problems = []
+    if any(status != 'ok' for status in result['statuses']):
+        problems.append(f"{result['workers']} исп.: не все задания собраны: {result['statuses']} {result['errors']}")
+    killed = result['killed']
+    if result['kill'] and not killed:
+        problems.append(f"{result['workers']} исп.: ни одно задание не дошло до этапа остановки, исполнитель не убит")
+    elif killed and result['attempts'][result['ids'].index(killed['job'])] < 2:
+        problems.append(f"задание {killed['job']} не было выполнено повторно после остановки {killed['worker']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность очереди заданий с несколькими исполнителями "
+                                                 "и возврат задания после остановки исполнителя")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--ffprobe', default=os.environ.get('MKVCREATOR_FFPROBE', 'ffprobe'))
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--video-bitrate', default='20M')
+    parser.add_argument('--codec', default='flac')
+    parser.add_argument('--jobs', type=int, default=6)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--heartbeat-interval', type=float, default=0.5)
+    parser.add_argument('--heartbeat-timeout', type=float, default=3)
+    parser.add_argument('--kill-stage', default='mux', help="Этап сборки, на котором исполнитель убивается")
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_job_server_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+    os.environ['MKVCREATOR_FFPROBE'] = args.ffprobe
+    os.environ['MKVCREATOR_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    from benchmarks.synthetic import make_dataset
+
+    results = []
+    problems = []
+    try:
+        dataset = make_dataset(args.ffmpeg, os.path.join(work_dir, 'source'), args.duration, [args.codec], 20,
+                               16 * 1024, args.video_bitrate)
+        audio_files = make_job_audio(args.ffmpeg, dataset['audio'][args.codec], os.path.join(work_dir, 'source'),
+                                     args.jobs)
+        for workers in args.workers:
+            results.append(run_round(args, dataset, audio_files, work_dir, workers))
+        results.append(run_round(args, dataset, audio_files[:2], work_dir, 2, kill=True))
+        for result in results:
+            problems += check(result)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Исполнители':>11} {'время, с':>9} {'заданий/мин':>12}  распределение")
+    for result in results:
+        label = f"{result['workers']}" + (" (kill)" if result['kill'] else '')
+        print(f"{label:>11} {result['wall_time']:>9.1f} {result['jobs_per_minute']:>12.2f}  "
+              f"{', '.join(f'{name}: {count}' for name, count in result['per_worker'].items())}")
+        if result['killed']:
+            killed = result['killed']
+            print(f"{'':>11} {killed['worker']} убит на этапе {killed['stage']} ({killed['progress']}%), "
+                  f"задание {killed['job']} собрано с попытки {result['attempts'][result['ids'].index(killed['job'])]}")
+    for problem in problems:
+        print(f"Ошибка: {problem}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results, 'problems': problems}, output_file,
+                      ensure_ascii=False, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
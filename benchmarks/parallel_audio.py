@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import run
+
+# Error around a join may exceed the worst error of a single-pass encode nearby by this factor.
+JOIN_TOLERANCE = 1.5
+JOIN_WINDOW = 3
+REFERENCE_WINDOW = 200
+SAMPLE_BYTES = 2 * 4
+
+
+def make_source(ffmpeg, path, duration):
+    # Music-like mix: a tone plus noise, so the encoder's rate control has something to work on.
+    run([ffmpeg, '-y', '-v', 'error',
+         '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100',
+         '-f', 'lavfi', '-i', 'anoisesrc=color=pink:amplitude=0.1:sample_rate=44100',
+         '-filter_complex', 'amix=inputs=2:duration=shortest', '-t', str(duration), '-ac', '2', '-c:a', 'flac', path])
+    return path
+
+
+def decode(ffmpeg, path, pcm_path):
+    from app.parallel_audio import PCM_ARGS
+    run([ffmpeg, '-y', '-v', 'error', '-i', path] + PCM_ARGS + [pcm_path])
+    return pcm_path
+
+
+def read_frame(pcm_file, frame):
+    from app.parallel_audio import FRAME_SAMPLES
+    pcm_file.seek(frame * FRAME_SAMPLES * SAMPLE_BYTES)
+    samples = array('f')
+    samples.frombytes(pcm_file.read(FRAME_SAMPLES * SAMPLE_BYTES))
+    return samples
+
+
+def get_frame_errors(source_pcm, encoded_pcm, frames):
+    # Decoded ADTS keeps the encoder priming, so encoded frame n + 1 holds source frame n.
+    errors = {}
+    with open(source_pcm, 'rb') as source_file, open(encoded_pcm, 'rb') as encoded_file:
+        for frame in frames:
+            source = read_frame(source_file, frame)
+            encoded = read_frame(encoded_file, frame + 1)
+            errors[frame] = max((abs(a - b) for a, b in zip(source, encoded)), default=0.0)
+    return errors
+
+
+def check_joins(source_pcm, single_pcm, parallel_pcm, joins, frame_count):
+    results = []
+    for join in joins:
+        near = range(max(0, join - JOIN_WINDOW), min(frame_count, join + JOIN_WINDOW))
+        around = range(max(0, join - REFERENCE_WINDOW), min(frame_count, join + REFERENCE_WINDOW))
+        join_error = max(get_frame_errors(source_pcm, parallel_pcm, near).values())
+        reference_error = max(get_frame_errors(source_pcm, single_pcm, around).values())
+        results.append({'frame': join, 'error': join_error, 'single_pass_error': reference_error,
+                        'ok': join_error <= reference_error * JOIN_TOLERANCE})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельная конвертация аудио в AAC по частям против одного прохода")
+    parser.add_argument('audio', nargs='?', help="Готовая звуковая дорожка (по умолчанию создаётся синтетическая)")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--duration', type=float, default=20 * 60)
+    parser.add_argument('--workers', default=None,
+                        help="Количества процессов через запятую, по умолчанию 2, 4 ... ядра")
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_parallel_audio_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+
+    from app import parallel_audio
+    from app.media_processor import AAC_ENCODE_ARGS
+    from benchmarks.run import null_log
+
+    cores = os.cpu_count() or 2
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        worker_counts = sorted({count for count in (2, 4, 8, 16) if count < cores} | {cores})
+
+    results = {}
+    failures = 0
+    try:
+        os.makedirs(work_dir, exist_ok=True)
+        source = args.audio or make_source(args.ffmpeg, os.path.join(work_dir, 'source.flac'), args.duration)
+        source_pcm = decode(args.ffmpeg, source, os.path.join(work_dir, 'source.pcm'))
+        frame_count = (os.path.getsize(source_pcm) // SAMPLE_BYTES + parallel_audio.FRAME_SAMPLES - 1) \
+            // parallel_audio.FRAME_SAMPLES
+
+        single_path = os.path.join(work_dir, 'single.aac')
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            run([args.ffmpeg, '-y', '-v', 'error', '-i', source] + AAC_ENCODE_ARGS + ['-f', 'adts', single_path])
+            timings.append(time.perf_counter() - start)
+        single_pcm = decode(args.ffmpeg, single_path, os.path.join(work_dir, 'single.pcm'))
+        single_frames = len(parallel_audio.read_adts_frames(single_path))
+        results['single_pass'] = {'runs': timings, 'best': min(timings), 'frames': single_frames,
+                                  'samples': os.path.getsize(single_pcm) // SAMPLE_BYTES}
+
+        for workers in worker_counts:
+            output_path = os.path.join(work_dir, f'parallel_{workers}.aac')
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                parallel_audio.encode(source, output_path, AAC_ENCODE_ARGS, null_log, workers)
+                timings.append(time.perf_counter() - start)
+            parallel_pcm = decode(args.ffmpeg, output_path, os.path.join(work_dir, 'parallel.pcm'))
+            count = parallel_audio.get_segment_count(frame_count, workers)
+            joins = [round(number * frame_count / count) for number in range(1, count)]
+            result = {
+                'runs': timings,
+                'best': min(timings),
+                'segments': count,
+                'frames': len(parallel_audio.read_adts_frames(output_path)),
+                'samples': os.path.getsize(parallel_pcm) // SAMPLE_BYTES,
+                'joins': check_joins(source_pcm, single_pcm, parallel_pcm, joins, frame_count),
+            }
+            errors = []
+            if (result['frames'], result['samples']) != (single_frames, results['single_pass']['samples']):
+                errors.append(f"кадров {result['frames']}, сэмплов {result['samples']}, "
+                              f"в одном проходе {single_frames} и {results['single_pass']['samples']}")
+            errors += [f"скачок на стыке в кадре {join['frame']}: {join['error']:.4f}, "
+                       f"в одном проходе до {join['single_pass_error']:.4f}"
+                       for join in result['joins'] if not join['ok']]
+            for error in errors:
+                print(f"{workers} процессов: {error}")
+            failures += bool(errors)
+            results[f'parallel_{workers}'] = result
+            os.remove(parallel_pcm)
+            os.remove(output_path)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    single_best = results['single_pass']['best']
+    print(f"{'Режим':<14} {'частей':>6} {'лучшее, с':>10} {'ускорение':>10}  все запуски")
+    for mode, result in results.items():
+        print(f"{mode:<14} {result.get('segments', 1):>6} {result['best']:>10.2f} "
+              f"{single_best / result['best']:>9.2f}x  {', '.join(f'{t:.2f}' for t in result['runs'])}")
+    print(f"Ядер: {cores}. Число кадров и сэмплов, стыки: "
+          + ("есть расхождения" if failures else "как в одном проходе"))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEGABYTE = 1024 * 1024
+
+
+def null_log(message):
+    pass
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def directory_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+    return total
+
+
+def reset_caches():
+    from app import probe, font_index
+    from app.config import cache_dir
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    probe._entries = None
+    probe._dirty.clear()
+    font_index._fonts = None
+    font_index._scanned.clear()
+
+
+def measure(name, runs, case, input_bytes):
+    from app.config import cache_dir
+    timings = []
+    written = []
+    for _ in range(runs):
+        reset_caches()
+        start = time.perf_counter()
+        output = case()
+        timings.append(time.perf_counter() - start)
+        output_size = os.path.getsize(output) if output and os.path.isfile(output) else 0
+        written.append(output_size + directory_size(cache_dir))
+        if output and os.path.isfile(output):
+            os.remove(output)
+    median = statistics.median(timings)
+    return {
+        'name': name,
+        'runs': runs,
+        'wall_median': median,
+        'wall_p95': percentile(timings, 0.95),
+        'wall_runs': timings,
+        'throughput_mbps': input_bytes / MEGABYTE / median if median else None,
+        'bytes_written': statistics.median(written),
+    }
+
+
+def has_second_pass(output_file):
+    from app.instrumentation import REPORT_SUFFIX
+    try:
+        with open(output_file + REPORT_SUFFIX, encoding='utf-8') as report_file:
+            stages = json.load(report_file)['stages']
+    except (OSError, ValueError, KeyError):
+        return False
+    return any(stage['name'] == 'delay' for stage in stages)
+
+
+def run_suite(dataset, work_dir, runs, codecs):
+    from app.probe import run_ffprobe
+    from app.font_index import get_fonts
+    from app.fonts import select_fonts
+    from app.media_processor import convert_audio_to_aac, create_enhanced_mkv
+
+    video_size = os.path.getsize(dataset['video'])
+    results = [measure('probe', runs, lambda: run_ffprobe(dataset['video']) and None, video_size)]
+
+    font_bytes = directory_size(dataset['fonts'])
+    results.append(measure('fonts', runs, lambda: select_fonts(
+        get_fonts(dataset['fonts']), [dataset['signs'], dataset['full']], null_log) and None, font_bytes))
+
+    for codec in codecs:
+        audio = dataset['audio'][codec]
+        audio_size = os.path.getsize(audio)
+        results.append(measure(f'audio[{codec}]', runs,
+                               lambda: convert_audio_to_aac(audio, null_log) and None, audio_size))
+
+        input_bytes = video_size + audio_size + font_bytes
+        for is_stream_audio in (False, True):
+            output_file = os.path.join(work_dir, f'out_{codec}.mkv')
+            second_passes = []
+
+            def pipeline():
+                create_enhanced_mkv(dataset['video'], audio, dataset['signs'], dataset['full'], dataset['fonts'],
+                                    output_file, is_remove_delay=True, is_convert_audio=True,
+                                    progress_callback=lambda progress: None, log=null_log,
+                                    is_stream_audio=is_stream_audio)
+                second_passes.append(has_second_pass(output_file))
+                for suffix in ('.report.json', '.trace.json'):
+                    if os.path.exists(output_file + suffix):
+                        os.remove(output_file + suffix)
+                return output_file
+
+            name = f"pipeline{'_stream' if is_stream_audio else ''}[{codec}]"
+            results.append(measure(name, runs, pipeline, input_bytes))
+            results[-1]['second_pass_runs'] = sum(second_passes)
+    return results
+
+
+def print_results(results):
+    print(f"{'Этап':<28} {'медиана, с':>10} {'p95, с':>8} {'МБ/с':>8} {'записано, МБ':>13} {'2-й проход':>10}")
+    for result in results:
+        throughput = f"{result['throughput_mbps']:.1f}" if result['throughput_mbps'] else '-'
+        second_pass = f"{result['second_pass_runs']}/{result['runs']}" if 'second_pass_runs' in result else '-'
+        print(f"{result['name']:<28} {result['wall_median']:>10.3f} {result['wall_p95']:>8.3f} {throughput:>8} "
+              f"{result['bytes_written'] / MEGABYTE:>13.1f} {second_pass:>10}")
+
+
+def compare(baseline_path, current):
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {result['name']: result for result in json.load(baseline_file)['results']}
+    print(f"{'Этап':<28} {'было, с':>9} {'стало, с':>9} {'изменение':>10}")
+    for result in current['results']:
+        before = baseline.get(result['name'])
+        if not before:
+            continue
+        change = (result['wall_median'] / before['wall_median'] - 1) * 100 if before['wall_median'] else 0
+        print(f"{result['name']:<28} {before['wall_median']:>9.3f} {result['wall_median']:>9.3f} {change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических файлах")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--ffprobe', default=os.environ.get('MKVCREATOR_FFPROBE', 'ffprobe'))
+    parser.add_argument('--mkvmerge', default=os.environ.get('MKVCREATOR_MKVMERGE', 'mkvmerge'))
+    parser.add_argument('--duration', type=float, default=60, help="Длительность синтетических файлов, с")
+    parser.add_argument('--codecs', default='flac,ac3,aac', help="Кодеки аудио через запятую")
+    parser.add_argument('--fonts', type=int, default=200, help="Количество шрифтов в каталоге")
+    parser.add_argument('--font-size', type=int, default=64 * 1024, help="Размер одного шрифта, байт")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--work-dir', default=None, help="Каталог для синтетических файлов (по умолчанию временный)")
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    parser.add_argument('--compare', default=None, help="Сравнить с ранее сохранёнными результатами")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_bench_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+    os.environ['MKVCREATOR_FFPROBE'] = args.ffprobe
+    os.environ['MKVCREATOR_MKVMERGE'] = args.mkvmerge
+    os.environ['MKVCREATOR_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    from benchmarks.synthetic import make_dataset
+
+    codecs = [codec.strip() for codec in args.codecs.split(',') if codec.strip()]
+    try:
+        dataset = make_dataset(args.ffmpeg, os.path.join(work_dir, 'media'), args.duration, codecs, args.fonts,
+                               args.font_size)
+        results = run_suite(dataset, work_dir, args.runs, codecs)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created': time.time(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
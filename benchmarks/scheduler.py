@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEGABYTE = 1024 * 1024
+
+
+def mount_loop_devices(work_dir, count, size_mb):
+    mount_points = []
+    for number in range(count):
+        image = os.path.join(work_dir, f'disk{number}.img')
+        mount_point = os.path.join(work_dir, f'disk{number}')
+        os.makedirs(mount_point, exist_ok=True)
+        with open(image, 'wb') as image_file:
+            image_file.truncate(size_mb * MEGABYTE)
+        subprocess.run(['mkfs.ext4', '-q', '-F', image], check=True)
+        subprocess.run(['mount', '-o', 'loop', image, mount_point], check=True)
+        mount_points.append(mount_point)
+    return mount_points
+
+
+def unmount_loop_devices(mount_points):
+    for mount_point in mount_points:
+        subprocess.run(['umount', mount_point], check=False)
+
+
+def drop_caches():
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as caches:
+            caches.write('3\n')
+        return True
+    except OSError:
+        return False
+
+
+def copy_dataset(dataset, directory):
+    os.makedirs(directory, exist_ok=True)
+    copied = {}
+    for key in ('video', 'signs', 'full'):
+        copied[key] = shutil.copy(dataset[key], directory)
+    copied['audio'] = {codec: shutil.copy(path, directory) for codec, path in dataset['audio'].items()}
+    copied['fonts'] = dataset['fonts']
+    return copied
+
+
+def run_jobs(datasets, jobs, codec):
+    from app.engine import Engine
+    from app.media_processor import create_enhanced_mkv
+    from benchmarks.run import null_log
+
+    engine = Engine(workers=jobs)
+    outputs = []
+    handles = []
+    for number in range(jobs):
+        dataset = datasets[number % len(datasets)]
+        output_file = os.path.join(os.path.dirname(dataset['video']), f'out_{number}.mkv')
+        outputs.append(output_file)
+        handles.append(engine.submit(
+            create_enhanced_mkv, dataset['video'], dataset['audio'][codec], dataset['signs'], dataset['full'],
+            dataset['fonts'], output_file, is_remove_delay=True, is_convert_audio=True,
+            progress_callback=lambda progress: None, log=null_log, name=f'job {number}'))
+    start = time.perf_counter()
+    for handle in handles:
+        handle.result()
+    elapsed = time.perf_counter() - start
+    engine.shutdown()
+    for output_file in outputs:
+        for path in (output_file, output_file + '.report.json', output_file + '.trace.json'):
+            if os.path.exists(path):
+                os.remove(path)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение планировщика дисков с одновременным запуском заданий")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--ffprobe', default=os.environ.get('MKVCREATOR_FFPROBE', 'ffprobe'))
+    parser.add_argument('--devices', nargs='*', default=[], help="Каталоги на разных дисках")
+    parser.add_argument('--loop', type=int, default=0, help="Создать N файловых систем на loop-устройствах (root)")
+    parser.add_argument('--loop-size', type=int, default=2048, help="Размер loop-образа, МБ")
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--video-bitrate', default='40M')
+    parser.add_argument('--codec', default='flac')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_sched_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+    os.environ['MKVCREATOR_FFPROBE'] = args.ffprobe
+    os.environ['MKVCREATOR_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    from app import scheduler
+    from app.config import cpu_slots
+    from benchmarks.synthetic import make_dataset
+    from benchmarks.run import reset_caches
+
+    mount_points = []
+    try:
+        devices = list(args.devices)
+        if args.loop:
+            mount_points = mount_loop_devices(work_dir, args.loop, args.loop_size)
+            devices += mount_points
+        if not devices:
+            parser.error("укажите --devices или --loop")
+
+        source = make_dataset(args.ffmpeg, os.path.join(work_dir, 'source'), args.duration, [args.codec], 20,
+                              16 * 1024, args.video_bitrate)
+        datasets = [copy_dataset(source, os.path.join(device, 'media')) for device in devices]
+        input_bytes = sum(os.path.getsize(datasets[number % len(datasets)][key])
+                          for number in range(args.jobs) for key in ('video', 'signs', 'full'))
+
+        modes = {'naive': (args.jobs, args.jobs), 'scheduled': (1, cpu_slots)}
+        results = {}
+        for mode, (device_limit, cpu_limit) in modes.items():
+            scheduler.configure(device_limit, cpu_limit)
+            timings = []
+            for _ in range(args.runs):
+                reset_caches()
+                cold = drop_caches()
+                timings.append(run_jobs(datasets, args.jobs, args.codec))
+            best = min(timings)
+            results[mode] = {'runs': timings, 'best': best, 'throughput_mbps': input_bytes / MEGABYTE / best,
+                             'cold_cache': cold}
+    finally:
+        unmount_loop_devices(mount_points)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Режим':<10} {'лучшее, с':>10} {'МБ/с':>8}  все запуски")
+    for mode, result in results.items():
+        print(f"{mode:<10} {result['best']:>10.2f} {result['throughput_mbps']:>8.1f}  "
+              f"{', '.join(f'{t:.2f}' for t in result['runs'])}")
+    print(f"Ускорение: {results['naive']['best'] / results['scheduled']['best']:.2f}x")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import run, make_video, make_audio, make_fonts, make_subtitles
+
+# Offset of the original audio in the video file and of the additional track, in seconds.
+SAMPLE_OFFSETS = ((0.5, 0), (-0.25, 0), (1.2, 0.3), (0, -0.4))
+# FLAC is built as it is, converted to a file first and encoded inside the mux; AAC in MP4 is always copied,
+# its edit list hides the priming frame from start_time.
+SOURCES = {
+    'flac': ('.mka', (('copy', False, False), ('convert', True, False), ('stream', True, True))),
+    'aac': ('.m4a', (('copy', False, False),)),
+}
+
+
+def make_samples(ffmpeg, directory, duration):
+    os.makedirs(directory, exist_ok=True)
+    video = make_video(ffmpeg, os.path.join(directory, 'video.mkv'), duration)
+    audio = {codec: make_audio(ffmpeg, directory, codec, duration) for codec in SOURCES}
+    families = make_fonts(os.path.join(directory, 'fonts'), 3, 16 * 1024)
+    subtitles = {
+        'signs': make_subtitles(os.path.join(directory, 'signs.ass'), duration, families, signs=True),
+        'full': make_subtitles(os.path.join(directory, 'full.ass'), duration, families),
+        'fonts': os.path.join(directory, 'fonts'),
+    }
+    samples = []
+    for original_offset, audio_offset in SAMPLE_OFFSETS:
+        name = f'{original_offset:+.2f}_{audio_offset:+.2f}'
+        sample_video = os.path.join(directory, f'video_{name}.mkv')
+        run([ffmpeg, '-y', '-v', 'error', '-i', video, '-itsoffset', str(original_offset), '-i', video,
+             '-map', '0:v', '-map', '1:a', '-c', 'copy', sample_video])
+        for codec, (extension, modes) in SOURCES.items():
+            sample_audio = audio[codec]
+            if audio_offset:
+                # A container keeps the start time, a raw FLAC file always starts at zero.
+                sample_audio = os.path.join(directory, f'audio_{codec}_{name}{extension}')
+                run([ffmpeg, '-y', '-v', 'error', '-itsoffset', str(audio_offset), '-i', audio[codec], '-c', 'copy',
+                     sample_audio])
+            for mode, is_convert_audio, is_stream_audio in modes:
+                samples.append(dict(subtitles, name=f'{name} {codec}', mode=mode, video=sample_video,
+                                    audio=sample_audio, is_convert_audio=is_convert_audio,
+                                    is_stream_audio=is_stream_audio))
+    return samples
+
+
+def build(sample, output_file, is_single_pass):
+    from app import media_processor
+    from benchmarks.run import null_log
+
+    media_processor.single_pass_delay = is_single_pass
+    # The check after the single pass would hide a wrong prediction behind the second pass.
+    media_processor.verify_single_pass_delay = False
+    # A conversion cached by another sample of the same track would be muxed instead of the streamed encode.
+    audio_cache_dir = media_processor.audio_cache_dir
+    if sample['is_stream_audio']:
+        media_processor.audio_cache_dir = None
+    try:
+        if media_processor.create_enhanced_mkv(sample['video'], sample['audio'], sample['signs'], sample['full'],
+                                               sample['fonts'], output_file, True, sample['is_convert_audio'],
+                                               lambda progress: None, null_log, sample['is_stream_audio']) is None:
+            raise RuntimeError("сборка не удалась")
+    finally:
+        media_processor.audio_cache_dir = audio_cache_dir
+    return sorted(media_processor.get_output_delays(output_file).items())
+
+
+def compare(single, two_pass):
+    from app.media_processor import DELAY_TOLERANCE_MS
+
+    if [track for track, _ in single] != [track for track, _ in two_pass]:
+        return False
+    return all(abs(a - b) <= DELAY_TOLERANCE_MS for (_, a), (_, b) in zip(single, two_pass))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение задержек после сборки в один проход и с mkvmerge")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--ffprobe', default=os.environ.get('MKVCREATOR_FFPROBE', 'ffprobe'))
+    parser.add_argument('--mkvmerge', default=os.environ.get('MKVCREATOR_MKVMERGE', 'mkvmerge'))
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--no-two-pass', action='store_true',
+                        help="Только проверить остаточную задержку, без сравнения с mkvmerge")
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_single_pass_delay_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+    os.environ['MKVCREATOR_FFPROBE'] = args.ffprobe
+    os.environ['MKVCREATOR_MKVMERGE'] = args.mkvmerge
+    os.environ['MKVCREATOR_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    from app import media_processor
+
+    media_processor.incremental_builds = False
+    passes = (('single', True),) if args.no_two_pass else (('single', True), ('two_pass', False))
+    results = []
+    try:
+        for number, sample in enumerate(make_samples(args.ffmpeg, os.path.join(work_dir, 'source'), args.duration)):
+            result = {'sample': sample['name'], 'mode': sample['mode'], 'two_pass': None}
+            for mode, is_single_pass in passes:
+                output_file = os.path.join(work_dir, f"{number:02d}_{mode}.mkv")
+                try:
+                    result[mode] = build(sample, output_file, is_single_pass)
+                except (OSError, RuntimeError) as e:
+                    result[mode] = None
+                    result['error'] = f"{mode}: {e}"
+            # Every delay left after the single pass would have sent the build to the second pass.
+            result['residual'] = [delay for _, delay in result['single'] or []
+                                  if abs(delay) > media_processor.DELAY_TOLERANCE_MS]
+            result['match'] = result['single'] is not None and not result['residual'] and (
+                args.no_two_pass or result['two_pass'] is not None and compare(result['single'], result['two_pass']))
+            results.append(result)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Образец':<20} {'звук':<8} {'один проход':<20} {'mkvmerge':<20} совпадение")
+    for result in results:
+        print(f"{result['sample']:<20} {result['mode']:<8} {str(result['single']):<20} "
+              f"{str(result['two_pass']):<20} {'да' if result['match'] else result.get('error', 'нет')}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+    sys.exit(0 if all(result['match'] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
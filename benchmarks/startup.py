@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ('PyQt6', 'pymediainfo', 'asyncio', 'app.media_processor')
+
+GUI_SCRIPT = '''
+import os, sys
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt6.QtWidgets import QApplication
+from app.ui import MKVCreatorApp
+application = QApplication([])
+window = MKVCreatorApp()
+window.show()
+application.processEvents()
+'''
+
+HEADLESS_SCRIPT = '''
+from app.media_processor import create_enhanced_mkv
+'''
+
+POOL_SCRIPT = '''
+import multiprocessing
+from benchmarks.startup import load_core
+
+if __name__ == '__main__':
+    with multiprocessing.get_context('spawn').Pool({workers}, initializer=load_core) as pool:
+        pool.map(len, [[]] * {workers})
+'''
+
+REPORT = '''
+import sys, json
+print(json.dumps({{name: name in sys.modules for name in {modules!r}}}))
+'''
+
+
+def load_core():
+    import app.media_processor  # noqa: F401
+
+
+def run_case(script, runs):
+    timings = []
+    loaded = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', script + REPORT.format(modules=HEAVY_MODULES)],
+                                   cwd=ROOT, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        if completed.returncode:
+            return {'error': (completed.stderr.strip().splitlines() or ['?'])[-1]}
+        loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {'runs': timings, 'median': statistics.median(timings), 'loaded': loaded}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска GUI, консольной сборки и пула рабочих процессов")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4, help="Количество процессов в пуле")
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    cases = {
+        'python': '',
+        'gui': GUI_SCRIPT,
+        'headless': HEADLESS_SCRIPT,
+        'cli': 'import runpy, sys\nsys.argv = ["MKVCreator"]\n'
+               'try:\n    runpy.run_path("MKVCreator (CLI).py", run_name="__main__")\nexcept SystemExit:\n    pass\n',
+        'pool_spawn': POOL_SCRIPT.format(workers=args.workers),
+    }
+    results = {name: run_case(script, args.runs) for name, script in cases.items()}
+
+    print(f"{'Сценарий':<12} {'медиана, мс':>12}  загружено")
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"{name:<12} {'—':>12}  {result['error']}")
+            continue
+        loaded = ', '.join(module for module, is_loaded in result['loaded'].items() if is_loaded) or '—'
+        print(f"{name:<12} {result['median'] * 1000:>12.1f}  {loaded}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
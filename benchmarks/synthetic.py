@@ -0,0 +1,106 @@
+import os
+import struct
+import subprocess
+
+AUDIO_CODECS = {
+    'flac': ('flac', '.flac'),
+    'ac3': ('ac3', '.ac3'),
+    'aac': ('aac', '.m4a'),
+    'opus': ('libopus', '.opus'),
+    'mp3': ('libmp3lame', '.mp3'),
+    'pcm': ('pcm_s16le', '.wav'),
+}
+VIDEO_CODECS = ('libx264', 'mpeg4')
+SUBTITLE_FONTS_USED = 3
+
+
+def run(cmd):
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def make_video(ffmpeg, path, duration, size='1280x720', rate=24, bitrate=None):
+    last_error = None
+    for codec in VIDEO_CODECS:
+        try:
+            run([ffmpeg, '-y', '-v', 'error',
+                 '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={rate}',
+                 '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000',
+                 '-t', str(duration), '-c:v', codec] + (['-b:v', bitrate] if bitrate else []) + [
+                 '-c:a', 'aac', '-ac', '2', '-metadata:s:a:0', 'language=jpn', path])
+            return path
+        except subprocess.CalledProcessError as e:
+            last_error = e
+    raise last_error
+
+
+def make_audio(ffmpeg, directory, codec, duration):
+    encoder, extension = AUDIO_CODECS[codec]
+    path = os.path.join(directory, f'audio_{codec}{extension}')
+    run([ffmpeg, '-y', '-v', 'error', '-f', 'lavfi', '-i', 'sine=frequency=660:sample_rate=48000',
+         '-t', str(duration), '-ac', '2', '-c:a', encoder, path])
+    return path
+
+
+def make_font(path, family, size):
+    names = [(1, family), (2, 'Regular'), (4, f'{family} Regular'), (6, family.replace(' ', '') + '-Regular')]
+    records = b''
+    strings = b''
+    for name_id, value in names:
+        encoded = value.encode('utf-16-be')
+        records += struct.pack('>HHHHHH', 3, 1, 0x409, name_id, len(encoded), len(strings))
+        strings += encoded
+    name_table = struct.pack('>HHH', 0, len(names), 6 + len(records)) + records + strings
+    padding = b'\0' * max(0, size - len(name_table) - 44)
+    tables = [(b'glyf', padding), (b'name', name_table)]
+    offset = 12 + 16 * len(tables)
+    directory = b''
+    data = b''
+    for tag, table in tables:
+        directory += struct.pack('>4sIII', tag, 0, offset + len(data), len(table))
+        data += table + b'\0' * (-len(table) % 4)
+    with open(path, 'wb') as font_file:
+        font_file.write(struct.pack('>IHHHH', 0x00010000, len(tables), 0, 0, 0) + directory + data)
+    return path
+
+
+def make_fonts(directory, count, size):
+    os.makedirs(directory, exist_ok=True)
+    families = [f'Bench Font {number}' for number in range(count)]
+    for number, family in enumerate(families):
+        make_font(os.path.join(directory, f'bench_{number:04d}.ttf'), family, size)
+    return families
+
+
+def make_subtitles(path, duration, families, signs=False):
+    style_fonts = families[:SUBTITLE_FONTS_USED] or ['Arial']
+    lines = [
+        '[Script Info]',
+        'ScriptType: v4.00+',
+        '',
+        '[V4+ Styles]',
+        'Format: Name, Fontname, Fontsize, PrimaryColour, Bold, Italic, Alignment, MarginL, MarginR, MarginV',
+    ]
+    for number, family in enumerate(style_fonts):
+        lines.append(f'Style: Style{number},{family},40,&H00FFFFFF,0,0,2,10,10,10')
+    lines += ['', '[Events]', 'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text']
+    for second in range(0, int(duration), 2):
+        start = f'{second // 3600}:{second // 60 % 60:02d}:{second % 60:02d}.00'
+        end = f'{(second + 1) // 3600}:{(second + 1) // 60 % 60:02d}:{(second + 1) % 60:02d}.00'
+        style = f'Style{second // 2 % len(style_fonts)}'
+        text = 'НАДПИСЬ' if signs else f'Строка субтитров {second}'
+        lines.append(f'Dialogue: 0,{start},{end},{style},,0,0,0,,{text}')
+    with open(path, 'w', encoding='utf-8-sig') as subtitle_file:
+        subtitle_file.write('\n'.join(lines) + '\n')
+    return path
+
+
+def make_dataset(ffmpeg, directory, duration, audio_codecs, font_count, font_size, video_bitrate=None):
+    os.makedirs(directory, exist_ok=True)
+    families = make_fonts(os.path.join(directory, 'fonts'), font_count, font_size)
+    return {
+        'video': make_video(ffmpeg, os.path.join(directory, 'video.mkv'), duration, bitrate=video_bitrate),
+        'audio': {codec: make_audio(ffmpeg, directory, codec, duration) for codec in audio_codecs},
+        'signs': make_subtitles(os.path.join(directory, 'signs.ass'), duration, families, signs=True),
+        'full': make_subtitles(os.path.join(directory, 'full.ass'), duration, families),
+        'fonts': os.path.join(directory, 'fonts'),
+    }
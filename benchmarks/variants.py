@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEGABYTE = 1024 * 1024
+
+
+def build(dataset, codec, output_file, names, together):
+    from app.media_processor import create_variant_mkvs
+    from app.tracks import get_variants
+    from benchmarks.run import null_log
+
+    variants = get_variants(output_file, names)
+    groups = [variants] if together else [[variant] for variant in variants]
+    start = time.perf_counter()
+    for group in groups:
+        create_variant_mkvs(dataset['video'], dataset['audio'][codec], dataset['signs'], dataset['full'],
+                            dataset['fonts'], group, True, True, lambda progress: None, null_log)
+    elapsed = time.perf_counter() - start
+    for variant in variants:
+        for suffix in ('', '.manifest.json', '.report.json', '.trace.json'):
+            if os.path.exists(variant['output_file'] + suffix):
+                os.remove(variant['output_file'] + suffix)
+    return elapsed, len(groups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка нескольких вариантов серии: по отдельности и за один проход")
+    parser.add_argument('--ffmpeg', default=os.environ.get('MKVCREATOR_FFMPEG', 'ffmpeg'))
+    parser.add_argument('--ffprobe', default=os.environ.get('MKVCREATOR_FFPROBE', 'ffprobe'))
+    parser.add_argument('--variants', default='full,no_original,signs_only', help="Варианты через запятую")
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--video-bitrate', default='40M')
+    parser.add_argument('--codec', default='aac')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--output', default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='mkvcreator_variants_')
+    os.environ['MKVCREATOR_FFMPEG'] = args.ffmpeg
+    os.environ['MKVCREATOR_FFPROBE'] = args.ffprobe
+    os.environ['MKVCREATOR_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    from app import media_processor
+    from benchmarks.synthetic import make_dataset
+    from benchmarks.run import reset_caches
+    from benchmarks.scheduler import drop_caches
+
+    # Each mode must really mux every time, not pick up the outputs of the previous run.
+    media_processor.incremental_builds = False
+
+    names = args.variants.split(',')
+    results = {}
+    try:
+        dataset = make_dataset(args.ffmpeg, os.path.join(work_dir, 'source'), args.duration, [args.codec], 20,
+                               16 * 1024, args.video_bitrate)
+        output_file = os.path.join(work_dir, 'episode.mkv')
+        source_size = os.path.getsize(dataset['video'])
+        for mode, together in (('separate', False), ('single_pass', True)):
+            timings = []
+            for _ in range(args.runs):
+                reset_caches()
+                cold = drop_caches()
+                elapsed, passes = build(dataset, args.codec, output_file, names, together)
+                timings.append(elapsed)
+            results[mode] = {'runs': timings, 'best': min(timings), 'source_reads': passes,
+                             'source_mb_read': passes * source_size / MEGABYTE, 'cold_cache': cold}
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Режим':<12} {'лучшее, с':>10} {'чтений':>7} {'МБ исходника':>13}  все запуски")
+    for mode, result in results.items():
+        print(f"{mode:<12} {result['best']:>10.2f} {result['source_reads']:>7} {result['source_mb_read']:>13.1f}  "
+              f"{', '.join(f'{t:.2f}' for t in result['runs'])}")
+    print(f"Ускорение: {results['separate']['best'] / results['single_pass']['best']:.2f}x")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
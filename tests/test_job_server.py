@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import job_client
+from app.job_client import ServerError
+from app.job_server import create_server
+
+PARAMS = {
+    'input_file': 'video.mkv',
+    'additional_audio': 'audio.flac',
+    'subtitle_signs': 'signs.ass',
+    'subtitle_full': 'full.ass',
+    'output_file': 'episode.mkv',
+}
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = create_server('127.0.0.1', 0, str(tmp_path / 'jobs.sqlite3'), lambda message: None, 60)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.mark.parametrize('worker', ['encode box 1', 'кодер-1', 'box/1?a=b'])
+def test_claim_heartbeat_finish_keep_worker_name(url, worker):
+    job_id = job_client.submit(url, PARAMS)
+    job = job_client.claim(url, worker)
+    assert job['id'] == job_id and job['worker'] == worker
+    assert job_client.heartbeat(url, job_id, worker, 50, 'mux', ['строка']) is False
+    job_client.finish(url, job_id, worker, 'ok')
+    job = job_client.get_job(url, job_id, 0)
+    assert job['status'] == 'ok' and job['progress'] == 100
+    assert [line['message'] for line in job['log']] == ['строка']
+    assert [entry['name'] for entry in job_client.list_workers(url)] == [worker]
+
+
+def test_only_owner_reports(url):
+    job_id = job_client.submit(url, PARAMS)
+    job_client.claim(url, 'first')
+    for call in (lambda: job_client.heartbeat(url, job_id, 'second'),
+                 lambda: job_client.finish(url, job_id, 'second', 'ok'),
+                 lambda: job_client.release(url, job_id, 'second')):
+        with pytest.raises(ServerError) as error:
+            call()
+        assert error.value.status == 409
+    assert job_client.get_job(url, job_id)['status'] == 'running'
+
+
+def test_release_requeues_without_counting_attempt(url):
+    job_id = job_client.submit(url, PARAMS)
+    job_client.claim(url, 'first')
+    assert job_client.release(url, job_id, 'first') == 'queued'
+    job = job_client.claim(url, 'second')
+    assert job['id'] == job_id and job['attempts'] == 1
+    with pytest.raises(ServerError):
+        job_client.finish(url, job_id, 'first', 'ok')
+
+
+def test_release_after_cancel_request_cancels(url):
+    job_id = job_client.submit(url, PARAMS)
+    job_client.claim(url, 'first')
+    assert job_client.cancel(url, job_id)['cancel_requested']
+    assert job_client.heartbeat(url, job_id, 'first') is True
+    assert job_client.release(url, job_id, 'first') == 'cancelled'
+    assert job_client.get_job(url, job_id)['status'] == 'cancelled'
+    assert job_client.claim(url, 'second') is None
+
+
+def test_dead_worker_loses_job(server, url):
+    job_id = job_client.submit(url, PARAMS)
+    job_client.claim(url, 'first')
+    assert server.store.requeue_dead(timeout=-1) == [(job_id, 'first', 'queued')]
+    job = job_client.claim(url, 'second')
+    assert job['attempts'] == 2
+    with pytest.raises(ServerError) as error:
+        job_client.heartbeat(url, job_id, 'first')
+    assert error.value.status == 409
+    job_client.finish(url, job_id, 'second', 'ok')
+
+
+def test_dead_worker_fails_after_max_attempts(server, url):
+    job_id = job_client.submit(url, PARAMS)
+    for attempt in range(2):
+        job_client.claim(url, f'worker{attempt}')
+        server.store.requeue_dead(timeout=-1, max_attempts=2)
+    job = job_client.get_job(url, job_id)
+    assert job['status'] == 'failed' and job['attempts'] == 2
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.muxers import get_ffmpeg_command
+from app.tracks import TRACK_LAYOUT
+
+JOB = {
+    'input_file': 'video.mkv',
+    'audio_files': ['audio.m4a'],
+    'subtitle_signs': 'signs.ass',
+    'subtitle_full': 'full.ass',
+    'layout': TRACK_LAYOUT,
+    'font_infos': [{'path': 'fonts/a.ttf', 'mime': 'font/ttf'}],
+    'audio_index': 1,
+    'shifts': [0.0, 0.0],
+    'encoded_sources': [],
+    'encode_args': ['-acodec', 'aac', '-b:a', '192k'],
+}
+
+
+def get_inputs(cmd):
+    return [cmd[number + 1] for number, arg in enumerate(cmd) if arg == '-i']
+
+
+def get_maps(cmd):
+    return [cmd[number + 1] for number, arg in enumerate(cmd) if arg == '-map']
+
+
+def test_maps_layout_in_order_and_attaches_fonts():
+    cmd = get_ffmpeg_command(JOB, 'out.mkv')
+    assert get_inputs(cmd) == ['video.mkv', 'audio.m4a', 'signs.ass', 'full.ass']
+    assert get_maps(cmd) == ['0:v', '1:a:0', '0:a:1', '2:s:0', '3:s:0']
+    assert cmd[cmd.index('-attach') + 1] == 'fonts/a.ttf'
+    assert '-itsoffset' not in cmd and cmd[-1] == 'out.mkv'
+    assert cmd[cmd.index('-c') + 1] == 'copy' and '-c:a:0' not in cmd
+
+
+def test_shifts_open_the_video_again_for_the_original_audio():
+    cmd = get_ffmpeg_command(dict(JOB, shifts=[0.0213, -0.0004]), 'out.mkv')
+    assert get_inputs(cmd) == ['video.mkv', 'audio.m4a', 'signs.ass', 'full.ass']
+    assert cmd[cmd.index('-itsoffset') + 1:cmd.index('-itsoffset') + 4] == ['0.021', '-i', 'audio.m4a']
+
+    cmd = get_ffmpeg_command(dict(JOB, shifts=[0.0, 0.25]), 'out.mkv')
+    assert get_inputs(cmd)[4] == 'video.mkv'
+    assert get_maps(cmd)[2] == '4:a:1'
+
+
+def test_encoded_source_is_encoded_on_its_output_stream():
+    cmd = get_ffmpeg_command(dict(JOB, encoded_sources=['a:0']), 'out.mkv')
+    assert cmd[cmd.index('-c:a:0') + 1] == 'aac' and cmd[cmd.index('-b:a:0') + 1] == '192k'
+    assert '-c:a:1' not in cmd
@@ -0,0 +1,45 @@
+import os
+import sys
+import shutil
+import subprocess
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import parallel_audio
+from app.media_processor import AAC_ENCODE_ARGS
+
+FFMPEG = os.environ.get('MKVCREATOR_FFMPEG') or shutil.which('ffmpeg')
+
+pytestmark = pytest.mark.skipif(not FFMPEG or not os.path.isfile(FFMPEG), reason="ffmpeg не найден")
+
+
+def decode_samples(file_path):
+    pcm = subprocess.run([FFMPEG, '-v', 'error', '-i', file_path, '-f', 's16le', '-ac', '2', '-'],
+                         capture_output=True, check=True).stdout
+    return len(pcm) // 4
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / 'source.flac')
+    subprocess.run([FFMPEG, '-y', '-v', 'error', '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100:d=21.3',
+                    '-ac', '2', path], check=True)
+    return path
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_parallel_encode_matches_single_pass(monkeypatch, tmp_path, source, workers):
+    # Segments of a few seconds instead of minutes, so the joins are exercised on a short file.
+    monkeypatch.setattr(parallel_audio, 'ffmpeg_path', FFMPEG)
+    monkeypatch.setattr(parallel_audio, 'MIN_SEGMENT_FRAMES', 200)
+    monkeypatch.setattr(parallel_audio, 'OVERLAP_FRAMES', 50)
+    single = str(tmp_path / 'single.aac')
+    subprocess.run([FFMPEG, '-y', '-v', 'error', '-i', source, '-vn'] + AAC_ENCODE_ARGS + ['-f', 'adts', single],
+                   check=True)
+    parallel = str(tmp_path / 'parallel.aac')
+    written = parallel_audio.encode(source, parallel, AAC_ENCODE_ARGS, lambda message: None, workers)
+
+    assert written == len(parallel_audio.read_adts_frames(single))
+    assert decode_samples(parallel) == decode_samples(single)
+    assert sorted(os.listdir(tmp_path)) == ['parallel.aac', 'single.aac', 'source.flac']
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import probe, instrumentation
+from app.engine import Engine, JobCancelled
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason="заглушка ffprobe написана на sh")
+
+
+@pytest.fixture
+def hung_ffprobe(monkeypatch, tmp_path):
+    # Stands in for ffprobe stuck on a damaged file: it never answers.
+    path = tmp_path / 'ffprobe'
+    path.write_text('#!/bin/sh\nexec sleep 60\n')
+    path.chmod(0o755)
+    monkeypatch.setattr(probe, 'ffprobe_path', str(path))
+    return str(path)
+
+
+@pytest.fixture
+def engine():
+    engine = Engine(1)
+    yield engine
+    engine.shutdown(cancel=True)
+
+
+def test_cancel_kills_hung_probe(hung_ffprobe, engine):
+    job = engine.submit(probe.run_ffprobe, 'episode.mkv')
+    time.sleep(0.5)
+    start = time.monotonic()
+    job.cancel()
+    with pytest.raises(JobCancelled):
+        job.result(10)
+    assert time.monotonic() - start < 5
+
+
+def test_hung_probe_times_out(monkeypatch, hung_ffprobe, engine):
+    monkeypatch.setitem(probe.stage_timeouts, 'probe', 0.5)
+    job = engine.submit(probe.run_ffprobe, 'episode.mkv')
+    with pytest.raises(subprocess.TimeoutExpired):
+        job.result(10)
+
+
+def test_probe_is_traced_in_its_stage(monkeypatch, tmp_path, engine):
+    path = tmp_path / 'ffprobe'
+    path.write_text('#!/bin/sh\necho \'{"streams": [], "format": {"format_name": "matroska,webm"}}\'\n')
+    path.chmod(0o755)
+    monkeypatch.setattr(probe, 'ffprobe_path', str(path))
+    trace = instrumentation.Trace('episode.mkv')
+
+    def run():
+        instrumentation._local.trace = trace
+        try:
+            with instrumentation.stage('probe'):
+                return probe.run_ffprobe('episode.mkv')
+        finally:
+            instrumentation._local.trace = None
+
+    assert engine.submit(run).result(10)['format']['format_name'] == 'matroska,webm'
+    processes = trace.report()['processes']
+    assert [(process['name'], process['stage'], process['return_code']) for process in processes] == \
+        [('ffprobe', 'probe', 0)]
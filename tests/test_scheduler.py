@@ -0,0 +1,25 @@
+import os
+import sys
+import glob
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scheduler import get_fixed_path, create_update_path, get_update_pattern
+
+
+def test_fixed_path_keeps_directory_and_extension():
+    assert get_fixed_path('/media/show.mkv/Episode.MKV') == '/media/show.mkv/Episode_fixed.MKV'
+    assert get_fixed_path('/media/.tag.episode.mkv') == '/media/.tag.episode_fixed.mkv'
+
+
+def test_update_paths_are_unique_and_never_the_output(tmp_path):
+    directory = tmp_path / 'show.mkv [1080p]'
+    directory.mkdir()
+    output_file = str(directory / 'Episode 01.MKV')
+    with open(output_file, 'wb') as output:
+        output.write(b'done')
+    paths = {create_update_path(output_file) for _ in range(3)}
+    assert len(paths) == 3 and output_file not in paths
+    assert all(os.path.dirname(path) == str(directory) and path.endswith('.updated.MKV') for path in paths)
+    assert set(glob.glob(get_update_pattern(output_file))) == paths
+    assert glob.glob(get_update_pattern(str(directory / 'Episode 02.MKV'))) == []
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.watch import StabilityTracker
+
+
+def test_old_file_waits_for_an_unchanged_observation(tmp_path):
+    path = str(tmp_path / 'episode.mkv')
+    with open(path, 'wb') as episode:
+        episode.write(b'part')
+    os.utime(path, (1000, 1000))
+    tracker = StabilityTracker(10)
+    assert tracker.check(path, 100.0) == 10
+    assert tracker.check(path, 105.0) == 5
+    assert tracker.check(path, 110.0) == 0
+
+
+def test_change_restarts_the_interval(tmp_path):
+    path = str(tmp_path / 'episode.mkv')
+    with open(path, 'wb') as episode:
+        episode.write(b'part')
+    os.utime(path, (1000, 1000))
+    tracker = StabilityTracker(10)
+    tracker.check(path, 100.0)
+    with open(path, 'ab') as episode:
+        episode.write(b'more')
+    os.utime(path, (1000, 1000))
+    assert tracker.check(path, 109.0) == 10
+    assert tracker.check(path, 119.0) == 0
+
+
+def test_missing_file_is_forgotten(tmp_path):
+    path = str(tmp_path / 'episode.mkv')
+    tracker = StabilityTracker(10)
+    assert tracker.check(path, 100.0) is None
+    with open(path, 'wb') as episode:
+        episode.write(b'part')
+    assert tracker.check(path, 200.0) == 10